@@ -1,6 +1,7 @@
-from .core.Backtest import BackTesting
+from .core.Backtest import BackTesting, BackTestingArray
 import pandas as pd
 import numpy as np
+from typing import List
 
 class BasicBackTest(BackTesting):
     buy_cols = ['date','px_last'] 
@@ -9,51 +10,110 @@ class BasicBackTest(BackTesting):
         hdf = self.get_px_last(hdf)
         return hdf
     
-    def _print_result(self, date, rebal, trans_cost, hdf, bdf, sdf, ldf=pd.DataFrame([])):
-        pre_date = sorted(self.data.keys())[-1]
-        cash = self.data[pre_date]['cash']
-        hold_count = len(hdf)
-        buy_count = len(bdf)
-        sell_count = len(sdf)
-        value, value_p, _index_return = self._get_model_return(date, cash)
-
-        _index_return = (self.stock_index.get(date, 0)/self.base_index)*100
-        rebal = 'rebal' if rebal else '-----'
-        
-        action_count = self.df[self.df['date']==date].groupby(['action']).count()['date']
-        sell_call = action_count.get('sell', 0)
-        buy_call = action_count.get('buy', 0)
-        if not ldf.empty:
-            leftover_count = len(ldf)
-            leftover_count = ' ({})'.format(leftover_count)
+    def _print_result(self, record):
+        cash, value = record['cash'], record['nav']
+        rebal = 'rebal' if record['rebal'] else '-----'
+        if record['leftover_count']:
+            leftover_count = ' ({})'.format(record['leftover_count'])
         else:
             leftover_count=''
             
-        return[date, #datetime.now().strftime('%D %X'),
-                  '| KLCI {:.2f} vs Model \x1b[31m{:.2f}\x1b[0m'.format(_index_return, value_p),
-                  '| sell call {}, buy call {}'.format(sell_call, buy_call),
-                  '| <{} \x1b[32m{}\x1b[0m> h,b,s: {}, {}, {}{}'.format(self.stock_count.get(date, 0), self.pdf.shape[0], hold_count, buy_count, sell_count, leftover_count),
+        return[record['date'], #datetime.now().strftime('%D %X'),
+                  '| KLCI {:.2f} vs Model \x1b[31m{:.2f}\x1b[0m'.format(record['index_return'], record['value_p']),
+                  '| sell call {}, buy call {}'.format(record['sell_call'], record['buy_call']),
+                  '| <{} \x1b[32m{}\x1b[0m> h,b,s: {}, {}, {}{}'.format(record['stock_count'], record['portfolio_count'], record['hold_count'], record['buy_count'], record['sell_count'], leftover_count),
                   '| cash \x1b[35m{:.2f}%\x1b[0m {:,.2f}'.format(cash/value*100, cash), 
                   '| nav {:,.2f}'.format(value),
                   '| {} '.format(rebal),
-                  '| trans_fee {:.2f}'.format(trans_cost)
+                  '| trans_fee {:.2f}'.format(record['trans_cost'])
               ]
     
     
 class BasicBackTestNoPrint(BasicBackTest):
-    def backtest(self):
-        for k, date in enumerate(self.trading_date): 
-            pdf, cash = self.pdf, self.cash
-            self.df_day = self.df[(self.df['date']==date)].copy().set_index('id') ###!!!
-            hbsdfs = self.hold_buy_sell_df(k, self.df_day, pdf) ###!!!
-            
-            pdf, cash, trans_cost, rebal = self.run(k, date, pdf, cash, *hbsdfs)
+    verbose = False
+
 
-            #MTM pdf
-            pdf = self.get_px_last(pdf)      
-            pdf['value'] = pdf['unit']*pdf['px_last']
+class BasicBackTestArray(BackTestingArray, BasicBackTest):
+    '''
+    BasicBackTest on the array portfolio engine
+    '''
 
-            self.pdf, self.cash = pdf, cash
-            self.update(date, trans_cost)
-            self.res = self._print_result(date, rebal, trans_cost, *hbsdfs) 
-#             print(*self.res)
+
+class BasicBackTestVector:
+    '''
+    Fast screening counterpart of BasicBackTest.
+    
+    No cash, leftover or rebalance bookkeeping: holdings are the IDs with signal 1 at
+    each close, weighted equally (or by cap_col) and reset to target weights every day.
+    
+    price matrix P (dates x IDs), weight matrix W (dates x IDs)
+    daily return  r_t = sum_i W[t-1, i] * (P[t, i] / P[t-1, i] - 1)
+    turnover      u_t = sum_i |W[t, i] - W[t-1, i]|
+    nav           nav_t = nav_t-1 * (1 + r_t) * (1 - u_t * trans_p)
+    
+    Use it to rank rule variants, then confirm the shortlist with BasicBackTest.
+    '''
+    def __init__(self, 
+                 action_df: pd.DataFrame, 
+                 stock_index_df: pd.DataFrame,
+                 trading_dates: List[str],
+                 initial_capital=10*10**6,
+                 cash_reserve_ratio=0.00,
+                 transaction_charge_pct=0.25/100,
+                 stock_cap_ratio=0.10,
+                 weighting='equal',
+                 cap_col='mkt_cap',
+                ):
+        self.df = action_df
+        self.stock_index_df = stock_index_df.copy()
+        self.trading_date = trading_dates.copy()
+        self.initial_capital = initial_capital
+        self.cash_reserve_ratio = cash_reserve_ratio
+        self.trans_p = transaction_charge_pct
+        self.stock_cap_ratio = stock_cap_ratio
+        self.weighting = weighting
+        self.cap_col = cap_col
+        self.ids = pd.Index(np.sort(action_df['id'].unique()), dtype=object)
+        
+    def get_matrix(self, col):
+        dates = pd.DatetimeIndex(pd.to_datetime(self.trading_date))
+        df = self.df[self.df['date'].isin(dates)]
+        rows = dates.get_indexer(df['date'])
+        cols = self.ids.get_indexer(df['id'])
+        matrix = np.full((len(dates), len(self.ids)), np.nan)
+        matrix[rows, cols] = df[col].to_numpy(dtype=float)
+        return matrix
+        
+    def get_weights(self, signal):
+        held = signal == 1
+        if self.weighting == 'equal':
+            weights = held.astype(float)
+        elif self.weighting == 'cap':
+            weights = np.where(held, np.nan_to_num(self.get_matrix(self.cap_col)), 0)
+        else:
+            raise ValueError("weighting must be 'equal' or 'cap'")
+        total = weights.sum(axis=1, keepdims=True)
+        weights = np.divide(weights, total, out=np.zeros_like(weights), where=total>0)
+        return np.minimum(weights*(1-self.cash_reserve_ratio), self.stock_cap_ratio)
+        
+    def backtest(self):
+        px = pd.DataFrame(self.get_matrix('px_last')).ffill().to_numpy()
+        weights = self.get_weights(self.get_matrix('signal'))
+        
+        stock_ret = np.nan_to_num(px[1:] / px[:-1] - 1)
+        ret = np.r_[0, np.einsum('ij,ij->i', weights[:-1], stock_ret)]
+        turnover = np.abs(np.diff(weights, axis=0, prepend=0)).sum(axis=1)
+        trans_cost_p = turnover * self.trans_p
+        nav = self.initial_capital * np.cumprod((1 + ret) * (1 - trans_cost_p))
+        
+        self.weights = pd.DataFrame(weights, index=self.trading_date, columns=self.ids)
+        self.result = pd.DataFrame({'date': self.trading_date,
+                                    'value': nav,
+                                    'return': ret,
+                                    'turnover': turnover,
+                                    'trans_cost': nav / (1 - trans_cost_p) * trans_cost_p,
+                                    'no_of_stocks': (weights > 0).sum(axis=1)})
+        return self.result
+    
+    def get_summary(self):
+        return self.result
@@ -16,7 +16,7 @@ class ESG_rule(ApplyRule):
         buy_roe = df['ROE']>=self.roe_score if self.roe_score else True
         buy_roic = df['ROIC']>=self.roic_score if self.roic_score else True
         buy = buy_esg & buy_roe & buy_roic
-        df['buy_signal'] = buy.map(lambda x: 1 if x else None)
+        df['buy_signal'] = self.to_signal(buy, 1)
         return df
     
     def sell_rule(self, df): 
@@ -24,7 +24,7 @@ class ESG_rule(ApplyRule):
         sell_roe = df['ROE']<self.roe_score if self.roe_score else False
         sell_roic = df['ROIC']<self.roic_score if self.roic_score else False
         sell = sell_esg | sell_roe | sell_roic
-        df['sell_signal'] = sell.map(lambda x: -1 if x else None)
+        df['sell_signal'] = self.to_signal(sell, -1)
         return df
     
     @ApplyRule.get_action
@@ -12,12 +12,12 @@ class OneFactor_rule(ApplyRule):
         
     def buy_rule(self, df):
         buy = df[self.col] > self.b_score
-        df['buy_signal'] = buy.map(lambda x: 1 if x else None)
+        df['buy_signal'] = self.to_signal(buy, 1)
         return df
     
     def sell_rule(self, df): 
         sell = df[self.col] < self.s_score
-        df['sell_signal'] = sell.map(lambda x: -1 if x else None)
+        df['sell_signal'] = self.to_signal(sell, -1)
         return df
     
     @ApplyRule.get_action
@@ -35,12 +35,12 @@ class LR_rule(ApplyRule):
         
     def buy_rule(self, df):
         buy = df['pred'] > self.b_score
-        df['buy_signal'] = buy.map(lambda x: 1 if x else None)
+        df['buy_signal'] = self.to_signal(buy, 1)
         return df
     
     def sell_rule(self, df): 
         sell = df['pred'] < self.s_score
-        df['sell_signal'] = sell.map(lambda x: -1 if x else None)
+        df['sell_signal'] = self.to_signal(sell, -1)
         return df
     
     @ApplyRule.get_action
@@ -1,4 +1,4 @@
-from .core.Backtest import BackTesting, BackTestingLeftover
+from .core.Backtest import BackTesting, BackTestingLeftover, BackTestingArray, BackTestingCalendar
 import pandas as pd
 import numpy as np
 
@@ -9,36 +9,24 @@ class StyleBackTest(BackTesting):
         hdf = self.get_px_last(hdf)
         return hdf
     
-    def _print_result(self, date, rebal, trans_cost, hdf, bdf, sdf, ldf=pd.DataFrame([])):
-        pre_date = sorted(self.data.keys())[-1]
-        cash = self.data[pre_date]['cash']
-        hold_count = len(hdf)
-        buy_count = len(bdf)
-        sell_count = len(sdf)
-        value, value_p, _index_return = self._get_model_return(date, cash)
-
-        _index_return = (self.stock_index.get(date, 0)/self.base_index)*100
-        rebal = 'rebal' if rebal else '-----'
-        
-        action_count = self.df[self.df['date']==date].groupby(['action']).count()['date']
-        sell_call = action_count.get('sell', 0)
-        buy_call = action_count.get('buy', 0)
-        if not ldf.empty:
-            leftover_count = len(ldf)
-            leftover_count = ' ({})'.format(leftover_count)
+    def _print_result(self, record):
+        cash, value = record['cash'], record['nav']
+        rebal = 'rebal' if record['rebal'] else '-----'
+        if record['leftover_count']:
+            leftover_count = ' ({})'.format(record['leftover_count'])
         else:
             leftover_count=''
             
-        if sell_call + buy_call + len(ldf) == 0: return []
+        if record['sell_call'] + record['buy_call'] + record['leftover_count'] == 0: return []
             
-        return[date, #datetime.now().strftime('%D %X'),
-                  '| FBM100 {:.2f} vs Model \x1b[31m{:.2f}\x1b[0m'.format(_index_return, value_p),
-                  '| sell call {}, buy call {}'.format(sell_call, buy_call),
-                  '| <{} \x1b[32m{}\x1b[0m> h,b,s: {}, {}, {}{}'.format(self.stock_count.get(date, 0), self.pdf.shape[0], hold_count, buy_count, sell_count, leftover_count),
+        return[record['date'], #datetime.now().strftime('%D %X'),
+                  '| FBM100 {:.2f} vs Model \x1b[31m{:.2f}\x1b[0m'.format(record['index_return'], record['value_p']),
+                  '| sell call {}, buy call {}'.format(record['sell_call'], record['buy_call']),
+                  '| <{} \x1b[32m{}\x1b[0m> h,b,s: {}, {}, {}{}'.format(record['stock_count'], record['portfolio_count'], record['hold_count'], record['buy_count'], record['sell_count'], leftover_count),
                   '| cash \x1b[35m{:.2f}%\x1b[0m {:,.2f}'.format(cash/value*100, cash), 
                   '| nav {:,.2f}'.format(value),
                   '| {} '.format(rebal),
-                  '| trans_fee {:.2f}'.format(trans_cost)
+                  '| trans_fee {:.2f}'.format(record['trans_cost'])
               ]
     
     def run(self, k, date, pdf, cash, hdf, bdf, sdf):
@@ -46,9 +34,7 @@ class StyleBackTest(BackTesting):
         rebalance on every buy call
         '''
         if k>=2:
-            t = sorted(self.data.keys())
-            t1, t2 = t[-1], t[-2]
-            trans_cost = self.get_trans_cost(t1, t2) 
+            trans_cost = self.get_trans_cost(self.last_date)
         else:
             trans_cost = 0
 
@@ -71,22 +57,17 @@ class StyleBackTest(BackTesting):
                                         
         return pdf, cash, trans_cost, rebal
     
-    def backtest(self):
-        for k, date in enumerate(self.trading_date): 
-            pdf, cash = self.pdf, self.cash
-            self.df_day = self.df[(self.df['date']==date)].copy().set_index('id') ###!!!
-            hbsdfs = self.hold_buy_sell_df(k, self.df_day, pdf) ###!!!
-            
-            pdf, cash, trans_cost, rebal = self.run(k, date, pdf, cash, *hbsdfs)
-
-            #MTM pdf
-            pdf = self.get_px_last(pdf)      
-            pdf['value'] = pdf['unit']*pdf['px_last']
-
-            self.pdf, self.cash = pdf, cash
-            self.update(date, trans_cost)
-            self.res = self._print_result(date, rebal, trans_cost, *hbsdfs) 
-            if self.res: print(*self.res)
+class StyleBackTestArray(BackTestingArray, StyleBackTest):
+    '''
+    StyleBackTest on the array portfolio engine
+    '''
+    
+class StyleBackTestCalendar(BackTestingCalendar, StyleBackTest):
+    '''
+    StyleBackTest that only runs the order logic on days with calls (or on rebalance_dates)
+    
+    >>> bt = StyleBackTestCalendar(action_df, stock_index_df, trading_dates, rebalance_dates=month_starts)
+    '''
     
 class StyleBackTestLeftover(BackTestingLeftover, StyleBackTest):
     cap_col = 'volume'
@@ -100,23 +81,17 @@ class StyleBackTestLeftover(BackTestingLeftover, StyleBackTest):
         '''
         contains volume
         '''
-        hdf = self.get_vol(hdf)
-        hdf = self.get_px_last(hdf)
-        return hdf
+        return self.get_market(hdf, ['volume', 'px_last'])
     
     def get_vol(self, df): 
-        df = df.drop('volume',1, errors='ignore')
-        df = df.merge(self.df_day[['volume']], left_index=True, right_index=True)
-        return df
+        return self.get_market(df, ['volume'])
     
     def run(self, k, date, pdf, cash, hdf, bdf, sdf, ldf):
         '''
         rebalance on every buy call
         '''
         if k>=2:
-            t = sorted(self.data.keys())
-            t1, t2 = t[-1], t[-2]
-            trans_cost = self.get_trans_cost(t1, t2) 
+            trans_cost = self.get_trans_cost(self.last_date)
         else:
             trans_cost = 0
 
@@ -141,23 +116,16 @@ class StyleBackTestLeftover(BackTestingLeftover, StyleBackTest):
                 bdf, ldf = self.get_buy_value(invest_value, bdf, ldf) #update new bdf containing leftovers and new reduced ldf
                 pdf, cash = self.buy(pdf, bdf, cash) 
                 
-        self.leftover_df[date.date().isoformat()] = ldf[self.ldf_columns]
+        self.set_leftovers(date.date().isoformat(), ldf)
         return pdf, cash, trans_cost, rebal
     
 class StyleBackTestNoPrint(StyleBackTestLeftover):
+    '''
+    Silent StyleBackTestLeftover, only the last day is printed
+    '''
+    verbose = False
+    
     def backtest(self):
-        for k, date in enumerate(self.trading_date): 
-            pdf, cash = self.pdf, self.cash
-            self.df_day = self.df[(self.df['date']==date)].copy().set_index('id') ###!!!
-            hbsdfs = self.hold_buy_sell_df(k, self.df_day, pdf) ###!!!
-            
-            pdf, cash, trans_cost, rebal = self.run(k, date, pdf, cash, *hbsdfs)
-
-            #MTM pdf
-            pdf = self.get_px_last(pdf)      
-            pdf['value'] = pdf['unit']*pdf['px_last']
-
-            self.pdf, self.cash = pdf, cash
-            self.update(date, trans_cost)
-            self.res = self._print_result(date, rebal, trans_cost, *hbsdfs) 
-        print(*self.res)
\ No newline at end of file
+        super().backtest()
+        self.res = self._print_result(self.record)
+        if not self.quiet: print(*self.res)
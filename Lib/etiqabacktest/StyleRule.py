@@ -2,54 +2,144 @@ from .core.Feature import ApplyRule
 import pandas as pd
 import numpy as np
 
+class StylePanel:
+    '''
+    Dense ( ID x date ) view of a long style frame, in place of the ID x date cross join
+
+        row[i, j] : position in df of ( ids[i], dates[j] ), -1 if df has no such row
+
+    Signals are 2-D int8 arrays, forward filled and differenced along the date axis,
+    and only turned into a long frame at the end.
+    A grid cell holds one row, duplicated ( ID, date ) rows in df raise a ValueError:
+    drop or aggregate them before the rule (e.g. one Style per OneStyleRule).
+    '''
+    def __init__(self, df, id_col='ID', date_col='year_month'):
+        self.id_col = id_col
+        self.date_col = date_col
+        duplicated = df.duplicated([id_col, date_col])
+        if duplicated.any():
+            raise ValueError('{} duplicated ({}, {}) rows, e.g. {}'.format(
+                duplicated.sum(), id_col, date_col, df.loc[duplicated, [id_col, date_col]].head(3).to_dict('records')))
+        self.ids, i = np.unique(df[id_col].to_numpy(), return_inverse=True)
+        self.dates, j = np.unique(df[date_col].to_numpy(), return_inverse=True)
+        self.row = np.full((len(self.ids), len(self.dates)), -1, dtype=np.int32 if len(df) < 2**31 else np.int64)
+        self.row[i, j] = np.arange(len(df))
+
+    def get_values(self, df, col, fill):
+        '''
+        col of the df rows (NaN as fill) followed by fill, row[i, j] or -1 (the fill) index it
+        '''
+        return pd.concat([df[col].fillna(fill).reset_index(drop=True), pd.Series([fill])], ignore_index=True)
+
+    def apply_rule(self, rule, df, col, fill, keep_na=True):
+        '''
+        rule.buy_rule / sell_rule on the rows of df, with the missing grid cells as col = fill,
+        then get_signal and get_action along the date axis.
+        keep_na=False leaves out the rows without position or call (action na)
+
+        Returns the long frame ( ID, date_col, col, buy_signal, sell_signal, signal, action )
+        sorted by ID and date
+        '''
+        src = pd.DataFrame({col: self.get_values(df, col, fill)})
+        src = rule.sell_rule(rule.buy_rule(src))
+        signal = src['sell_signal'].fillna(src['buy_signal']).to_numpy(dtype=float)[self.row]
+
+        # get_signal: forward fill by ID, -1 before the first signal
+        has = ~np.isnan(signal)
+        last = np.maximum.accumulate(np.where(has, np.arange(signal.shape[1]), 0), axis=1)
+        signal = signal[np.arange(signal.shape[0])[:, None], last]
+        signal = np.where(np.isnan(signal), -1, signal).astype(np.int8)
+
+        signal_diff = np.empty_like(signal)
+        signal_diff[:, 0] = 2
+        signal_diff[:, 1:] = signal[:, 1:] - signal[:, :-1]
+        action = ApplyRule.get_action_code(signal, signal_diff)
+
+        i, j = np.nonzero(action != ApplyRule.actions.index('na')) if not keep_na else \
+               np.divmod(np.arange(action.size), action.shape[1])
+        row = self.row[i, j]
+        return pd.DataFrame({self.id_col: self.ids[i],
+                             self.date_col: self.dates[j],
+                             col: src[col].to_numpy()[row],
+                             'buy_signal': src['buy_signal'].to_numpy()[row],
+                             'sell_signal': src['sell_signal'].to_numpy()[row],
+                             'signal': signal[i, j].astype(float),
+                             'action': pd.Categorical.from_codes(action[i, j], categories=ApplyRule.actions)})
+
+    def to_prices(self, df, col, fill, price_df, date_col='DATE', month_col=None):
+        '''
+        col of every month set on the first price date of the next month and forward filled
+        along the price dates of the ID, fill where the grid cell is missing or before the first.
+
+        Returns price_df sorted by ID and date_col (index: row position in price_df) with
+                col       : forward filled value
+                month_col : if given, month of the grid on its rebalance dates, else NaN
+        '''
+        px = price_df.reset_index(drop=True).sort_values([self.id_col, date_col])
+        rebal = price_df.groupby(self.date_col)[date_col].min().shift(-1).dropna()
+        month = pd.Index(self.dates).get_indexer(rebal.index)
+        rebal, month = rebal[month >= 0], month[month >= 0]
+
+        i = pd.Index(self.ids).get_indexer(px[self.id_col])
+        k = pd.Index(rebal).get_indexer(px[date_col])
+        on = (i >= 0) & (k >= 0)
+        j = np.full(len(px), -1)
+        j[on] = month[k[on]]
+        src = np.full(len(px), -2)                  # no value
+        src[on] = self.row[i[on], j[on]]
+        src[src == -1] = len(df)                    # missing grid cell, fill
+
+        # forward fill along the price dates of every ID
+        ids = px[self.id_col].to_numpy()
+        n = len(px)
+        start = np.r_[True, ids[1:] != ids[:-1]] if n else np.zeros(0, dtype=bool)
+        last = np.maximum.accumulate(np.where(on | start, np.arange(n), 0))
+        src = src[last]
+
+        values = self.get_values(df, col, fill).to_numpy()
+        px[col] = pd.Series(np.where(src >= 0, values[np.maximum(src, 0)], np.nan), index=px.index).fillna(fill)
+        if month_col is not None:
+            px[month_col] = np.where(on, self.dates[np.maximum(j, 0)], np.nan)
+        return px
+
 class OneStyleRule(ApplyRule):
     
-    def __init__(self, style, factor_col='value', date_col='year_month'):
+    def __init__(self, style, factor_col='value', date_col='year_month', keep_na=True):
         self.style = style
         self.date_col = date_col
         self.col = factor_col
+        self.keep_na = keep_na
         
     def buy_rule(self, df):
-        df['buy_signal'] = df[self.col].map(lambda x: 1 if x else None)
+        df['buy_signal'] = self.to_signal(df[self.col], 1)
         return df
     
     def sell_rule(self, df): 
-        df['sell_signal'] = df[self.col].map(lambda x: -1 if not x else None)
+        df['sell_signal'] = self.to_signal(~df[self.col].astype(bool), -1)
         return df
     
-    @ApplyRule.get_action
     def run(self,df):
         df = df.query('Style == "{}"'.format(self.style))
-        df = df[['ID']].drop_duplicates().assign(key=1).merge(df[[self.date_col]].drop_duplicates().assign(key=1), on='key').drop('key',1)\
-                        .merge(df[['ID',self.date_col,self.col]], how='left').fillna(False).sort_values(['ID',self.date_col])
-        df = self.buy_rule(df)
-        df = self.sell_rule(df)
-        df = self.get_signal(df)
-        return df
+        return StylePanel(df, 'ID', self.date_col).apply_rule(self, df, self.col, False, self.keep_na)
     
 class MultiStyleRule(ApplyRule):
     
-    def __init__(self, no_of_styles=3, style_count_col='style_count', date_col='year_month'):
+    def __init__(self, no_of_styles=3, style_count_col='style_count', date_col='year_month', keep_na=True):
         self.no_of_styles = no_of_styles
         self.date_col = date_col
         self.col = style_count_col
+        self.keep_na = keep_na
         
     def buy_rule(self, df):
-        df['buy_signal'] = df[self.col].map(lambda x: 1 if x >= self.no_of_styles else None)
+        df['buy_signal'] = self.to_signal(df[self.col] >= self.no_of_styles, 1)
         return df
     
     def sell_rule(self, df): 
-        df['sell_signal'] = df[self.col].map(lambda x: -1 if x < self.no_of_styles else None)
+        df['sell_signal'] = self.to_signal(df[self.col] < self.no_of_styles, -1)
         return df
     
-    @ApplyRule.get_action
     def run(self,df):
-        df = df[['ID']].drop_duplicates().assign(key=1).merge(df[[self.date_col]].drop_duplicates().assign(key=1), on='key').drop('key',1)\
-                        .merge(df[['ID',self.date_col,self.col]], how='left').fillna(False).sort_values(['ID',self.date_col])
-        df = self.buy_rule(df)
-        df = self.sell_rule(df)
-        df = self.get_signal(df)
-        return df
+        return StylePanel(df, 'ID', self.date_col).apply_rule(self, df, self.col, False, self.keep_na)
 
 class OneStyleRule2(ApplyRule):
     
@@ -58,11 +148,11 @@ class OneStyleRule2(ApplyRule):
         self.date_col = date_col
         
     def buy_rule(self, df):
-        df['buy_signal'] = df[self.style_col].map(lambda x: 1 if x else None)
+        df['buy_signal'] = self.to_signal(df[self.style_col], 1)
         return df
     
     def sell_rule(self, df): 
-        df['sell_signal'] = df[self.style_col].map(lambda x: -1 if not x else None)
+        df['sell_signal'] = self.to_signal(~df[self.style_col].astype(bool), -1)
         return df
     
     @ApplyRule.get_action
@@ -70,17 +160,9 @@ class OneStyleRule2(ApplyRule):
         drop_cols = [ i for i in df.columns if '_zscore' in i]
         df.drop(drop_cols, 1, inplace=True)
         
-        df = df[['ID']].drop_duplicates().assign(key=1).merge(df[['year_month']].drop_duplicates().assign(key=1), on='key').drop('key',1)\
-                        .merge(df[['ID','year_month',self.style_col]], how='left').fillna(False)
-        
-        price_date_df = price_df.groupby('year_month')['DATE'].min().reset_index()
-        price_date_df['DATE'] = price_date_df['DATE'].shift(-1)
-        price_date_df.dropna(inplace=True)        
-        df = df.merge(price_date_df, on='year_month')
-        
-        df_px = df[['ID',self.date_col,self.style_col]].merge(price_df, on=['ID',self.date_col], how='right').sort_values(['ID',self.date_col])
-        ffill_cols = list(set(df.columns).difference(set(price_df.columns)))
-        df_px[ffill_cols] = df_px.groupby('ID')[ffill_cols].ffill().fillna(False)
+        df_px = StylePanel(df, 'ID', 'year_month').to_prices(df, self.style_col, False, price_df, self.date_col)
+        df_px = df_px[['ID', self.date_col, self.style_col] + 
+                      [c for c in price_df.columns if c not in ['ID', self.date_col]]]
         df_px.dropna(subset=['px_last'], inplace=True)
 
         df_px = self.buy_rule(df_px)
@@ -97,11 +179,11 @@ class MultiStyleRule2(ApplyRule):
         self.col = style_count_col
         
     def buy_rule(self, df):
-        df['buy_signal'] = df[self.col].map(lambda x: 1 if x >= self.no_of_styles else None)
+        df['buy_signal'] = self.to_signal(df[self.col] >= self.no_of_styles, 1)
         return df
     
     def sell_rule(self, df): 
-        df['sell_signal'] = df[self.col].map(lambda x: -1 if x < self.no_of_styles else None)
+        df['sell_signal'] = self.to_signal(df[self.col] < self.no_of_styles, -1)
         return df
     
     @ApplyRule.get_action
@@ -109,17 +191,9 @@ class MultiStyleRule2(ApplyRule):
         drop_cols = [ i for i in df.columns if '_zscore' in i]
         df.drop(drop_cols, 1, inplace=True)
         
-        df = df[['ID']].drop_duplicates().assign(key=1).merge(df[['year_month']].drop_duplicates().assign(key=1), on='key').drop('key',1)\
-                        .merge(df[['ID','year_month',self.col]], how='left').fillna(0)
-        
-        price_date_df = price_df.groupby('year_month')['DATE'].min().reset_index()
-        price_date_df['DATE'] = price_date_df['DATE'].shift(-1)
-        price_date_df.dropna(inplace=True)        
-        df = df.merge(price_date_df, on='year_month')
-        
-        df_px = df.merge(price_df.drop('year_month',1), 
-                         how='right', on=['ID','DATE']).sort_values(['ID','DATE'])
-        df_px[self.col] = df_px.groupby('ID')[self.col].ffill().fillna(0)
+        df_px = StylePanel(df, 'ID', 'year_month').to_prices(df, self.col, 0, price_df, 'DATE', 'year_month')
+        df_px = df_px[['ID', 'year_month', self.col, 'DATE'] + 
+                      [c for c in price_df.columns if c not in ['ID', 'DATE', 'year_month']]]
         
         df_px = self.buy_rule(df_px)
         df_px = self.sell_rule(df_px)
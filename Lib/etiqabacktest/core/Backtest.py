@@ -1,9 +1,15 @@
 from datetime import datetime
 from functools import wraps
+from itertools import islice
 import pandas as pd
 import numpy as np
 import math
+import pickle
 from typing import List
+from .Portfolio import ArrayPortfolio, OrderSet, OrderBook
+from .History import BacktestHistory
+from .Events import PhaseTimer
+from .Market import MarketData
 
 class BackTestingUtility():
     
@@ -49,38 +55,75 @@ class BackTestingUtility():
             return x#(x-1)//5*5+5
     
     @staticmethod
-    def buy(pdf, bdf, cash):
-        for ID, v in bdf.iterrows():
-            current_price = v['px_last']
-            date = v['date']
-            buy_value = v['buy_value']
-            buy_unit = buy_value // current_price
-            cash = cash - buy_value
-            pdf.loc[ID] = [
-                           buy_unit, 
-                           date,
-                           current_price,
-                           buy_value,
-                          ]
-        return pdf, cash
+    def capped(value, cap):
+        '''
+        Element-wise min(value, cap), NaN handled as the builtin min() does
+        '''
+        value, cap = np.asarray(value, dtype=float), np.asarray(cap, dtype=float)
+        return np.where(cap < value, cap, value)
     
     @staticmethod
-    def sell(pdf, sdf, cash, **kwargs): 
+    def fill_orders(pdf, bdf, cash, accumulate=False):
+        '''
+        Fill a whole order set at once
+        
+        pdf : portfolio ( ID | unit, date, px_last, value )
+        bdf : orders ( ID | date, px_last, buy_value )
+        accumulate : add units and value to an existing position instead of replacing it
+        
+        Same result as writing `pdf.loc[ID] = [...]` order by order: new IDs are appended
+        in order, a repeated ID keeps the last date and price, cash is debited per order.
+        '''
+        if bdf.shape[0] == 0:
+            return pdf, cash
+        
+        buy_value = bdf['buy_value'].to_numpy(dtype=float)
+        px_last = bdf['px_last'].to_numpy(dtype=float)
+        buy_unit = buy_value // px_last
+        
+        n = pdf.shape[0]
+        pdf = pdf.reindex(pdf.index.append(bdf.index[~bdf.index.isin(pdf.index)].unique()))
+        pos = pdf.index.get_indexer(bdf.index)
+        
+        unit = pdf['unit'].to_numpy(dtype=float, copy=True)
+        value = pdf['value'].to_numpy(dtype=float, copy=True)
+        if accumulate:
+            unit[n:], value[n:] = 0, 0
+            np.add.at(unit, pos, buy_unit)
+            np.add.at(value, pos, buy_value)
+        else:
+            unit[pos], value[pos] = buy_unit, buy_value
+            
+        date = pdf['date'].to_numpy(dtype=object, copy=True)
+        date[pos] = bdf['date'].to_numpy(dtype=object)
+        px = pdf['px_last'].to_numpy(dtype=float, copy=True)
+        px[pos] = px_last
+        
+        pdf['unit'], pdf['date'], pdf['px_last'], pdf['value'] = unit, pd.to_datetime(date), px, value
+        # subtract.reduce is a left fold, same rounding as cash - v1 - v2 - ...
+        return pdf, np.subtract.reduce(np.r_[cash, buy_value])
+    
+    def buy(self, pdf, bdf, cash):
+        if bdf.shape[0]:
+            px_last = np.asarray(bdf['px_last'], dtype=float)
+            self.book_fills(bdf.index, np.asarray(bdf['buy_value'], dtype=float) // px_last, px_last)
+        return BackTestingUtility.fill_orders(pdf, bdf, cash)
+    
+    def sell(self, pdf, sdf, cash, **kwargs): 
         if sdf.shape[0]==0:
             return pdf, cash
         
-        pdf.drop([i for i in sdf.index.tolist() if i in pdf.index], inplace=True)
+        pdf.drop(sdf.index, errors='ignore', inplace=True)
         sdf['value'] = sdf['unit'] * sdf['px_last']
+        self.book_fills(sdf.index, -sdf['unit'].to_numpy(dtype=float), sdf['px_last'].to_numpy(dtype=float))
         return pdf, cash + sdf['value'].sum()
     
     def update_latest(self, hdf):
-        hdf = self.get_avg_5_val(hdf)
-        hdf = self.get_px_last(hdf)
-        return hdf
+        return self.get_market(hdf, ['avg_5_value', 'px_last'])
     
     def rebalance(self, hdf, bdf, cash): 
         
-        hdf = self.update_latest(hdf)
+        hdf = self.drop_unpriced(hdf, self.update_latest(hdf))
 
         if  hdf.shape[0] + bdf.shape[0] == 0: 
             return hdf, cash, False
@@ -93,27 +136,104 @@ class BackTestingUtility():
             pdf, cash = self.buy(pdf, hbdf, cash)
             return pdf, cash, True
         
-    def get_px_last(self, df):
-        df = df.drop('px_last', 1, errors='ignore')
-        df = df.merge(self.df_day[['px_last']], left_index=True, right_index=True)
+    def get_market(self, df, cols):
+        '''
+        df ( ID | ... ) with today's cols from the market matrices, cols are moved to the end.
+        Rows of IDs without a row today (suspended, delisted) are dropped.
+        '''
+        mask, values = self.market.lookup(self.day, df.index, cols)
+        df = df.drop(cols, axis=1, errors='ignore').iloc[np.flatnonzero(mask)]
+        for c in cols:
+            df[c] = values[c]
         return df
     
+    def get_px_last(self, df):
+        return self.get_market(df, ['px_last'])
+    
     def get_avg_5_val(self, df): 
-        df = df.drop('avg_5_value', 1, errors='ignore')
-        df = df.merge(self.df_day[['avg_5_value']],left_index=True, right_index=True)
-        return df
+        return self.get_market(df, ['avg_5_value'])
     
-    def get_trans_cost(self, t1, t2):
-        t1pdf = self.data[t1]['portfolio']
-        t2pdf = self.data[t2]['portfolio']
-
-        tpdf = t1pdf.merge(t2pdf, left_index=True, right_index=True, how='outer')
-
-        tpdf['unit'] = (tpdf['unit_x'].fillna(0) - tpdf['unit_y'].fillna(0)).abs()
-        tpdf['px_last'] = tpdf['px_last_x'].fillna(tpdf['px_last_y'])
-        tpdf['trans_cost'] = tpdf['px_last']*tpdf['unit']*self.trans_p
-        trans_cost = tpdf['trans_cost'].sum()
-        return trans_cost
+    def book_fills(self, ids, unit, px_last):
+        '''
+        Executed units (signed, sells negative) of ids at their fill price,
+        written to the trade ledger with the date at the end of the day, see record_trades
+        '''
+        self.fills.append((np.asarray(ids, dtype=object), np.asarray(unit, dtype=float), np.asarray(px_last, dtype=float)))
+    
+    def drop_unpriced(self, df, priced):
+        '''
+        priced : df at today's prices (get_px_last / update_latest).
+        Positions of df it dropped for having no row today (suspended, delisted)
+        leave the portfolio without a trade, they are booked with px_last NaN.
+        '''
+        if len(priced) < len(df):
+            gone = df[~df.index.isin(priced.index)]
+            self.book_fills(gone.index, -gone['unit'].to_numpy(dtype=float), np.full(len(gone), np.nan))
+        return priced
+    
+    def record_trades(self, date):
+        '''
+        Book the day's fills in the trade ledger (buy_data / sell_data), one row per
+        execution at its fill price: a sell and a re-buy of an ID on the same day,
+        e.g. in a rebalance, are two trades.
+        
+        The cost charged on the next day (get_trans_cost) is the sum of the day's
+        trans_cost: trans_p of the net traded value of every ID, shared by its fills
+        in proportion to their value. A round trip at the same price costs nothing
+        and a dropped position (px_last NaN) has no fee.
+        '''
+        fills = self.fills + [(np.array([], dtype=object), np.array([]), np.array([]))]
+        ids, unit, px_last = (np.concatenate(x) for x in zip(*fills))
+        self.fills = []
+        
+        value = np.nan_to_num(unit*px_last)
+        code = pd.factorize(ids)[0]
+        net = np.abs(np.bincount(code, value))[code]
+        gross = np.bincount(code, np.abs(value))[code]
+        share = np.divide(net, gross, out=np.zeros(len(value)), where=gross > 0)
+        trades = pd.DataFrame({'date': date, 
+                               'ID': ids, 
+                               'unit': unit, 
+                               'px_last': px_last, 
+                               'trans_cost': np.abs(value)*share*self.trans_p})
+        self.trans_cost_data[date] = trades['trans_cost'].sum()
+        self.buy_data.append(trades[trades['unit'] > 0])
+        self.sell_data.append(trades[trades['unit'] < 0])
+    
+    def get_trans_cost(self, date):
+        '''
+        Transaction cost charged for date, the trans_cost of its ledger rows (see record_trades)
+        '''
+        return self.trans_cost_data.get(date, 0)
+    
+    def get_trades(self):
+        '''
+        Trade ledger, one row per execution at its fill price, trans_cost is its share of the fee
+        on the ID's net change of the day (see record_trades)
+        	date	    |   ID    | unit | px_last | trans_cost
+            ------------|---------|------|---------|-----------
+        0	2020-01-02	| stock 1 |  100 |   1.20  |    0.30
+        1	2020-01-03	| stock 1 | -100 |   1.25  |    0.31
+            ...
+        '''
+        trades = self.buy_data + self.sell_data
+        if not trades:
+            return pd.DataFrame([], columns=['date','ID','unit','px_last','trans_cost'])
+        return pd.concat(trades).sort_values('date', kind='mergesort').reset_index(drop=True)
+    
+    def get_summary(self):
+        return self.data.get_summary()
+    
+    def get_turnover(self):
+        '''
+        Daily traded value and turnover (traded value / nav) from the trade ledger
+        '''
+        trades = self.get_trades()
+        traded_value = (trades['unit'].abs()*trades['px_last']).groupby(trades['date']).sum()
+        nav = pd.Series({date: v['value'] for date, v in self.data.items()})
+        turnover = pd.DataFrame({'traded_value': traded_value.reindex(nav.index).fillna(0), 'nav': nav})
+        turnover['turnover'] = turnover['traded_value'] / turnover['nav']
+        return turnover.rename_axis('date').reset_index()
     
     def get_buy_value(self, pdf, bdf, cash):
         no_of_stocks = bdf.shape[0]
@@ -124,16 +244,48 @@ class BackTestingUtility():
         bdf['buy_value'] = invest_value
         return bdf
     
+    def partition_by_date(self):
+        '''
+        Sort self.df by date once (stable, so rows keep their order within a day)
+        and record the row offsets and action counts of every date.
+        '''
+        self.df = self.df.sort_values('date', kind='mergesort').reset_index(drop=True)
+        dates = pd.to_datetime(self.df['date']).to_numpy()
+        starts = np.flatnonzero(np.r_[True, dates[1:] != dates[:-1]])[:len(dates)]
+        ends = np.r_[starts[1:], len(dates)]
+        self.day_slices = {pd.Timestamp(dates[s]): (s, e) for s, e in zip(starts, ends)}
+        
+        action_count = self.df.groupby(['date','action'], observed=True).size()
+        self.day_action_count = {pd.Timestamp(d): c.droplevel(0).to_dict() 
+                                 for d, c in action_count.groupby(level=0)}
+    
+    def get_df_day(self, date):
+        '''
+        Rows of the date indexed by id, market lookups move to the date too
+        '''
+        self.day = self.market.get_day(date)
+        s, e = self.day_slices.get(pd.Timestamp(date), (0, 0))
+        return self.df.iloc[s:e].set_index('id')
+    
+    def get_action_count(self, date):
+        return self.day_action_count.get(pd.Timestamp(date), {})
+    
     def update(self, date, trans_cost):
-        self.data[date] = {}
-        self.data[date]['portfolio'] = self.pdf.copy()
-        self.data[date]['cash'] = self.cash
-        self.data[date]['value'] = self.pdf['value'].sum() + self.cash
-        self.data[date]['trans_cost'] = trans_cost
+        self.data.append(date, self.pdf, self.cash, self.pdf['value'].sum() + self.cash, trans_cost)
+        self.record_trades(date)
+        self.last_date = date
     
 class BackTesting(BackTestingUtility):
     
     buy_cols = ['date','avg_5_value','px_last']
+    verbose = True   # print every day record
+    timing = False   # per-phase timings in the day records, see PhaseTimer
+    market_cols = ['px_last', 'avg_5_value', 'volume']   # ( date x ID ) matrices, see MarketData
+    ### Rebuilt from the inputs on resume, not part of a checkpoint ###
+    input_attrs = ['df', 'day_slices', 'day_action_count', 'df_day', 'stock_index_df', 'stock_index', 
+                   'stock_count', 'is_bull', 'is_bear', 'trading_date', 'first_day', 'start', 'market', 'day',
+                   'buy_day', 'sell_call',
+                   'subscribers', 'timer']
     
     def __init__(self, 
                  action_df: pd.DataFrame, 
@@ -145,11 +297,13 @@ class BackTesting(BackTestingUtility):
                  stock_cap_ratio=0.10,
                  generation=0,
                  debug=False,
+                 market=None,
                 ):
         
         '''
         action_df : DataFrame with buy and sell signal
         stock_index: DataFrame ( date | price ) for Base Index (e.g. KLCI)
+        market : MarketData of the same rows and prices to share instead of building one, see MultiBackTest
         '''
         self.df = action_df.copy()
         self.initial_capital = initial_capital
@@ -164,14 +318,169 @@ class BackTesting(BackTestingUtility):
         self.generation = generation
         self.debug = debug
         ### Record Daily Portfolio with cash, value (invested money)  ###
-        self.data = {}
+        self.data = BacktestHistory()
         self.leftover_df = {}
+        self.book = OrderBook()
         self.buy_data = []
         self.sell_data = []
+        self.fills = []
+        self.trans_cost_data = {}
+        self.last_date = None
         ### Current Portfolio ###
         self.pdf = self._create_empty_pdf()
+        self.partition_by_date()
+        if market is None:
+            market = MarketData(self.df, self.day_slices, [c for c in self.market_cols if c in self.df])
+        elif not market.same_rows(self.df, self.day_slices):
+            raise ValueError('action_df rows or prices differ from the shared market data')
+        self.market = market
+        self.day = None
         
         self.stock_count = action_df[(action_df['signal']==1)].groupby('date')['action'].count()
+        self.is_bull = self.get_index_flags('is_bull')
+        self.is_bear = self.get_index_flags('is_bear')
+        ### Day records go to the subscribers, printing is one of them ###
+        self.timer = PhaseTimer(self.timing)
+        self.subscribers = [self.print_record] if self.verbose else []
+        self.record = None
+        self.quiet = False
+        ### Checkpoint, see save_checkpoint / resume ###
+        self.checkpoint_path = None
+        self.start = 0
+    
+    def get_index_flags(self, col):
+        '''
+        {date: flag} of stock_index_df, looked up once instead of every day
+        '''
+        if col not in self.stock_index_df:
+            return {}
+        return dict(zip(pd.to_datetime(self.stock_index_df['date']), self.stock_index_df[col]))
+    
+    def subscribe(self, callback):
+        '''
+        callback(record) is called at the end of every trading day, see get_record
+        '''
+        self.subscribers.append(callback)
+    
+    def mute(self):
+        '''
+        No printing at all from this instance, e.g. in threads where redirect_stdout is shared
+        '''
+        self.quiet = True
+        if self.print_record in self.subscribers:
+            self.subscribers.remove(self.print_record)
+    
+    def get_record(self, date, rebal, trans_cost, hdf, bdf, sdf, ldf=None):
+        '''
+        Structured result of the day
+        nav, cash, value_p, index_return | portfolio after the day
+        hold/buy/sell_count              | orders prepared for the day (hdf, bdf, sdf)
+        hold/buy/sell_call               | actions in action_df on the day
+        leftover_count                   | pending leftovers carried into the day
+        time_*                           | phase timings when self.timer is enabled
+        '''
+        cash = self.cash
+        value, value_p, _index_return = self._get_model_return(date, cash)
+        action_count = self.get_action_count(date)
+        record = dict(date = date, 
+                      nav = value, 
+                      cash = cash, 
+                      value_p = value_p, 
+                      index_return = _index_return,
+                      stock_count = self.stock_count.get(date, 0), 
+                      portfolio_count = self.pdf.shape[0],
+                      hold_count = len(hdf), 
+                      buy_count = len(bdf), 
+                      sell_count = len(sdf),
+                      leftover_count = 0 if ldf is None else len(ldf),
+                      hold_call = action_count.get('hold', 0), 
+                      buy_call = action_count.get('buy', 0), 
+                      sell_call = action_count.get('sell', 0),
+                      is_bull = bool(self.is_bull.get(pd.Timestamp(date), False)),
+                      is_bear = bool(self.is_bear.get(pd.Timestamp(date), False)),
+                      rebal = rebal, 
+                      trans_cost = trans_cost)
+        for phase, t in self.timer.laps.items():
+            record['time_' + phase] = t
+        return record
+    
+    def trading_days(self):
+        '''
+        (k, date) left to run, the days of a resumed checkpoint are skipped
+        '''
+        return islice(enumerate(self.trading_date), self.start, None)
+    
+    def report(self, k, date, rebal, trans_cost, *hbsdfs):
+        '''
+        End of the day.
+        Build the day record only when someone listens, the last one is always kept.
+        The checkpoint is written on the day before the last, see save_checkpoint.
+        '''
+        if self.subscribers or k+1 == len(self.trading_date):
+            self.record = self.get_record(date, rebal, trans_cost, *hbsdfs)
+            for callback in self.subscribers:
+                callback(self.record)
+        if self.checkpoint_path is not None and k+2 == len(self.trading_date):
+            self.save_checkpoint(self.checkpoint_path, k)
+    
+    def get_state(self):
+        '''
+        Engine state carried to a later run: portfolio, cash, leftovers, history,
+        trade ledger, accumulated return, settings ...
+        '''
+        return {key: v for key, v in self.__dict__.items() if key not in self.input_attrs}
+    
+    def set_state(self, state):
+        self.__dict__.update(state)
+    
+    def save_checkpoint(self, path, k):
+        '''
+        Pickle the state at the end of day k with the action_df rows after it.
+        backtest() writes it on the day before the last when self.checkpoint_path is set,
+        as the last day of a run always rebalances and has to be run again on resume.
+        '''
+        checkpoint = dict(state = self.get_state(),
+                          trading_dates = self.trading_date[:k+1],
+                          pending_dates = self.trading_date[k+1:],
+                          pending_df = self.df[self.df['date'] > pd.Timestamp(self.trading_date[k])])
+        with open(path, 'wb') as f:
+            pickle.dump(checkpoint, f)
+    
+    @classmethod
+    def resume(cls, path, action_df, stock_index_df, trading_dates):
+        '''
+        Continue a checkpointed run with only the new action_df rows and trading_dates,
+        the result is the same as a full rerun over all the dates.
+        stock_index_df must cover the new trading_dates.
+        
+        >>> bt = StyleBackTestNoPrint(action_df, stock_index_df, trading_dates)
+        >>> bt.checkpoint_path = 'style.ckpt'
+        >>> bt.backtest()
+        ### next day ###
+        >>> bt = StyleBackTestNoPrint.resume('style.ckpt', new_action_df, stock_index_df, new_trading_dates)
+        >>> bt.backtest()  # writes style.ckpt again
+        '''
+        with open(path, 'rb') as f:
+            checkpoint = pickle.load(f)
+        
+        done = checkpoint['trading_dates']
+        last = pd.Timestamp(done[-1])
+        new = {pd.Timestamp(d): d for d in checkpoint['pending_dates']}
+        new.update({pd.Timestamp(d): d for d in trading_dates if pd.Timestamp(d) > last})
+        trading_dates = done + [new[d] for d in sorted(new)]
+        
+        # rows of the replayed days come first, as in the original action_df
+        action_df = pd.concat([checkpoint['pending_df'], action_df[action_df['date'] > last]])
+        action_df = action_df.drop_duplicates(['id', 'date'], keep='first').reset_index(drop=True)
+        
+        bt = cls(action_df, stock_index_df, trading_dates)
+        bt.set_state(checkpoint['state'])
+        bt.start = len(done)
+        return bt
+    
+    def print_record(self, record):
+        self.res = self._print_result(record)
+        if self.res: print(*self.res)
     
     def _get_model_return(self, date, cash):
         value = self.pdf['value'].sum()+ cash
@@ -179,24 +488,14 @@ class BackTesting(BackTestingUtility):
         _index_return = (self.stock_index.get(date, 0)/self.base_index)*100
         return value, value_p, _index_return
     
-    def _print_result(self, date, rebal, trans_cost, hdf, bdf, sdf, *args, **kwargs):
-        pre_date = sorted(self.data.keys())[-1]
-        cash = self.data[pre_date]['cash']
-        hold_count = len(hdf)
-        buy_count = len(bdf)
-        sell_count = len(sdf)
-
-        value, value_p, _index_return = self._get_model_return(date, cash)
-        action_count = self.df[self.df['date']==date].groupby(['action']).count()['date']
-        hold_count = action_count.get('hold', 0)
-        sell_count = action_count.get('sell', 0)
-        buy_count = action_count.get('buy', 0)
-        is_bull = 'bull' if self.stock_index_df.set_index('date')['is_bull'].get(date, False) else '----'
-        is_bear = 'bear' if self.stock_index_df.set_index('date')['is_bear'].get(date, False) else '----'
-        rebal = 'rebal' if rebal else '-----'
-        return [datetime.now().strftime('%D %X'),date, 
-                  '| KLCI {:.2f} vs Rodent \x1b[31m{:.2f}\x1b[0m'.format(_index_return, value_p),
-                  '| <{} \x1b[32m{}\x1b[0m> {}, {}, {}'.format(self.stock_count.get(date, 0), self.pdf.shape[0], hold_count, buy_count, sell_count),
+    def _print_result(self, record):
+        cash, value = record['cash'], record['nav']
+        is_bull = 'bull' if record['is_bull'] else '----'
+        is_bear = 'bear' if record['is_bear'] else '----'
+        rebal = 'rebal' if record['rebal'] else '-----'
+        return [datetime.now().strftime('%D %X'), record['date'], 
+                  '| KLCI {:.2f} vs Rodent \x1b[31m{:.2f}\x1b[0m'.format(record['index_return'], record['value_p']),
+                  '| <{} \x1b[32m{}\x1b[0m> {}, {}, {}'.format(record['stock_count'], record['portfolio_count'], record['hold_call'], record['buy_call'], record['sell_call']),
                   '| cash \x1b[35m{:.2f}%\x1b[0m {:,.2f}'.format(cash/value*100, cash), 
                   '| nav {:,.2f}'.format(value),
                   '| {} {} {}'.format(is_bull, is_bear, rebal),
@@ -221,9 +520,7 @@ class BackTesting(BackTestingUtility):
     
     def run(self, k, date, pdf, cash, hdf, bdf, sdf, *args):
         if k>=2:
-            t = sorted(self.data.keys())
-            t1, t2 = t[-1], t[-2]
-            trans_cost = self.get_trans_cost(t1, t2) 
+            trans_cost = self.get_trans_cost(self.last_date)
         else:
             trans_cost = 0
 
@@ -251,26 +548,37 @@ class BackTesting(BackTestingUtility):
                                         
         return pdf, cash, trans_cost, rebal
     
+    def begin(self):
+        '''
+        Set up before the first day of backtest
+        '''
+    
     def backtest(self):
-        for k, date in enumerate(self.trading_date): 
-            pdf, cash = self.pdf, self.cash
-            self.df_day = self.df[(self.df['date']==date)].copy().set_index('id') ###!!!
-            hbsdfs = self.hold_buy_sell_df(k, self.df_day, pdf) ###!!!
-            
-            pdf, cash, trans_cost, rebal = self.run(k, date, pdf, cash, *hbsdfs)
-            
-            #MTM pdf
-            pdf = self.get_px_last(pdf)      
-            pdf['value'] = pdf['unit']*pdf['px_last']
-            
-            self.pdf, self.cash = pdf, cash
-            self.update(date, trans_cost)
-            self.res = self._print_result(date, rebal, trans_cost, *hbsdfs) 
-            print(*self.res)
+        self.begin()
+        for k, date in self.trading_days(): 
+            self.run_day(k, date)
+    
+    def run_day(self, k, date):
+        self.timer.start()
+        pdf, cash = self.pdf, self.cash
+        self.df_day = self.get_df_day(date)
+        hbsdfs = self.hold_buy_sell_df(k, self.df_day, pdf) ###!!!
+        self.timer.lap('prepare')
+        
+        pdf, cash, trans_cost, rebal = self.run(k, date, pdf, cash, *hbsdfs)
+        self.timer.lap('execute')
+        
+        #MTM pdf
+        pdf = self.drop_unpriced(pdf, self.get_px_last(pdf))
+        pdf['value'] = pdf['unit']*pdf['px_last']
+        self.timer.lap('mtm')
+        
+        self.pdf, self.cash = pdf, cash
+        self.update(date, trans_cost)
+        self.timer.lap('bookkeeping')
+        self.report(k, date, rebal, trans_cost, *hbsdfs)
             
 class BackTestingReset:
-#     accum_return = 0
-    accum_return = 1
     
     def _get_model_return(self, date, cash):
         value = self.pdf['value'].sum() + cash
@@ -279,45 +587,55 @@ class BackTestingReset:
         _index_return = (self.stock_index.get(date, 0)/self.base_index)*100
         return value, value_p, _index_return
     
-    def backtest(self):
+    def begin(self):
+        if self.start == 0:
+#             self.accum_return = 0
+            self.accum_return = 1
         trading_dates = [datetime.strptime(x, '%Y-%m-%d') for x in self.trading_date]
         self.first_day = [i.date().isoformat() for i in pd.DataFrame({'date':trading_dates})\
                                                           .assign(year=pd.DataFrame({'date':trading_dates})['date'].map(lambda x: x.year))\
                                                           .groupby('year')['date'].min() 
                                                  if i.month == 1]
-            
-        for k, date in enumerate(self.trading_date): 
-            pdf, cash = self.pdf, self.cash
-            self.df_day = self.df[(self.df['date']==date)].copy().set_index('id') ###!!!
-            hbsdfs = self.hold_buy_sell_df(k, self.df_day, pdf) ###!!!
-            
-            pdf, cash, trans_cost, rebal = self.run(k, date, pdf, cash, *hbsdfs)
+    
+    def run_day(self, k, date):
+        self.timer.start()
+        pdf, cash = self.pdf, self.cash
+        self.df_day = self.get_df_day(date)
+        hbsdfs = self.hold_buy_sell_df(k, self.df_day, pdf) ###!!!
+        self.timer.lap('prepare')
+        
+        pdf, cash, trans_cost, rebal = self.run(k, date, pdf, cash, *hbsdfs)
+        self.timer.lap('execute')
 
-            pdf = self.get_px_last(pdf)
-            pdf['value'] = pdf['unit']*pdf['px_last']
-            
-            if date in self.first_day:
+        pdf = self.drop_unpriced(pdf, self.get_px_last(pdf))
+        pdf['value'] = pdf['unit']*pdf['px_last']
+        
+        if date in self.first_day:
 #                 self.accum_return = self.accum_return + round(((pdf['value'].sum()+cash)/self.initial_capital - 1) * 100, 2)
-                self.accum_return = self.accum_return * round(((pdf['value'].sum()+cash)/self.initial_capital) , 2)
+            self.accum_return = self.accum_return * round(((pdf['value'].sum()+cash)/self.initial_capital) , 2)
 
-                reset_amount = self.initial_capital * (1-self.cash_reserve_ratio)
-                if pdf['value'].sum() > reset_amount:
-                    cash_reserve = self.initial_capital * self.cash_reserve_ratio
-                    cash = cash_reserve if cash > cash_reserve else cash
-                    
-                    pdf['new_val'] = (pdf['value']/pdf['value'].sum()) * reset_amount 
-                    pdf['unit'] = (pdf['new_val']/pdf['px_last']).map(lambda x: math.floor(x))
-                    pdf['value'] = pdf['unit']*pdf['px_last']
-                    pdf = pdf.drop('new_val',1).copy()
-                    
-                else:
-                    cash = self.initial_capital - pdf['value'].sum()
-            
-            self.pdf, self.cash = pdf, cash    
-            self.update(date, trans_cost)
-            self.res = self._print_result(date, rebal, trans_cost, *hbsdfs)
-            print(*self.res)
-            
+            reset_amount = self.initial_capital * (1-self.cash_reserve_ratio)
+            if pdf['value'].sum() > reset_amount:
+                cash_reserve = self.initial_capital * self.cash_reserve_ratio
+                cash = cash_reserve if cash > cash_reserve else cash
+                
+                pdf['new_val'] = (pdf['value']/pdf['value'].sum()) * reset_amount 
+                unit = pdf['unit'].to_numpy(dtype=float)
+                pdf['unit'] = (pdf['new_val']/pdf['px_last']).map(lambda x: math.floor(x))
+                self.book_fills(pdf.index, pdf['unit'].to_numpy(dtype=float) - unit, pdf['px_last'].to_numpy(dtype=float))
+                pdf['value'] = pdf['unit']*pdf['px_last']
+                pdf = pdf.drop('new_val',1).copy()
+                
+            else:
+                cash = self.initial_capital - pdf['value'].sum()
+        
+        self.timer.lap('mtm')
+        
+        self.pdf, self.cash = pdf, cash    
+        self.update(date, trans_cost)
+        self.timer.lap('bookkeeping')
+        self.report(k, date, rebal, trans_cost, *hbsdfs)
+        
 class BackTestingLeftover:
     
     cap_col = 'volume'
@@ -338,14 +656,15 @@ class BackTestingLeftover:
 
             bdf = bdf[~bdf.index.isin(pdf.index)].copy()
             bdf2 = hdf[(hdf['value']<invest_value)&
-                       (~hdf.index.isin(ldf.index))].copy() #Top up stocks in holding if value less than new rebalance value
+                       (~ldf.contains(hdf.index))].copy() #Top up stocks in holding if value less than new rebalance value
             bdf2['leftovers'] = invest_value - bdf2['value']
-            ldf = ldf.append(bdf2[['date','leftovers']])
+            ldf = ldf.append(OrderBook.from_frame(bdf2[['date','leftovers']]))
             
-            hdf['value'] = hdf['value'].map(lambda x: min(x, invest_value))
+            hdf['value'] = self.capped(hdf['value'], invest_value)
             
             if bdf.shape[0] + ldf.shape[0] == 0 :
                 hdf['unit'] = hdf['value']//hdf['px_last']
+                self.book_fills(hdf.index, hdf['unit'].to_numpy(dtype=float), hdf['px_last'].to_numpy(dtype=float))
                 hdf = hdf.append(pdf_selling, sort=True)
                 return hdf, nav-hdf['value'].sum(), ldf, True
             
@@ -357,25 +676,12 @@ class BackTestingLeftover:
     
             return pdf, cash, ldf, True
     
-    @staticmethod
-    def buy(pdf, bdf, cash):
+    def buy(self, pdf, bdf, cash):
         pdf = pdf[['unit','date','px_last','value']].copy()
-        for ID, v in bdf.iterrows():
-            current_price = v['px_last']
-            date = v['date']
-            buy_value = v['buy_value']
-            buy_unit = buy_value // current_price
-            cash = cash - buy_value
-            if ID in pdf.index:
-                buy_unit = pdf.loc[ID]['unit'] + buy_unit
-                buy_value = pdf.loc[ID]['value'] + buy_value
-            pdf.loc[ID] = [
-                           buy_unit, 
-                           date,
-                           current_price,
-                           buy_value,
-                          ]
-        return pdf, cash
+        if bdf.shape[0]:
+            px_last = np.asarray(bdf['px_last'], dtype=float)
+            self.book_fills(bdf.index, np.asarray(bdf['buy_value'], dtype=float) // px_last, px_last)
+        return BackTestingUtility.fill_orders(pdf, bdf, cash, accumulate=True)
     
     def calculate_invest_value(self, pdf, cash, no_of_stocks):
         '''
@@ -395,24 +701,33 @@ class BackTestingLeftover:
         3. buy_value = min(volume_cap, invest_value_allocated)
         '''
 
-        ldf = self.update_latest(ldf)
+        ldf = ldf.reprice(self.market, self.day, ['px_last', self.cap_col])
         
-        bdf = bdf.append(ldf.drop(['invest_value_allocated','value_cap'],1), sort=True)
-        bdf['value_cap'] = bdf[self.cap_col]*self.cap_amt 
-        bdf['invest_value_allocated'] = invest_value
-        bdf['leftovers'] = bdf['leftovers'].fillna(bdf['invest_value_allocated'])
-        bdf['invest_value_allocated'] = bdf.apply(lambda x: min(x['leftovers'],x['invest_value_allocated']), 1)
-
-        bdf['buy_value'] = bdf.apply(lambda x: min(x['invest_value_allocated'] ,x['value_cap']),1)
+        bdf = OrderBook.from_frame(bdf).append(ldf) # new buy calls first, then the pending ones
+        bdf['value_cap'] = bdf.get(self.cap_col)*self.cap_amt 
+        leftovers = bdf.get('leftovers')
+        bdf['leftovers'] = np.where(np.isnan(leftovers), invest_value, leftovers)
+        bdf['invest_value_allocated'] = self.capped(bdf.get('leftovers'), invest_value)
 
-        ldf = bdf[bdf['invest_value_allocated'] > bdf['value_cap']].copy()
-        ldf['days'] = ldf['days'].fillna(self.ldf_days+1) - 1
-        ldf['leftovers'] = ldf['invest_value_allocated'] - ldf['value_cap']
-        return bdf.drop(['invest_value_allocated'],1).copy(), ldf
+        ldf = bdf.fill(self.ldf_days)
+        return bdf.to_frame([c for c in bdf.columns if c != 'invest_value_allocated']), ldf
+    
+    def set_leftovers(self, date, ldf):
+        '''
+        Pending orders at the end of the day, also kept per date in self.leftover_df
+        '''
+        self.book = self.leftover_df[date] = ldf
+    
+    def get_leftovers(self):
+        '''
+        Pending orders of every day
+        	            |  side | date       | leftovers | days | ...
+            ------------|-------|------------|-----------|------|----
+        2020-01-03	ID  |  buy  | 2020-01-02 | 150000.00 | 2.0  | ...
+        '''
+        return pd.concat({d: b.to_frame() for d, b in self.leftover_df.items()})
         
     def hold_buy_sell_df(self, k, df, pdf):
-        date = df['date'].max().date().isoformat()
-        
         buy_call = df['action']=='buy'
         bdf = df[buy_call][self.buy_cols].copy()
 
@@ -421,15 +736,10 @@ class BackTestingLeftover:
         
         if k == 0:
             bdf = bdf.append(self.df_day[self.df_day['action']=='hold'][self.buy_cols])
-            self.leftover_df[date] = pd.DataFrame([], columns=self.ldf_columns)
-#             self.sell_leftover_df[date] = pd.DataFrame([], columns=pdf.columns)
-            ldf = pd.DataFrame([], columns=self.ldf_columns)
+            ldf = OrderBook()
         else:
-            d = sorted(self.leftover_df.keys())
-            ldf = self.leftover_df[d[-1]]
-            ldf = ldf[~(ldf.index.isin(sdf.index)) & (ldf['days']>0)].copy()
-#             sldf = self.sell_leftover_df[d[-1]]
-#             sdf = sdf.append(sldf)
+            # a sell call cancels the pending buy
+            ldf = self.book.side_orders('buy').cancel(sdf.index).expire()
         
         sdf = self.get_px_last(sdf)
         hdf = pdf[~pdf.index.isin(df[sell_call].index)]
@@ -438,9 +748,7 @@ class BackTestingLeftover:
     
     def run(self, k, date, pdf, cash, hdf, bdf, sdf, ldf):
         if k>=2:
-            t = sorted(self.data.keys())
-            t1, t2 = t[-1], t[-2]
-            trans_cost = self.get_trans_cost(t1, t2) 
+            trans_cost = self.get_trans_cost(self.last_date)
         else:
             trans_cost = 0
 
@@ -469,12 +777,15 @@ class BackTestingLeftover:
                 else:
                     pdf, cash, ldf, rebal = self.rebalance(date, pdf, hdf, bdf, ldf, cash)
                     
-        self.leftover_df[date] = ldf[self.ldf_columns]                                
+        self.set_leftovers(date, ldf)
         return pdf, cash, trans_cost, rebal
     
     
 class BackTestingSellLeftover:
-    sell_leftover_df = {}
+    '''
+    Sells are capped by volume too, the units left are sold on the next days
+    unless a buy call comes for the ID. They sit in the order book with side 'sell'.
+    '''
     
     def sell(self, pdf, sdf, cash, rebal=False): 
         
@@ -483,15 +794,17 @@ class BackTestingSellLeftover:
         
         if rebal:
             sdf['value'] = sdf['unit'] * sdf['px_last']
+            self.book_fills(sdf.index, -sdf['unit'].to_numpy(dtype=float), sdf['px_last'].to_numpy(dtype=float))
             return pdf, cash + sdf['value'].sum()
         
-        sdf['unit_cap'] = sdf.apply(lambda x: min(x['value'], x[self.cap_col]*self.cap_amt),1) // sdf['px_last']
+        sdf['unit_cap'] = self.capped(sdf['value'], sdf[self.cap_col]*self.cap_amt) // sdf['px_last']
+        self.book_fills(sdf.index, -sdf['unit_cap'].to_numpy(dtype=float), sdf['px_last'].to_numpy(dtype=float))
         sldf = sdf[sdf['unit']>sdf['unit_cap']].copy()
 
         if sldf.shape[0] != 0:
             sldf['unit'] = sldf['unit'] - sdf['unit_cap']
             sldf['value'] = sldf['unit']*sldf['px_last']
-            self.sell_leftover_df[self.date] = sldf
+            self.sell_leftovers = OrderBook.from_frame(sldf[pdf.columns], 'sell')
             pdf = pdf.drop(sdf.index).append(sldf[pdf.columns], sort=True).copy()
         else:
             pdf = pdf.drop(sdf.index)
@@ -499,7 +812,6 @@ class BackTestingSellLeftover:
         return pdf, cash + (sdf['unit_cap']*sdf['px_last']).sum()
     
     def hold_buy_sell_df(self, k, df, pdf):
-        date = df['date'].max().date().isoformat()
         buy_call = df['action']=='buy'
         bdf = df[buy_call][self.buy_cols].copy()
         
@@ -508,21 +820,283 @@ class BackTestingSellLeftover:
         
         if k == 0:
             bdf = bdf.append(self.df_day[self.df_day['action']=='hold'][self.buy_cols],sort=True)
-            self.leftover_df[date] = pd.DataFrame([], columns=self.ldf_columns)
-            ldf = pd.DataFrame([], columns=self.ldf_columns)
+            ldf = OrderBook()
         else:
-            d = sorted(self.leftover_df.keys())
-            ldf = self.leftover_df[d[-1]]
-            ldf = ldf[~(ldf.index.isin(sdf.index)) & (ldf['days']>0)].copy()
+            ldf = self.book.side_orders('buy').cancel(sdf.index).expire()
             
-            if d[-1] in self.sell_leftover_df:
-                sldf = self.sell_leftover_df[d[-1]]
-                sldf = sldf[~sldf.index.isin(bdf.index)]
-                sdf = sdf.append(sldf[pdf.columns], sort=True) if sldf.shape[0] else sdf
-                
+            # a buy call cancels the pending sell
+            sldf = self.book.side_orders('sell').cancel(bdf.index)
+            sdf = sdf.append(sldf.to_frame(pdf.columns), sort=True) if sldf.shape[0] else sdf
+        
+        self.sell_leftovers = OrderBook()
         sdf = self.update_latest(sdf) #Add volume column
         
         hdf = pdf[~pdf.index.isin(sdf.index)]    
         
         return hdf, bdf, sdf, ldf
-    
\ No newline at end of file
+    
+    def set_leftovers(self, date, ldf):
+        super().set_leftovers(date, ldf.append(self.sell_leftovers))
+    
+
+
+class BackTestingCalendar:
+    '''
+    Runs the order logic only on days that need it and marks the portfolio to market
+    in between as one units x price-matrix product, same output as the daily loop.
+
+    A day is skipped when it is not the first or last day, has no buy call and no sell
+    call on a holding, every holding has a price, no transaction cost is left to pay
+    and cash is not negative. Then `run` would not trade.
+    A fully invested book (cash_reserve_ratio = 0) goes below zero cash on every transaction
+    cost and rebalances daily, keep a cash reserve for long quiet stretches.
+
+    rebalance_dates : optional calendar, actions are re-derived from `signal` sampled on
+                      these dates (buy / sell against the previous calendar date), other days
+                      get hold / na, i.e. the daily loop on a signal that only changes on the calendar
+                      (on resume pass action_df through sample_actions first)
+
+    Supported: StyleBackTest
+    e.g. class StyleBackTestCalendar(BackTestingCalendar, StyleBackTest)
+    '''
+    def __init__(self, action_df, *args, rebalance_dates=None, **kwargs):
+        if rebalance_dates is not None:
+            action_df = self.sample_actions(action_df, rebalance_dates)
+        super().__init__(action_df, *args, **kwargs)
+        self.set_calls()
+
+    @staticmethod
+    def sample_actions(action_df, rebalance_dates):
+        df = action_df.copy()
+        on = df['date'].isin(pd.to_datetime(rebalance_dates))
+        cal = df[on].sort_values('date', kind='mergesort')
+        diff = cal.groupby('id')['signal'].diff().fillna(2)
+        signal = cal['signal']
+        df['action'] = np.where(df['signal']==1, 'hold', 'na')
+        df.loc[cal.index, 'action'] = np.select([(signal==1) & (diff==0), 
+                                                 (signal==1) & (diff==2), 
+                                                 (signal==-1) & (diff==-2)], 
+                                                ['hold', 'buy', 'sell'], 'na')
+        return df
+
+    def set_calls(self):
+        '''
+        Buy calls per market day and sell calls per ( market day x ID )
+        '''
+        days = np.repeat(np.arange(len(self.day_slices)), [e - s for s, e in self.day_slices.values()])
+        action = self.df['action'].to_numpy()
+        self.buy_day = np.zeros(len(self.day_slices), dtype=bool)
+        self.buy_day[days[action == 'buy']] = True
+        self.sell_call = np.zeros(self.market.present.shape, dtype=bool)
+        self.sell_call[days[action == 'sell'], self.market.ids.get_indexer(self.df['id'][action == 'sell'])] = True
+
+    def count_quiet_days(self, days):
+        '''
+        Number of days at the start of days ( [(k, date)] ) that can be skipped from the current state
+        '''
+        k = days[0][0]
+        trans_cost = self.get_trans_cost(self.last_date) if k>=2 else 0
+        if self.cash - trans_cost < 0 or trans_cost != 0:
+            return 0
+
+        # the checkpoint is written on the day before the last
+        last = len(self.trading_date) - (2 if self.checkpoint_path is not None else 1)
+        codes = self.market.ids.get_indexer(self.pdf.index)
+        if (codes < 0).any():
+            return 0
+        px = self.market.values['px_last']
+        n = 0
+        for k, date in days:
+            day = self.market.get_day(date)
+            if k == 0 or k >= last or day is None or self.buy_day[day]:
+                break
+            if not (self.market.present[day, codes].all() and np.isfinite(px[day, codes]).all()
+                    and not self.sell_call[day, codes].any()):
+                break
+            n += 1
+        return n
+
+    def fast_forward(self, days):
+        '''
+        Mark-to-market and bookkeeping of quiet days at once
+        '''
+        pdf, cash = self.pdf, self.cash
+        market_days = [self.market.get_day(date) for _, date in days]
+        codes = self.market.ids.get_indexer(pdf.index)
+        unit = pdf['unit'].to_numpy(dtype=float)
+        px_last = self.market.values['px_last'][np.ix_(market_days, codes)]
+        value = unit * px_last
+        nav = value.sum(axis=1) + cash
+
+        # charged on a day is the cost booked the day before, 0 on quiet days
+        trans_cost = [self.get_trans_cost(self.last_date) if days[0][0]>=2 else 0]
+        trans_cost += [0.0 if k>=2 else 0 for k, _ in days[1:]]
+        dates = [date for _, date in days]
+        self.data.extend(dates, pdf, px_last, value, cash, nav, trans_cost)
+        for date in dates:
+            self.trans_cost_data[date] = 0.0
+
+        self.timer.start()
+        for i, (k, date) in enumerate(days):
+            if self.subscribers or i+1 == len(days):
+                self.df_day = self.get_df_day(date)
+                self.pdf = self.get_px_last(pdf)
+                self.pdf['value'] = self.pdf['unit']*self.pdf['px_last']
+                self.report(k, date, False, trans_cost[i], pdf, pdf.iloc[:0], pdf.iloc[:0])
+        self.last_date = dates[-1]
+
+    def backtest(self):
+        self.begin()
+        days = list(self.trading_days())
+        i = 0
+        while i < len(days):
+            n = self.count_quiet_days(days[i:])
+            if n:
+                self.fast_forward(days[i:i+n])
+                i += n
+            else:
+                self.run_day(*days[i])
+                i += 1
+
+
+class BackTestingArray:
+    '''
+    Engine mode that keeps holdings, units, cost and cash in NumPy arrays indexed
+    by integer security codes instead of the row-by-row pdf DataFrame.
+    Decisions still go through the `run` of the class it is mixed into,
+    so NAV, trades and self.data match the DataFrame engine.
+
+    Supported: BackTesting, BasicBackTest, StyleBackTest
+    e.g. class BasicBackTestArray(BackTestingArray, BasicBackTest)
+    '''
+    order_cols = ['date', 'px_last']
+    array_attrs = ['ids', 'day_codes', 'day_action', 'day_date', 'day_present', 'day_px']
+
+    def __init__(self, action_df, *args, **kwargs):
+        self.ids = pd.Index(np.sort(action_df['id'].unique()), dtype=object)
+        super().__init__(action_df, *args, **kwargs)
+
+    @property
+    def pdf(self):
+        return self._pdf
+
+    @pdf.setter
+    def pdf(self, pdf):
+        self._pdf = pdf if isinstance(pdf, ArrayPortfolio) else self._create_empty_pdf()
+
+    def _create_empty_pdf(self):
+        return ArrayPortfolio(self.ids)
+
+    def set_day(self, df_day):
+        '''
+        Index today's rows by security code
+        '''
+        n = len(self.ids)
+        self.day_codes = self.ids.get_indexer(df_day.index)
+        self.day_action = df_day['action'].to_numpy()
+        self.day_date = df_day['date'].to_numpy(dtype='datetime64[ns]')
+        self.day_present = np.zeros(n, dtype=bool)
+        self.day_present[self.day_codes] = True
+        self.day_px = np.full(n, np.nan)
+        self.day_px[self.day_codes] = df_day['px_last'].to_numpy(dtype=float)
+
+    def get_day_orders(self, action):
+        mask = self.day_action == action
+        codes = self.day_codes[mask]
+        return OrderSet(codes, date=self.day_date[mask], px_last=self.day_px[codes])
+
+    def get_px_last(self, orders):
+        orders = orders.take(self.day_present[orders.codes])
+        orders['px_last'] = self.day_px[orders.codes]
+        return orders
+
+    def update_latest(self, hdf):
+        return self.get_px_last(hdf)
+
+    def hold_buy_sell_df(self, k, df, pdf):
+        bdf = self.get_day_orders('buy')
+
+        sell_call = np.zeros(len(self.ids), dtype=bool)
+        sell_call[self.day_codes[self.day_action == 'sell']] = True
+        sdf = self.get_px_last(pdf.to_orders(sell_call[pdf.codes]))
+        hdf = pdf.to_orders(~sell_call[pdf.codes])
+
+        if k == 0:
+            bdf = bdf.append(self.get_day_orders('hold'), self.order_cols)
+
+        return hdf, bdf, sdf
+
+    def buy(self, pdf, bdf, cash):
+        buy_value = bdf.get('buy_value')
+        px_last = bdf.get('px_last')
+        self.book_fills(self.ids[bdf.codes], buy_value // px_last, px_last)
+        pdf.add(bdf.codes, buy_value // px_last, bdf.get('date'), px_last, buy_value)
+        # subtract.reduce is a left fold, same rounding as cash - v1 - v2 - ...
+        return pdf, np.subtract.reduce(np.r_[cash, buy_value])
+
+    def sell(self, pdf, sdf, cash, **kwargs):
+        if len(sdf) == 0:
+            return pdf, cash
+
+        pdf.remove(sdf.codes)
+        sdf['value'] = sdf.get('unit') * sdf.get('px_last')
+        self.book_fills(self.ids[sdf.codes], -sdf.get('unit'), sdf.get('px_last'))
+        return pdf, cash + np.nansum(sdf.get('value'))
+
+    def rebalance(self, hdf, bdf, cash):
+        if isinstance(hdf, ArrayPortfolio):
+            hdf = hdf.to_orders()
+        hdf = self.drop_unpriced(hdf, self.update_latest(hdf))
+        pdf = self._create_empty_pdf()
+
+        if len(hdf) + len(bdf) == 0:
+            return pdf, cash, False
+        else:
+            _, cash = self.sell(pdf, hdf, cash)
+
+            hbdf = hdf.append(bdf, self.order_cols)
+            hbdf = self.get_buy_value(pdf, hbdf, cash)
+            pdf, cash = self.buy(pdf, hbdf, cash)
+            return pdf, cash, True
+
+    def get_state(self):
+        '''
+        Security codes change with the resumed action_df, keep IDs instead
+        '''
+        state = {key: v for key, v in super().get_state().items() if key not in self.array_attrs}
+        state['_pdf'] = self.pdf.to_frame()
+        return state
+
+    def set_state(self, state):
+        state = dict(state)
+        pdf = state.pop('_pdf')
+        self.ids = self.ids.union(pdf.index)
+        super().set_state(state)
+        self.pdf = ArrayPortfolio.from_frame(self.ids, pdf)
+
+    def drop_unpriced(self, orders, priced):
+        if len(priced) < len(orders):
+            gone = orders.take(~self.day_present[orders.codes])
+            self.book_fills(self.ids[gone.codes], -gone.get('unit'), np.full(len(gone), np.nan))
+        return priced
+
+    def run_day(self, k, date):
+        self.timer.start()
+        pdf, cash = self.pdf, self.cash
+        self.df_day = self.get_df_day(date)
+        self.set_day(self.df_day)
+        hbsdfs = self.hold_buy_sell_df(k, self.df_day, pdf)
+        self.timer.lap('prepare')
+
+        pdf, cash, trans_cost, rebal = self.run(k, date, pdf, cash, *hbsdfs)
+        self.timer.lap('execute')
+
+        #MTM pdf
+        dropped = pdf.mark_to_market(self.day_present, self.day_px)
+        self.book_fills(self.ids[dropped.codes], -dropped.get('unit'), np.full(len(dropped), np.nan))
+        self.timer.lap('mtm')
+
+        self.pdf, self.cash = pdf, cash
+        self.update(date, trans_cost)
+        self.timer.lap('bookkeeping')
+        self.report(k, date, rebal, trans_cost, *hbsdfs)
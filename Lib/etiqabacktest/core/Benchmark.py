@@ -0,0 +1,197 @@
+'''
+Speed and memory benchmark of the backtest engines on synthetic data
+
+    python -m etiqabacktest.core.Benchmark --stocks 200 --days 500 --density 0.2 --out bench.json
+    python -m etiqabacktest.core.Benchmark --compare old.json bench.json
+'''
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+from datetime import datetime
+import pandas as pd
+import numpy as np
+from .Backtest import BackTesting, BackTestingReset
+from ..BasicBacktest import BasicBackTestNoPrint
+from ..StyleBacktest import StyleBackTest, StyleBackTestLeftover
+
+
+class ResetBackTest(BackTestingReset, BackTesting):
+    '''
+    BackTesting with the yearly reset
+    '''
+
+
+### name: (engine, trading dates as Timestamp) ###
+engines = {'BackTesting': (BackTesting, False),
+           'BackTestingReset': (ResetBackTest, False),
+           'StyleBackTest': (StyleBackTest, False),
+           'StyleBackTestLeftover': (StyleBackTestLeftover, True),
+           'BasicBackTestNoPrint': (BasicBackTestNoPrint, False)}
+
+
+def make_data(n_stocks=100, n_days=250, signal_density=0.2, holding_days=20, missing=0.0, seed=0,
+              start='2020-01-02'):
+    '''
+    Seeded synthetic inputs of the engines
+
+    n_stocks x n_days rows, signal is 1 on about signal_density of them, held
+    holding_days on average (two-state Markov chain per stock), action as ApplyRule.get_action.
+    missing : share of rows dropped at random, i.e. days a stock does not trade
+
+    Returns
+    -------
+    action_df      : ( id | date, px_last, volume, avg_5_value, signal, action )
+    stock_index_df : ( date | price, is_bull, is_bear )
+    trading_dates  : list of str
+    '''
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=n_days)
+    ids = np.array(['S{:05d} MK Equity'.format(i) for i in range(n_stocks)], dtype=object)
+
+    q = 1 / holding_days
+    p = min(signal_density * q / (1 - signal_density), 1) if signal_density < 1 else 1
+    signal = np.empty((n_stocks, n_days), dtype=np.int8)
+    signal[:, 0] = np.where(rng.uniform(size=n_stocks) < signal_density, 1, -1)
+    for d in range(1, n_days):
+        u = rng.uniform(size=n_stocks)
+        switch = np.where(signal[:, d-1] == 1, u < q, u < p)
+        signal[:, d] = np.where(switch, -signal[:, d-1], signal[:, d-1])
+
+    px_last = np.round(np.exp(np.cumsum(rng.normal(0, 0.02, (n_stocks, n_days)), 1))
+                       * rng.uniform(0.5, 10, (n_stocks, 1)), 3)
+    volume = rng.lognormal(13, 1.5, (n_stocks, n_days))
+    avg_5_value = pd.DataFrame(volume * px_last).T.rolling(5, min_periods=1).mean().T.to_numpy()
+
+    df = pd.DataFrame({'id': ids.repeat(n_days),
+                       'date': np.tile(dates, n_stocks),
+                       'px_last': px_last.ravel(),
+                       'volume': volume.ravel(),
+                       'avg_5_value': avg_5_value.ravel(),
+                       'signal': signal.ravel()})
+    if missing:
+        df = df[rng.uniform(size=len(df)) >= missing].reset_index(drop=True)
+
+    diff = df.groupby('id')['signal'].diff().fillna(2).to_numpy()
+    df['action'] = np.select([(df['signal'] == 1) & (diff == 0),
+                              (df['signal'] == 1) & (diff == 2),
+                              (df['signal'] == -1) & (diff == -2)],
+                             ['hold', 'buy', 'sell'], 'na')
+
+    price = 1500 * np.exp(np.cumsum(rng.normal(0, 0.01, n_days)))
+    stock_index_df = pd.DataFrame({'date': dates, 'price': price})
+    stock_index_df['is_bull'] = stock_index_df['price'] > stock_index_df['price'].rolling(50, min_periods=1).mean()
+    stock_index_df['is_bear'] = ~stock_index_df['is_bull']
+    return df, stock_index_df, [d.date().isoformat() for d in dates]
+
+
+def time_engine(bt_class, action_df, stock_index_df, trading_dates, repeat=3):
+    '''
+    Wall time (s) of construction + backtest, best and median of repeat runs
+    '''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        bt = bt_class(action_df, stock_index_df, trading_dates)
+        bt.mute()
+        bt.backtest()
+        times.append(time.perf_counter() - start)
+    return dict(best_time = min(times), median_time = float(np.median(times)),
+                final_nav = float(bt.get_summary()['value'].iloc[-1]))
+
+
+def trace_engine(bt_class, action_df, stock_index_df, trading_dates):
+    '''
+    Peak Python heap (MB, NumPy buffers included) of one run, traced apart from the timing
+    as tracemalloc slows the run down
+    '''
+    tracemalloc.start()
+    try:
+        bt = bt_class(action_df, stock_index_df, trading_dates)
+        bt.mute()
+        bt.backtest()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return dict(peak_mb = peak / 2**20)
+
+
+def run_benchmarks(n_stocks=100, n_days=250, signal_density=0.2, seed=0, names=None, repeat=3, memory=True):
+    '''
+    Time every engine on one synthetic data set
+
+    Returns
+    -------
+    DataFrame: engine | n_stocks, n_days, signal_density, rows, best_time, median_time, peak_mb, final_nav
+    '''
+    action_df, stock_index_df, trading_dates = make_data(n_stocks, n_days, signal_density, seed=seed)
+    rows = []
+    for name in names or list(engines):
+        bt_class, ts = engines[name]
+        dates = [pd.Timestamp(d) for d in trading_dates] if ts else trading_dates
+        row = dict(engine=name, n_stocks=n_stocks, n_days=n_days, signal_density=signal_density,
+                   rows=len(action_df))
+        row.update(time_engine(bt_class, action_df, stock_index_df, dates, repeat))
+        if memory:
+            row.update(trace_engine(bt_class, action_df, stock_index_df, dates))
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def save(result, path, label=None):
+    '''
+    JSON with the environment, so files of two versions can be put side by side with compare
+    '''
+    out = dict(label = label,
+               created = datetime.now().isoformat(timespec='seconds'),
+               python = platform.python_version(),
+               pandas = pd.__version__,
+               numpy = np.__version__,
+               machine = platform.platform(),
+               results = result.to_dict(orient='records'))
+    with open(path, 'w') as f:
+        json.dump(out, f, indent=2)
+
+
+def load(path):
+    with open(path) as f:
+        return pd.DataFrame(json.load(f)['results'])
+
+
+def compare(old_path, new_path):
+    '''
+    engine, size | best_time and peak_mb of both files, ratio new / old (< 1 is faster / smaller)
+    '''
+    keys = ['engine', 'n_stocks', 'n_days', 'signal_density']
+    cols = [c for c in ['best_time', 'peak_mb', 'final_nav'] if c in load(old_path) and c in load(new_path)]
+    df = load(old_path)[keys + cols].merge(load(new_path)[keys + cols], on=keys, suffixes=('_old', '_new'))
+    for c in ['best_time', 'peak_mb']:
+        if c in cols:
+            df[c + '_ratio'] = df[c + '_new'] / df[c + '_old']
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the backtest engines on synthetic data')
+    parser.add_argument('--stocks', type=int, nargs='+', default=[100])
+    parser.add_argument('--days', type=int, nargs='+', default=[250])
+    parser.add_argument('--density', type=float, nargs='+', default=[0.2])
+    parser.add_argument('--engines', nargs='+', default=None, choices=list(engines))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true')
+    parser.add_argument('--label', default=None, help='e.g. the git commit benchmarked')
+    parser.add_argument('--out', default='benchmark.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    args = parser.parse_args()
+
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        if args.compare:
+            print(compare(*args.compare))
+        else:
+            result = pd.concat([run_benchmarks(s, d, p, args.seed, args.engines, args.repeat, not args.no_memory)
+                                for s in args.stocks for d in args.days for p in args.density],
+                               ignore_index=True)
+            save(result, args.out, args.label)
+            print(result)
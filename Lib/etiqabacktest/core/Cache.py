@@ -0,0 +1,175 @@
+import hashlib
+import os
+import pickle
+import re
+import uuid
+import numpy as np
+import pandas as pd
+
+
+class SignalCache:
+    '''
+    On-disk cache of ApplyRule outputs (action_df), so a rule run again on the same
+    inputs with the same parameters is read back instead of generated.
+
+    key : rule class + rule parameters (its attributes, e.g. b_score, s_score)
+          + fingerprint of the input frames (shape, columns, dtypes and a hash of the values)
+
+    Parameters and other run arguments are keyed by their repr, frames and arrays by their
+    values. A value whose repr holds a memory address (functions, objects without __repr__)
+    is refused with a TypeError, as the key would change on every run.
+
+    Entries are Parquet (action stays categorical), or pickle when a frame does not fit
+    Parquet (e.g. object columns of mixed types). The least recently used entries are
+    removed once the cache is over max_bytes.
+
+    >>> cache = SignalCache('signal_cache', max_bytes=2*2**30)
+    >>> action_df = cache.run(LR_rule(b_score=1, s_score=-1), df)
+    >>> action_df = cache.run(ESG_rule(60, roe_score=15), df, columns=['ID', 'date', 'ESG Combined Score', 'ROE'])
+
+    A hit does not add the rule's working columns (buy_signal ...) to the input frame
+    as run does. Clear the cache after changing a rule's code.
+    '''
+    def __init__(self, path, max_bytes=2**30, fmt='parquet'):
+        '''
+        fmt : 'parquet' (needs pyarrow) or 'pickle'
+        '''
+        if fmt not in ('parquet', 'pickle'):
+            raise ValueError('fmt must be parquet or pickle')
+        self.path = path
+        self.max_bytes = max_bytes
+        self.fmt = fmt
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    @classmethod
+    def get_params(cls, rule):
+        return sorted((k, cls.get_text(v)) for k, v in vars(rule).items() if not k.startswith('_'))
+
+    @classmethod
+    def get_text(cls, value):
+        '''
+        Key text of a parameter: frame fingerprint, array hash or repr
+        '''
+        if isinstance(value, pd.DataFrame):
+            return cls.fingerprint(value)
+        if isinstance(value, pd.Series):
+            return cls.fingerprint(value.to_frame())
+        if isinstance(value, np.ndarray):
+            return repr((value.shape, str(value.dtype), pd.util.hash_array(value.ravel()).tobytes()))
+        text = repr(value)
+        if re.search(r' at 0x[0-9a-fA-F]+', text):
+            raise TypeError('{} has no stable repr for a cache key: {}'.format(type(value).__name__, text))
+        return text
+
+    @staticmethod
+    def fingerprint(df, columns=None):
+        '''
+        Hash of the content of df (only columns if given), index included
+        '''
+        if columns is not None:
+            df = df[columns]
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr((df.shape, list(df.columns), [str(t) for t in df.dtypes])).encode())
+        h.update(pd.util.hash_pandas_object(df.index).to_numpy().tobytes())
+        for c in range(df.shape[1]):
+            h.update(pd.util.hash_pandas_object(df.iloc[:, c], index=False).to_numpy().tobytes())
+        return h.hexdigest()
+
+    def get_key(self, rule, args, kwargs, columns=None):
+        h = hashlib.blake2b(digest_size=16)
+        h.update('{}.{}'.format(type(rule).__module__, type(rule).__qualname__).encode())
+        h.update(repr(self.get_params(rule)).encode())
+        for arg in list(args) + [kwargs[k] for k in sorted(kwargs)]:
+            if isinstance(arg, pd.DataFrame):
+                h.update(self.fingerprint(arg, [c for c in columns if c in arg] if columns else None).encode())
+            else:
+                h.update(self.get_text(arg).encode())
+        h.update(repr(sorted(kwargs)).encode())
+        return h.hexdigest()
+
+    def run(self, rule, *args, columns=None, **kwargs):
+        '''
+        rule.run(*args, **kwargs), from the cache when the same run is stored
+        columns : input columns the rule reads, all columns are fingerprinted if None
+        '''
+        key = self.get_key(rule, args, kwargs, columns)
+        df = self.get(key)
+        if df is not None:
+            self.hits += 1
+            return df
+        self.misses += 1
+        df = rule.run(*args, **kwargs)
+        self.put(key, df)
+        return df
+
+    def get_file(self, key):
+        for ext in ('.parquet', '.pkl'):
+            file = os.path.join(self.path, key + ext)
+            if os.path.exists(file):
+                return file
+        return None
+
+    def get(self, key):
+        file = self.get_file(key)
+        if file is None:
+            return None
+        try:
+            df = pd.read_parquet(file) if file.endswith('.parquet') else pd.read_pickle(file)
+        except (OSError, ValueError, pickle.UnpicklingError, EOFError):
+            # removed by another process or half written
+            return None
+        os.utime(file)   # last used, for the eviction
+        return df
+
+    def put(self, key, df):
+        tmp = os.path.join(self.path, '.{}.tmp'.format(uuid.uuid4().hex))
+        ext = '.pkl'
+        try:
+            if self.fmt == 'parquet':
+                try:
+                    df.to_parquet(tmp)
+                    ext = '.parquet'
+                except (ValueError, TypeError, NotImplementedError, ImportError):
+                    pass
+            if ext == '.pkl':
+                df.to_pickle(tmp)
+            os.replace(tmp, os.path.join(self.path, key + ext))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict()
+
+    def get_entries(self):
+        '''
+        [(last used, bytes, file)] oldest first
+        '''
+        entries = []
+        for e in os.scandir(self.path):
+            if e.is_file() and not e.name.startswith('.'):
+                stat = e.stat()
+                entries.append((stat.st_mtime, stat.st_size, e.path))
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for _, size, _ in self.get_entries())
+
+    def evict(self):
+        '''
+        Remove the least recently used entries until the cache fits max_bytes
+        '''
+        entries = self.get_entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, file in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, file in self.get_entries():
+            os.remove(file)
@@ -1,61 +1,120 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+import os
+import uuid
+import numpy as np
 import pandas as pd
+from etiqacommon.interval import get_runs
 
 
-def download_price_dvd_data(bq, univ:list, start:str, end:str):
+def download_price_dvd_data(bq, univ:list, start:str, end:str, cache_dir=None, max_workers=4, batch_size=200,
+                            price_dtype=None, sparse_dvd=True, verbose=False):
     '''
     
     e.g. suspended stocks: IJM MK Equity 2021-06-09
     
+    cache_dir: local cache of the downloaded ranges, see ChunkedDownloader
+    price_dtype, sparse_dvd: see get_price_panel
+    verbose: print the memory used by the panel
     '''
-    params =  dict(dates = bq.func.range(start=start, end=end))
-    join_on = ['ID','DATE'] 
-    
-    def get_price_vol(bq, univ, start, end):
-        
-        df = get_data(bq, univ, {'px_last': bq.data.px_last(**params),
-                                 'px_low':bq.data.px_low(**params),
-                                 'px_high':bq.data.px_high(**params),
-                                 'px_open':bq.data.px_open(**params),
-                                 'mkt_cap':bq.data.cur_mkt_cap(**params),
-                                 'volume' : bq.data.turnover(**params)}).reset_index().dropna()
-        
-        univ_ids = df[['ID']].drop_duplicates()
-        full_dates = df[['DATE']].drop_duplicates()
-        df = univ_ids.assign(key=1).merge(full_dates.assign(key=1), on='key').drop('key',1)\
-                     .merge(df, on=['ID','DATE'], how='left')
-        return df
+    def get_price_vol(bq, start, end):
+        params =  dict(dates = bq.func.range(start=start, end=end))
+        return {'px_last': bq.data.px_last(**params),
+                'px_low':bq.data.px_low(**params),
+                'px_high':bq.data.px_high(**params),
+                'px_open':bq.data.px_open(**params),
+                'mkt_cap':bq.data.cur_mkt_cap(**params),
+                'volume' : bq.data.turnover(**params)}
 
-    price_df = download_incremental(bq, univ, get_price_vol, start, end)
-    price_df['px_last'] = price_df.groupby('ID')['px_last'].ffill()
-    price_df['mkt_cap'] = price_df.groupby('ID')['mkt_cap'].ffill()
+    price_cols = ['px_last', 'px_low', 'px_high', 'px_open', 'mkt_cap', 'volume']
+    price_df = ChunkedDownloader(bql_fetch(bq, get_price_vol), price_cols, cache_dir, batch_size, max_workers)\
+                    .download(univ, start, end)
     
-    for p in ['px_high', 'px_open', 'px_low']:
-        price_df[p] = price_df[p].fillna(price_df['px_last'])
-        
-    price_df['volume'] = price_df['volume'].fillna(0)
-    
-    def get_dvd(bq, univ, start, end):
-        df = get_data(bq, univ, {'cash_divs':bq.func.dropna(bq.data.cash_divs(**params))})
-        return df.dropna().reset_index()
+    def get_dvd(bq, start, end):
+        params =  dict(dates = bq.func.range(start=start, end=end))
+        return {'cash_divs':bq.func.dropna(bq.data.cash_divs(**params))}
 
-    dvd_df = download_incremental(bq, univ, get_dvd, start, end)
-    dvd_df = dvd_df.groupby(join_on)['cash_divs'].sum().reset_index()
+    dvd_df = ChunkedDownloader(bql_fetch(bq, get_dvd), ['cash_divs'], cache_dir, batch_size, max_workers)\
+                    .download(univ, start, end)
 
-    price_w_dvd = price_df.merge(dvd_df.drop(['CURRENCY','Partial Errors'],1, errors='ignore'), 
-                              on=join_on, how='left')
+    price_w_dvd = get_price_panel(price_df, dvd_df, price_dtype, sparse_dvd)
+    if verbose:
+        usage = get_memory_usage(price_w_dvd)
+        print('{:,} rows, {:.1f} MB'.format(len(price_w_dvd), usage['MB'].sum()))
     return price_w_dvd
 
-def download_return_data(bq, univ:list, start:str, end:str, per='D'):
+def get_price_panel(price_df, dvd_df, price_dtype=None, sparse_dvd=True):
+    '''
+    Every ID on every date of price_df, prices forward filled by ID and dividends added
+    
+    |   ID  |    DATE    | px_last | ... | volume | cash_divs |
+    |-------|------------|---------|-----|--------|-----------|
+    |stock 1| 2021-06-08 |   3.10  |     |  1e6   |    NaN    |
+    |stock 1| 2021-06-09 |   3.10  |     |   0    |    NaN    |   suspended
+    
+    The rows are a reindex over the ID x DATE MultiIndex, not a merge on a cross join.
+    
+    Parameters
+    ----------
+    price_df: DataFrame
+        ID, DATE, px_last, px_low, px_high, px_open, mkt_cap, volume
+    dvd_df: DataFrame
+        ID, DATE, cash_divs, several rows of a day are added up
+    price_dtype: optional
+        dtype of the price columns, e.g. 'float32' for half the memory (7 significant digits)
+    sparse_dvd: bool
+        cash_divs as a sparse column, only the dividend days are stored
+    
+    Returns
+    -------
+    price_w_dvd: DataFrame
+        sorted by ID (categorical) and DATE (datetime64)
+    '''
+    join_on = ['ID','DATE']
+    price_cols = [c for c in price_df.columns if c not in join_on]
+    ids = pd.CategoricalIndex(np.sort(price_df['ID'].unique()), name='ID')
+    dates = pd.DatetimeIndex(np.sort(pd.to_datetime(price_df['DATE']).unique()), name='DATE')
+    index = pd.MultiIndex.from_product([ids, dates])
     
-    params =  dict(calc_interval = bq.func.range(start=start, end=end))
+    def to_index(df):
+        return pd.MultiIndex.from_arrays([pd.Categorical(df['ID'], categories=ids.categories),
+                                          pd.to_datetime(df['DATE'])], names=join_on)
     
-    def get_ret(bq, univ, start, end):
-        df = get_data(bq, univ, {'return': bq.data.return_series(per=per, **params)})
-        return df.dropna().reset_index()
+    prices = price_df[price_cols]
+    if price_dtype is not None:
+        prices = prices.astype(price_dtype)
+    price_w_dvd = prices.set_axis(to_index(price_df)).reindex(index)
+    
+    ffill_cols = ['px_last', 'mkt_cap']
+    price_w_dvd[ffill_cols] = price_w_dvd.groupby(level='ID', observed=True)[ffill_cols].ffill()
+    for p in ['px_high', 'px_open', 'px_low']:
+        price_w_dvd[p] = price_w_dvd[p].fillna(price_w_dvd['px_last'])
+    price_w_dvd['volume'] = price_w_dvd['volume'].fillna(0)
+    
+    dvd = dvd_df['cash_divs'].set_axis(to_index(dvd_df))
+    dvd = dvd[dvd.index.get_level_values('ID').notna()]
+    dvd = dvd.groupby(level=join_on, observed=True).sum().reindex(index).to_numpy()
+    price_w_dvd['cash_divs'] = pd.arrays.SparseArray(dvd) if sparse_dvd else dvd
+    return price_w_dvd.reset_index()
+
+def get_memory_usage(df):
+    '''
+    | column | dtype | MB |, index included
+    '''
+    usage = df.memory_usage(deep=True)
+    return pd.DataFrame({'dtype': df.dtypes.reindex(usage.index).astype(str), 'MB': usage / 2**20})
+
+def download_return_data(bq, univ:list, start:str, end:str, per='D', cache_dir=None, max_workers=4, batch_size=200):
+    
+    def get_ret(bq, start, end):
+        params =  dict(calc_interval = bq.func.range(start=start, end=end))
+        return {'return': bq.data.return_series(per=per, **params)}
     
     prev1month = (datetime.strptime(start, '%Y-%m-%d')-timedelta(31)).date().isoformat()
-    return_df = download_incremental(bq, univ, get_ret, prev1month, end) 
+    if cache_dir is not None:
+        cache_dir = os.path.join(cache_dir, 'return_per_{}'.format(per))
+    return_df = ChunkedDownloader(bql_fetch(bq, get_ret), ['return'], cache_dir, batch_size, max_workers)\
+                    .download(univ, prev1month, end)
     return return_df
     
 def download_benchmark_riskfree(bq, bticker:str, rfticker:str, start:str, end:str, per='D'):
@@ -112,19 +171,114 @@ def get_full_ids_dates(df, id_col='ID', date_col='DATE'):
     return ids_dates
 
 def get_full_dates_member(df, univ_df):
-    univ_df.rename(columns={'DATE':'DATE_members'}, inplace=True)
-
-    ids = univ_df[['ID']].sort_values('ID').drop_duplicates()
-    dates = df[['DATE']].sort_values('DATE').drop_duplicates()
-    univ_dates = univ_df[['DATE_members']].sort_values('DATE_members').drop_duplicates()
+    '''
+    Dense membership of every ID of univ_df on every DATE of df, see MembershipIndex.to_panel
     
-    date_maps = pd.merge_asof(dates, univ_dates, left_on='DATE', right_on='DATE_members')
-    member_dates = date_maps.merge(univ_df[['ID','DATE_members']], on='DATE_members', how='left').assign(index='In')
-#     return member_dates
-    ids_dates = cross_join(ids, dates)
-    full_dates_member = ids_dates.merge(member_dates, on=['ID','DATE'], how='left').fillna('Out')
+    |   ID  |    DATE    | DATE_members | index |
+    |-------|------------|--------------|-------|
+    |stock 1| 2021-06-30 |  2021-06-01  |  In   |
+    |stock 2| 2021-06-30 |     Out      |  Out  |
+    '''
+    members = MembershipIndex(univ_df)
+    full_dates_member = members.to_panel(df['DATE'])
+    k = members.get_snapshot(full_dates_member['DATE'])
+    snapshot = pd.Series(members.snapshots[np.maximum(k, 0)], index=full_dates_member.index)
+    full_dates_member.insert(2, 'DATE_members', snapshot.astype(object).where(full_dates_member['index'] == 'In', 'Out'))
     return full_dates_member
 
+class MembershipIndex:
+    '''
+    Point-in-time index membership as ( ID, valid_from, valid_to ) intervals built from
+    the member snapshots ( ID, DATE ), in place of an ID x date panel.
+    
+    A date takes the members of the last snapshot on or before it (none before the first).
+    An ID is a member from a snapshot it is in (valid_from) until the next snapshot it is
+    not in (valid_to, exclusive), valid_to is NaT while it is in the last snapshot.
+    
+    |   ID  | valid_from | valid_to   |
+    |-------|------------|------------|
+    |stock 1| 2015-06-01 | 2017-12-01 |
+    |stock 1| 2019-06-01 |    NaT     |
+    
+    >>> members = MembershipIndex(univ_df)
+    >>> members.members('2021-06-30')                          # IDs in on a date
+    >>> members.members(df['DATE'].unique())                   # ( DATE, ID ) of the members
+    >>> df['member'] = members.is_member(df['ID'], df['DATE'])  # any ( ID, date ) rows
+    >>> members.to_panel(df['DATE'])                            # dense ID x DATE, In / Out
+    '''
+    def __init__(self, univ_df, id_col='ID', date_col='DATE'):
+        self.id_col = id_col
+        self.date_col = date_col
+        snaps = univ_df[[id_col, date_col]].drop_duplicates()
+        dates = pd.to_datetime(snaps[date_col])
+        self.snapshots = pd.DatetimeIndex(np.sort(dates.unique()))
+        self.ids = pd.Index(np.sort(snaps[id_col].unique()))
+        
+        # runs of consecutive snapshots of an ID
+        i = self.ids.get_indexer(snaps[id_col])
+        k = self.snapshots.get_indexer(dates)
+        order = np.lexsort((k, i))
+        i, k = i[order], k[order]
+        new = np.r_[True, (i[1:] != i[:-1]) | (k[1:] != k[:-1] + 1)] if len(i) else np.zeros(0, dtype=bool)
+        last = np.r_[new[1:], True] if len(i) else new
+        self.id_code = i[new]
+        self.k_from = k[new]
+        self.k_to = k[last] + 1
+        # sorted search key of the intervals
+        self.key = self.id_code * (len(self.snapshots) + 1) + self.k_from
+        # ( snapshot, ID ) rows sorted by snapshot, the members of snapshot k are one slice
+        self.snap_id = i[np.argsort(k, kind='stable')]
+        self.snap_start = np.sort(k).searchsorted(np.arange(len(self.snapshots) + 1))
+    
+    @property
+    def intervals(self):
+        valid_to = self.snapshots.append(pd.DatetimeIndex([pd.NaT]))[self.k_to]
+        return pd.DataFrame({self.id_col: self.ids[self.id_code],
+                             'valid_from': self.snapshots[self.k_from],
+                             'valid_to': valid_to})
+    
+    def get_snapshot(self, dates):
+        '''
+        position in snapshots of the snapshot every date takes its members from, -1 before the first
+        '''
+        return self.snapshots.searchsorted(pd.to_datetime(np.asarray(dates)), 'right') - 1
+    
+    def members(self, dates):
+        '''
+        IDs in on a date (Index), or ( DATE, ID ) of every member on every date of an array-like,
+        in the order of dates, IDs sorted within a date
+        '''
+        k = self.get_snapshot(np.atleast_1d(dates))
+        lo = np.where(k >= 0, self.snap_start[np.maximum(k, 0)], 0)
+        n = np.where(k >= 0, self.snap_start[k + 1] - lo, 0)
+        rows = np.repeat(lo - np.cumsum(n) + n, n) + np.arange(n.sum())
+        ids = self.ids[self.snap_id[rows]]
+        if np.ndim(dates) == 0:
+            return ids
+        return pd.DataFrame({self.date_col: np.repeat(np.asarray(dates), n), self.id_col: ids})
+    
+    def is_member(self, ids, dates):
+        '''
+        bool of every ( ids[n], dates[n] ), a binary search of the intervals each
+        '''
+        i = self.ids.get_indexer(np.asarray(ids))
+        k = self.get_snapshot(dates)
+        pos = self.key.searchsorted(i * (len(self.snapshots) + 1) + k, 'right') - 1
+        at = np.maximum(pos, 0)
+        return (i >= 0) & (k >= 0) & (pos >= 0) & (self.id_code[at] == i) & (k < self.k_to[at])
+    
+    def to_panel(self, dates, ids=None):
+        '''
+        ID, DATE, index ( In / Out ) of every ID (all IDs of the snapshots if None)
+        on every date, sorted by ID and DATE
+        '''
+        dates = np.sort(pd.unique(np.asarray(dates)))
+        ids = self.ids if ids is None else pd.Index(np.sort(pd.unique(np.asarray(ids))))
+        panel = pd.DataFrame({self.id_col: np.repeat(ids.to_numpy(), len(dates)),
+                              self.date_col: np.tile(dates, len(ids))})
+        panel['index'] = np.where(self.is_member(panel[self.id_col], panel[self.date_col]), 'In', 'Out')
+        return panel
+
 def get_data(bq, security, fields):
     import bql
     request =  bql.Request(security, fields)
@@ -132,14 +286,17 @@ def get_data(bq, security, fields):
     df = bql.combined_df(response)
     return df
 
-def download_incremental(bq, ticker, func, start_date, end_date, steps=1, **kwargs):
+def download_incremental(bq, ticker, func, start_date, end_date, steps=1, max_workers=1, **kwargs):
+    '''
+    func(bq, ticker, start, end, **kwargs) of every chunk of steps years, max_workers chunks at a time
+    '''
     start_year = int(start_date.split('-')[0])
     end_year = int(end_date.split('-')[0])
     
     steps = min(end_year-start_year, steps)
     if start_year != end_year:
         years = list(range(start_year, end_year+1, steps))  
-        df_list = []
+        chunks = []
         for y in range(len(years)-1):
             if years[y+1] != years[-1]:
                 end = '{}-12-31'.format(years[y+1]-1)
@@ -150,12 +307,204 @@ def download_incremental(bq, ticker, func, start_date, end_date, steps=1, **kwar
                 start=start_date
             else:
                 start = '{}-01-01'.format(years[y])
-                
-#             print('1.', start, end)
-            df = func(bq, ticker, start, end, **kwargs)
-            df_list.append(df)
+            chunks.append((start, end))
 
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            df_list = list(pool.map(lambda x: func(bq, ticker, x[0], x[1], **kwargs), chunks))
         return pd.concat(df_list)
     else:
-#         print('2.', start_date, end_date)
-        return func(bq, ticker, start_date, end_date, **kwargs)
\ No newline at end of file
+        return func(bq, ticker, start_date, end_date, **kwargs)
+
+def bql_fetch(bq, get_fields, dropna=True):
+    '''
+    fetch(ids, start, end) of ChunkedDownloader from bql
+    
+    get_fields(bq, start, end): {name: bql data item of the range}
+    dropna: leave out the rows with a missing field
+    '''
+    def fetch(ids, start, end):
+        df = get_data(bq, ids, get_fields(bq, start, end)).reset_index()
+        return df.dropna() if dropna else df
+    return fetch
+
+class ChunkedDownloader:
+    '''
+    Download of ( ID, DATE | fields ) in ( ID batch, year ) chunks, max_workers chunks at a time,
+    into a local cache so a range of an ID is only downloaded once.
+    
+        cache_dir/<field>/<year>.parquet           ID, DATE, <field>
+        cache_dir/<field>/<year>.ranges.parquet    ID, start, end already downloaded
+    
+    Only the days of the request not downloaded yet for every field are fetched, the IDs
+    missing the same days share a chunk. Without cache_dir every chunk is fetched.
+    A chunk is recorded as downloaded up to its end, even with no rows (sparse fields
+    such as cash_divs), but never past the day before as_of: today and later days are
+    fetched again.
+    
+    fetch(ids, start, end) returns ( ID, DATE, fields ... ) of the ids between start and
+    end (iso dates, inclusive), e.g. bql_fetch(bq, get_fields), or a stand-in in tests.
+    
+    >>> dl = ChunkedDownloader(bql_fetch(bq, get_price_vol), ['px_last', 'volume'], 'bql_cache')
+    >>> df = dl.download(univ, '2015-01-01', '2021-12-31')
+    >>> df = dl.download(univ, '2015-01-01', '2022-03-31')     # fetches 2022 only
+    '''
+    def __init__(self, fetch, fields, cache_dir=None, batch_size=200, max_workers=4, id_col='ID', date_col='DATE',
+                 as_of=None):
+        '''
+        as_of: today, only the days before it can be complete (default the current date)
+        '''
+        self.fetch = fetch
+        self.fields = list(fields)
+        self.cache_dir = cache_dir
+        self.as_of = as_of
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.id_col = id_col
+        self.date_col = date_col
+    
+    def get_file(self, field, year, kind=''):
+        return os.path.join(self.cache_dir, field, '{}{}.parquet'.format(year, kind))
+    
+    def read_file(self, file, columns):
+        if self.cache_dir is None or not os.path.exists(file):
+            # typed, so an empty file concatenated with new rows keeps the dates as dates
+            return pd.DataFrame({c: pd.Series(dtype='datetime64[ns]' if c in (self.date_col, 'start', 'end') 
+                                              else object if c == self.id_col else float) for c in columns})
+        return pd.read_parquet(file)
+    
+    def write_file(self, df, file):
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        tmp = os.path.join(os.path.dirname(file), '.{}.tmp'.format(uuid.uuid4().hex))
+        try:
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, file)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    
+    def get_missing(self, ids, days, year):
+        '''
+        ids x days, True where a field of the ( ID, day ) is not downloaded yet
+        '''
+        missing = np.zeros((len(ids), len(days)), dtype=bool)
+        index = pd.Index(ids)
+        for field in self.fields:
+            ranges = self.read_file(self.get_file(field, year, '.ranges'), [self.id_col, 'start', 'end'])
+            i = index.get_indexer(ranges[self.id_col])
+            ranges = ranges[i >= 0]
+            i = i[i >= 0]
+            # +1 from start to end of every range, covered where the running sum is positive
+            count = np.zeros((len(ids), len(days) + 1), dtype=np.int32)
+            np.add.at(count, (i, days.searchsorted(pd.to_datetime(ranges['start']))), 1)
+            np.add.at(count, (i, days.searchsorted(pd.to_datetime(ranges['end']), 'right')), -1)
+            missing |= np.cumsum(count, axis=1)[:, :-1] <= 0
+        return missing
+    
+    def get_chunks(self, ids, start, end):
+        '''
+        [(ids, start, end)] to fetch, within one year and at most batch_size ids
+        '''
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        chunks = []
+        for year in range(start.year, end.year + 1):
+            days = pd.date_range(max(start, pd.Timestamp(year, 1, 1)), min(end, pd.Timestamp(year, 12, 31)))
+            if not len(days) or not len(ids):
+                continue
+            if self.cache_dir is None:
+                spans = pd.DataFrame({'i': range(len(ids)), 'start': days[0], 'end': days[-1]})
+            else:
+                missing = self.get_missing(ids, days, year)
+                first, last, _ = get_runs(missing.ravel(), np.repeat(np.arange(len(ids)), len(days)))
+                spans = pd.DataFrame({'i': first // len(days),
+                                      'start': days[first % len(days)],
+                                      'end': days[last % len(days)]})
+            for (s, e), i in spans.groupby(['start', 'end'])['i']:
+                i = i.to_numpy()
+                for k in range(0, len(i), self.batch_size):
+                    chunks.append(([ids[j] for j in i[k:k + self.batch_size]], s, e))
+        return chunks
+    
+    def get_covered_end(self, end):
+        '''
+        Last day of a fetched chunk recorded as downloaded: min(end, day before as_of),
+        so today and the future are fetched again. Days without rows before that are
+        complete, a sparse field has none on most days.
+        '''
+        as_of = pd.Timestamp(self.as_of if self.as_of is not None else pd.Timestamp.today()).normalize()
+        return min(pd.Timestamp(end), as_of - pd.Timedelta(days=1))
+    
+    def store(self, done):
+        '''
+        Write the fetched chunks [((ids, start, end), df)] into the field / year files,
+        the ranges up to get_covered_end
+        '''
+        by_year = {}
+        for chunk, df in done:
+            by_year.setdefault(chunk[1].year, []).append((chunk, df))
+        for year, results in by_year.items():
+            for field in self.fields:
+                cols = [self.id_col, self.date_col, field]
+                data = self.read_file(self.get_file(field, year), cols)
+                ranges = self.read_file(self.get_file(field, year, '.ranges'), [self.id_col, 'start', 'end'])
+                new_data, new_ranges = [], []
+                for (ids, s, e), df in results:
+                    # a range fetched again replaces what was stored
+                    again = data[self.id_col].isin(ids) & data[self.date_col].between(s, e)
+                    data = data[~again]
+                    new_data.append(df[cols].dropna(subset=[field]))
+                    covered = self.get_covered_end(e)
+                    if covered >= s:
+                        new_ranges.append(pd.DataFrame({self.id_col: ids, 'start': s, 'end': covered}))
+                data = pd.concat([data] + new_data, ignore_index=True)
+                ranges = pd.concat([ranges] + new_ranges, ignore_index=True) if new_ranges else ranges
+                self.write_file(data, self.get_file(field, year))
+                self.write_file(ranges, self.get_file(field, year, '.ranges'))
+    
+    def run(self, chunks):
+        '''
+        fetch every chunk in the pool, the chunks fetched are stored even if another one fails
+        '''
+        done, error = [], None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self.fetch, ids, s.date().isoformat(), e.date().isoformat()): (ids, s, e)
+                       for ids, s, e in chunks}
+            for f in as_completed(futures):
+                try:
+                    df = f.result().reindex(columns=[self.id_col, self.date_col] + self.fields)
+                except Exception as e:
+                    error = error or e
+                    continue
+                df[self.date_col] = pd.to_datetime(df[self.date_col])
+                done.append((futures[f], df))
+        if self.cache_dir is not None:
+            self.store(done)
+        if error is not None:
+            raise error
+        return done
+    
+    def read(self, ids, start, end):
+        '''
+        ( ID, DATE | fields ) of the ids between start and end from the cache
+        '''
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        df = None
+        for field in self.fields:
+            cols = [self.id_col, self.date_col, field]
+            data = pd.concat([self.read_file(self.get_file(field, year), cols)
+                              for year in range(start.year, end.year + 1)], ignore_index=True)
+            data = data[data[self.id_col].isin(ids) & data[self.date_col].between(start, end)]
+            df = data if df is None else df.merge(data, on=[self.id_col, self.date_col], how='outer')
+        return df
+    
+    def download(self, ids, start, end):
+        '''
+        ( ID, DATE | fields ) of the ids between start and end (inclusive), sorted by ID and DATE
+        '''
+        ids = list(dict.fromkeys(ids))
+        done = self.run(self.get_chunks(ids, start, end))
+        if self.cache_dir is None:
+            df = pd.concat([df for _, df in done] or [self.read_file(None, [self.id_col, self.date_col] + self.fields)],
+                           ignore_index=True)
+        else:
+            df = self.read(ids, start, end)
+        return df.sort_values([self.id_col, self.date_col], kind='mergesort').reset_index(drop=True)
@@ -0,0 +1,56 @@
+import time
+import pandas as pd
+
+
+class PhaseTimer:
+    '''
+    Wall time of the backtest phases, per day and in total
+
+        prepare     | get_df_day, hold_buy_sell_df
+        execute     | run (sell, buy, rebalance)
+        mtm         | mark-to-market of the portfolio
+        bookkeeping | update (history, trade ledger)
+
+    A disabled timer does nothing, enable with bt.timer.enabled = True
+    '''
+    phases = ['prepare', 'execute', 'mtm', 'bookkeeping']
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.laps = {}
+        self.totals = dict.fromkeys(self.phases, 0.0)
+        self.last = None
+
+    def start(self):
+        if self.enabled:
+            self.laps = {}
+            self.last = time.perf_counter()
+
+    def lap(self, phase):
+        if self.enabled:
+            now = time.perf_counter()
+            self.laps[phase] = now - self.last
+            self.totals[phase] += now - self.last
+            self.last = now
+
+
+class EventLog:
+    '''
+    Subscriber keeping every day record of a backtest
+
+    >>> log = EventLog()
+    >>> bt.subscribe(log)
+    >>> bt.backtest()
+    >>> log.to_frame()
+    	date	    |   nav    |   cash  | ... | rebal | trans_cost
+        ------------|----------|---------|-----|-------|-----------
+    0	2020-01-02	| 10000.00 | 1000.00 | ... | False |    0.00
+    '''
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, record):
+        self.records.append(record)
+
+    def to_frame(self):
+        return pd.DataFrame(self.records)
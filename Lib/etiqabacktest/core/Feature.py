@@ -7,6 +7,8 @@ from typing import List
 
 class ApplyRule:
     
+    actions = ['hold', 'buy', 'sell', 'na']   # categories of the action column
+    
     @staticmethod
     def get_action_name(a, b):
         """
@@ -21,6 +23,23 @@ class ApplyRule:
             return 'sell'
         else:
             return 'na'
+    
+    @staticmethod
+    def get_action_code(signal, signal_diff):
+        """
+        get_action_name of whole columns, int8 index into ApplyRule.actions
+        """
+        a = np.asarray(signal, dtype=float)
+        b = np.asarray(signal_diff, dtype=float)
+        return np.select([(a==1) & (b==0), (a==1) & (b==2), (a==-1) & (b==-2)], 
+                         [0, 1, 2], 3).astype(np.int8)
+    
+    @staticmethod
+    def to_signal(cond, value):
+        """
+        value where cond is true else NaN, same as cond.map(lambda x: value if x else None)
+        """
+        return pd.Series(np.where(np.asarray(cond, dtype=bool), float(value), np.nan), index=cond.index)
       
     def get_signal(self, df):
         df['signal'] = df['sell_signal'].fillna(df['buy_signal'])
@@ -31,10 +50,9 @@ class ApplyRule:
         @wraps(f)  #take the passed-in-func out from the wrapped() .
         def wrapped(inst, *args, **kwargs):
             df = f(inst, *args, **kwargs)
-            df['signal_diff'] = df.groupby(['ID'])['signal'].diff(periods=1).fillna(2)
-            df['signal_action'] = list(zip(df['signal'], df['signal_diff']))
-            df['action'] = df['signal_action'].map(lambda x: ApplyRule.get_action_name(*x))
-            df = df.drop(['signal_diff', 'signal_action'], axis=1)
+            signal_diff = df.groupby(['ID'])['signal'].diff(periods=1).fillna(2)
+            df['action'] = pd.Categorical.from_codes(ApplyRule.get_action_code(df['signal'], signal_diff), 
+                                                     categories=ApplyRule.actions)
             return df
         return wrapped
     
@@ -53,8 +71,7 @@ class Features:
     def MA(df: pd.DataFrame, col: str, day: int, group=None):
         new_col = 'ma_{}_{}'.format(col.lower().replace('_',''), day)
         if group:
-            df[new_col] = df.groupby(group)[col].rolling(day).mean()\
-                                                    .reset_index().set_index('level_1').drop(group, axis=1)
+            return Features.Rolling(df, [(col, 'mean', day)], group)
         else:
             df[new_col] = df[col].rolling(day).mean()
         return df
@@ -63,8 +80,7 @@ class Features:
     def STDEV(df: pd.DataFrame, col: str, day: int, group=None):
         new_col = 'stdev_{}_{}'.format(col.lower().replace('_',''), day)
         if group:
-            df[new_col] = df.groupby(group)[col].rolling(day).std()\
-                                                    .reset_index().set_index('level_1').drop(group, axis=1)
+            return Features.Rolling(df, [(col, 'std', day)], group)
         else:
             df[new_col] = df[col].rolling(day).std()
         return df
@@ -73,8 +89,7 @@ class Features:
     def MMax(df: pd.DataFrame, col: str, day: int, group=None):
         new_col = 'mmax_{}_{}'.format(col.lower().replace('_',''), day)
         if group:
-            df[new_col] = df.groupby(group)[col].rolling(day).max().reset_index()\
-                             .set_index('level_1').drop(group, axis=1)
+            return Features.Rolling(df, [(col, 'max', day)], group)
         else:
             df[new_col] = df[col].rolling(day).max()
         return df
@@ -83,12 +98,18 @@ class Features:
     def MSum(df: pd.DataFrame, col: str, day: int, group=None):
         new_col = 'msum_{}_{}'.format(col.lower().replace('_',''), day)
         if group:
-            df[new_col] = df.groupby(group)[col].rolling(day).sum().reset_index()\
-                            .set_index('level_1').drop(group, axis=1)
+            return Features.Rolling(df, [(col, 'sum', day)], group)
         else:
-            df[new_col] = df[col].rolling(day).mean()
+            df[new_col] = df[col].rolling(day).sum()
         return df
 
+    @staticmethod
+    def Rolling(df: pd.DataFrame, specs: list, group='ID', date_col=None):
+        '''
+        specs: [(col, op, day)], op mean | std | sum | max | min, see PanelFeatures
+        '''
+        return PanelFeatures(df, group, date_col).add(df, specs)
+
     @staticmethod
     def PctChange(df: pd.DataFrame, col: str, day: int, group=None):
         new_col = 'pctchg_{}_{}'
@@ -98,3 +119,133 @@ class Features:
         else:
             df[[new_col.format(c.lower().replace('_',''), day) for c in col]] = df[col].pct_change(periods=day)
         return df
+
+
+class PanelFeatures:
+    '''
+    Rolling window features of a long panel ( ID, date | col ... ), per ID as
+    df.groupby(group)[col].rolling(day).<op>() with min_periods = day.
+
+    The panel is sorted by group (and date_col) once. Every column is then one pass over
+    the whole sorted array, the IDs being contiguous segments:
+        mean, sum, std | window differences of cumulative sums of the column centred on its ID mean
+        max, min       | block prefix / suffix maxima (van Herk / Gil-Werman), O(n) for any window
+    Windows that reach into the previous ID or hold a NaN are NaN. Results are written
+    back by position, no index realignment.
+
+    >>> df = Features.Rolling(df, [('px_last', 'mean', 20), ('px_last', 'std', 20),
+    ...                            ('volume', 'mean', 5), ('px_last', 'max', 250)])
+    >>> df[['ma_pxlast_20', 'stdev_pxlast_20', 'ma_volume_5', 'mmax_pxlast_250']]
+    '''
+    prefix = {'mean': 'ma', 'std': 'stdev', 'sum': 'msum', 'max': 'mmax', 'min': 'mmin'}
+
+    def __init__(self, df, group='ID', date_col=None):
+        '''
+        group    : ID column(s), rows without one get NaN
+        date_col : sort by date within an ID, else the row order of df is kept as groupby does
+        '''
+        key = df.groupby(group, sort=False).ngroup().to_numpy()
+        if date_col is None:
+            self.order = np.argsort(key, kind='stable')
+        else:
+            self.order = np.lexsort((df[date_col].to_numpy(), key))
+        key = key[self.order]
+        n = len(key)
+        first = np.r_[True, key[1:] != key[:-1]] if n else np.zeros(0, dtype=bool)
+        self.segment = np.cumsum(first) - 1
+        self.pos = np.arange(n) - np.maximum.accumulate(np.where(first, np.arange(n), 0))
+        self.valid = key >= 0
+
+    def add(self, df, specs):
+        by_col = {}
+        for col, op, day in specs:
+            if op not in self.prefix:
+                raise ValueError('op must be one of {}'.format(list(self.prefix)))
+            by_col.setdefault(col, []).append((op, day))
+
+        for col, ops in by_col.items():
+            x = df[col].to_numpy(dtype=float)[self.order]
+            state = self.prepare(x)
+            for op, day in ops:
+                out = np.empty(len(x))
+                out[self.order] = self.rolling(x, state, op, day)
+                df['{}_{}_{}'.format(self.prefix[op], col.lower().replace('_',''), day)] = out
+        return df
+
+    def prepare(self, x):
+        '''
+        Cumulative sums of a sorted column shared by all its windows. Values are centred and
+        scaled per ID, and so are their squares, so the running sums stay small and an ID
+        of large prices does not cost the precision of the next one.
+        '''
+        nan = np.isnan(x)
+        nseg = self.segment[-1] + 1 if len(x) else 0
+        count = np.bincount(self.segment, weights=~nan, minlength=nseg)
+        mean = self.segment_mean(np.where(nan, 0, x), count)
+        dev = np.where(nan, 0, x - mean)
+        scale = np.zeros(nseg)
+        np.maximum.at(scale, self.segment, np.abs(dev))
+        scale = np.where(scale > 0, scale, 1)[self.segment]
+        z = dev / scale
+        q = z*z
+        q_mean = self.segment_mean(q, count)
+        return dict(nan = np.r_[0, np.cumsum(nan)],
+                    s1 = np.r_[0, np.cumsum(z)],
+                    s2 = np.r_[0, np.cumsum(np.where(nan, 0, q - q_mean))],
+                    mean = mean, q_mean = q_mean, scale = scale)
+
+    def segment_mean(self, x, count):
+        total = np.bincount(self.segment, weights=x, minlength=len(count))
+        return np.divide(total, count, out=np.zeros(len(count)), where=count > 0)[self.segment]
+
+    def rolling(self, x, state, op, day):
+        n = len(x)
+        end = np.arange(1, n + 1)
+        begin = np.maximum(end - day, 0)
+        ok = self.valid & (self.pos >= day - 1) & (state['nan'][end] == state['nan'][begin])
+
+        if op in ('mean', 'sum', 'std'):
+            s1 = state['s1'][end] - state['s1'][begin]
+            if op == 'mean':
+                out = s1/day*state['scale'] + state['mean']
+            elif op == 'sum':
+                out = s1*state['scale'] + day*state['mean']
+            else:
+                s2 = state['s2'][end] - state['s2'][begin] + day*state['q_mean']
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    out = np.sqrt(np.maximum(s2 - s1*s1/day, 0)/(day - 1))*state['scale']
+                # a window of one repeated value is exactly 0, as in pandas
+                out[self.run_length(x) >= day] = 0
+                ok &= day > 1
+        elif op == 'max':
+            out = self.sliding_max(np.where(np.isnan(x), -np.inf, x), day)
+        else:
+            out = -self.sliding_max(np.where(np.isnan(x), -np.inf, -x), day)
+        return np.where(ok, out, np.nan)
+
+    def run_length(self, x):
+        '''
+        Number of consecutive equal values of the ID ending at every row
+        '''
+        n = len(x)
+        new = np.r_[True, x[1:] != x[:-1]] | (self.pos == 0) if n else np.zeros(0, dtype=bool)
+        return np.arange(n) - np.maximum.accumulate(np.where(new, np.arange(n), 0)) + 1
+
+    @staticmethod
+    def sliding_max(x, day):
+        '''
+        max of x[i-day+1 : i+1] for i >= day-1, from the max of the block suffix
+        and the next block prefix (blocks of day rows)
+        '''
+        n = len(x)
+        out = np.full(n, np.nan)
+        if n < day:
+            return out
+        blocks = np.full(-(-n // day) * day, -np.inf)
+        blocks[:n] = x
+        blocks = blocks.reshape(-1, day)
+        prefix = np.maximum.accumulate(blocks, axis=1).ravel()
+        suffix = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+        i = np.arange(day - 1, n)
+        out[day - 1:] = np.maximum(suffix[i - day + 1], prefix[i])
+        return out
@@ -0,0 +1,189 @@
+import os
+from collections.abc import Mapping
+import pandas as pd
+import numpy as np
+
+
+class HistoryDay(Mapping):
+    '''
+    One day of BacktestHistory, dict-style like the old self.data[date]
+    The portfolio DataFrame is only rebuilt when asked for.
+    '''
+    fields = ('portfolio', 'cash', 'value', 'trans_cost')
+
+    def __init__(self, history, day):
+        self.history = history
+        self.day = day
+
+    def __getitem__(self, key):
+        if key == 'portfolio':
+            return self.history.get_portfolio(self.day)
+        elif key in self.fields:
+            return self.history.day_data[key][self.day]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+
+class BacktestHistory(Mapping):
+    '''
+    Columnar store of the daily backtest history (self.data)
+
+    Portfolio rows are kept as append-only arrays
+        day | ID code | unit | date | value | px_last
+    with per-day cash, value (nav) and trans_cost, instead of one DataFrame copy per day.
+
+    self.data[date]['portfolio'] / ['cash'] / ['value'] / ['trans_cost'] work as before.
+    '''
+    row_cols = ['day', 'code', 'unit', 'date', 'value', 'px_last']
+    row_dtypes = {'day': np.int32, 'code': np.int32, 'unit': float,
+                  'date': 'datetime64[ns]', 'value': float, 'px_last': float}
+    day_cols = ['cash', 'value', 'trans_cost']
+
+    def __init__(self):
+        self.dates = []
+        self.day_index = {}
+        self.offsets = [0]
+        self.day_data = {c: [] for c in self.day_cols}
+        self.ids = []
+        self.id_codes = {}
+        self.chunks = {c: [] for c in self.row_cols}
+        self.rows = None
+        self.path = None
+        self.fmt = None
+
+    def __getitem__(self, date):
+        return HistoryDay(self, self.day_index[date])
+
+    def __iter__(self):
+        return iter(self.dates)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __contains__(self, date):
+        return date in self.day_index
+
+    def get_codes(self, index):
+        codes = np.empty(len(index), dtype=np.int32)
+        for i, ID in enumerate(index):
+            if ID not in self.id_codes:
+                self.id_codes[ID] = len(self.ids)
+                self.ids.append(ID)
+            codes[i] = self.id_codes[ID]
+        return codes
+
+    def append(self, date, pdf, cash, value, trans_cost):
+        '''
+        pdf : portfolio of the day, DataFrame or ArrayPortfolio ( ID | unit, date, value, px_last )
+        '''
+        if self.path is not None:
+            raise ValueError('History has been spilled to {}, it is read-only'.format(self.path))
+
+        day = len(self.dates)
+        n = pdf.shape[0]
+        self.dates.append(date)
+        self.day_index[date] = day
+        self.offsets.append(self.offsets[-1] + n)
+        for c, v in zip(self.day_cols, [cash, value, trans_cost]):
+            self.day_data[c].append(v)
+
+        self.chunks['day'].append(np.full(n, day, dtype=np.int32))
+        self.chunks['code'].append(self.get_codes(pdf.index))
+        self.chunks['date'].append(pd.to_datetime(pdf['date']).to_numpy(dtype='datetime64[ns]'))
+        for c in ['unit', 'value', 'px_last']:
+            self.chunks[c].append(np.asarray(pdf[c], dtype=float))
+
+    def extend(self, dates, pdf, px_last, value, cash, nav, trans_cost):
+        '''
+        Days on which only the prices moved, the same holdings marked to market
+        px_last, value : ( day x holding ) matrices in pdf row order
+        cash           : cash of every day
+        nav, trans_cost: one per day
+        '''
+        if self.path is not None:
+            raise ValueError('History has been spilled to {}, it is read-only'.format(self.path))
+
+        m, n = len(dates), pdf.shape[0]
+        first = len(self.dates)
+        for i, date in enumerate(dates):
+            self.dates.append(date)
+            self.day_index[date] = first + i
+            self.offsets.append(self.offsets[-1] + n)
+        self.day_data['cash'].extend([cash] * m)
+        self.day_data['value'].extend(nav)
+        self.day_data['trans_cost'].extend(trans_cost)
+
+        self.chunks['day'].append(np.repeat(np.arange(first, first + m, dtype=np.int32), n))
+        self.chunks['code'].append(np.tile(self.get_codes(pdf.index), m))
+        self.chunks['date'].append(np.tile(pd.to_datetime(pdf['date']).to_numpy(dtype='datetime64[ns]'), m))
+        self.chunks['unit'].append(np.tile(np.asarray(pdf['unit'], dtype=float), m))
+        self.chunks['value'].append(np.asarray(value, dtype=float).ravel())
+        self.chunks['px_last'].append(np.asarray(px_last, dtype=float).ravel())
+
+    def get_rows(self):
+        '''
+        Consolidate the appended chunks into one array per column
+        '''
+        if self.rows is None:
+            self.rows = {}
+        for c in self.row_cols:
+            if self.chunks[c]:
+                arrays = ([self.rows[c]] if c in self.rows else []) + self.chunks[c]
+                self.rows[c] = np.concatenate(arrays)
+                self.chunks[c] = []
+            elif c not in self.rows:
+                self.rows[c] = np.array([], dtype=self.row_dtypes[c])
+        return self.rows
+
+    def get_portfolio(self, day):
+        '''
+        Portfolio of the day in the columns of _create_empty_pdf ( ID | unit, date, px_last, value )
+        '''
+        s, e = self.offsets[day], self.offsets[day+1]
+        if self.path is not None and self.fmt == 'parquet':
+            rows = pd.read_parquet(os.path.join(self.path, 'rows.parquet'),
+                                   filters=[('day', '==', day)])
+            rows = {c: rows[c].to_numpy() for c in self.row_cols}
+            s, e = 0, len(rows['day'])
+        else:
+            rows = self.get_rows()
+        ids = np.asarray(self.ids, dtype=object)
+        return pd.DataFrame({'unit': rows['unit'][s:e],
+                             'date': rows['date'][s:e],
+                             'px_last': rows['px_last'][s:e],
+                             'value': rows['value'][s:e]},
+                            index=pd.Index(ids[rows['code'][s:e]], dtype=object))
+
+    def get_summary(self):
+        '''
+        	date	    |   cash   |   value  | trans_cost
+            ------------|----------|----------|-----------
+        0	2020-01-02	| 10000.00 | 10000.00 |    0.00
+        '''
+        summary = pd.DataFrame(self.day_data, columns=self.day_cols)
+        summary.insert(0, 'date', self.dates)
+        return summary
+
+    def spill(self, path, fmt='npy'):
+        '''
+        Write the portfolio rows to path and drop them from memory.
+        fmt : 'npy'     - one .npy per column, read back memory-mapped
+              'parquet' - rows.parquet (needs pyarrow), each day read back on demand
+        '''
+        rows = self.get_rows()
+        os.makedirs(path, exist_ok=True)
+        if fmt == 'npy':
+            for c in self.row_cols:
+                np.save(os.path.join(path, c + '.npy'), rows[c])
+            self.rows = {c: np.load(os.path.join(path, c + '.npy'), mmap_mode='r') for c in self.row_cols}
+        elif fmt == 'parquet':
+            pd.DataFrame(rows).to_parquet(os.path.join(path, 'rows.parquet'), index=False)
+            self.rows = None
+        else:
+            raise ValueError('fmt must be npy or parquet')
+        self.path, self.fmt = path, fmt
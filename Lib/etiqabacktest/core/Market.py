@@ -0,0 +1,71 @@
+import pandas as pd
+import numpy as np
+
+
+class MarketData:
+    '''
+    Dense ( date x ID ) matrices of the market columns of action_df, built once,
+    so the daily price lookups are fancy indexing on integer codes.
+
+              | S001 | S002 | S003
+        ------|------|------|------
+        day 0 | 2.10 | 5.55 |  NaN
+        day 1 | 2.12 | 5.50 | 0.95
+
+    present[day, code] : the ID has a row on the day. An ID without one (suspended,
+    not listed yet, delisted) has no price that day and is left out of a lookup,
+    as the inner merge on self.df_day did.
+    '''
+    def __init__(self, df, day_slices, cols):
+        '''
+        df         : action_df sorted by date
+        day_slices : {date: (start, end)} row range of every date in df
+        cols       : market columns to keep, e.g. px_last, avg_5_value, volume
+        '''
+        self.ids = pd.Index(np.sort(df['id'].unique()), dtype=object)
+        self.day_index = {d: i for i, d in enumerate(day_slices)}
+        counts = [e - s for s, e in day_slices.values()]
+        day = np.repeat(np.arange(len(counts)), counts)
+        code = self.ids.get_indexer(df['id'])
+
+        shape = (len(counts), len(self.ids))
+        self.present = np.zeros(shape, dtype=bool)
+        self.present[day, code] = True
+        self.values = {}
+        for c in cols:
+            self.values[c] = np.full(shape, np.nan)
+            self.values[c][day, code] = df[c].to_numpy(dtype=float)
+
+    def get_day(self, date):
+        '''
+        Row of the date, None if action_df has no row that day
+        '''
+        return self.day_index.get(pd.Timestamp(date))
+
+    def lookup(self, day, index, cols):
+        '''
+        index : IDs to look up on the day
+        Returns mask over index (ID has a row on the day) and {col: values of the masked IDs}
+        '''
+        codes = self.ids.get_indexer(index)
+        if day is None:
+            mask = np.zeros(len(codes), dtype=bool)
+        else:
+            mask = (codes >= 0) & self.present[day, codes]
+        codes = codes[mask]
+        return mask, {c: self.values[c][day, codes] if len(codes) else np.array([]) for c in cols}
+
+    def same_rows(self, df, day_slices):
+        '''
+        df ( sorted by date, day_slices as in __init__ ) has exactly the rows and
+        market values of these matrices, so it can share them
+        '''
+        if list(day_slices) != list(self.day_index) or len(df) != self.present.sum():
+            return False
+        counts = [e - s for s, e in day_slices.values()]
+        day = np.repeat(np.arange(len(counts)), counts)
+        code = self.ids.get_indexer(df['id'])
+        if (code < 0).any() or not self.present[day, code].all():
+            return False
+        return all(np.array_equal(self.values[c][day, code], df[c].to_numpy(dtype=float), equal_nan=True)
+                   for c in self.values if c in df)
@@ -0,0 +1,117 @@
+import pandas as pd
+
+
+class MultiBackTest:
+    '''
+    Several strategies on the same universe and prices, e.g. every OneStyleRule style and
+    MultiStyleRule with 2, 3 and 4 styles, advanced together day by day.
+
+    The market matrices (MarketData) are built once from the first action frame and shared,
+    the other frames are cut down to the columns the engine reads from action_df, so only
+    the portfolio state, history and trade ledger grow with the number of strategies.
+    The frames are aligned to the union of their ( id, date ) rows first, see align,
+    the prices of a row must be the same in every frame that has it.
+
+    bt_class : engine run day by day, e.g. StyleBackTest, StyleBackTestLeftover, BackTesting
+    action_dfs : {name: action_df} or list of action_df (named 0, 1, ...)
+    kwargs : constructor arguments of every strategy (initial_capital, cash_reserve_ratio ...)
+
+    >>> mbt = MultiBackTest(StyleBackTestLeftover, {'value': value_df, 'value+quality': vq_df},
+    ...                     stock_index_df, trading_dates)
+    >>> mbt.backtest()
+    >>> mbt.get_summary()
+    	name	        |    date    |   value
+        ----------------|------------|------------
+    0	value	        | 2020-01-02 | 10000000.00
+    '''
+    def __init__(self, bt_class, action_dfs, stock_index_df, trading_dates, **kwargs):
+        if not isinstance(action_dfs, dict):
+            action_dfs = dict(enumerate(action_dfs))
+        if not action_dfs:
+            raise ValueError('No action_df to backtest')
+
+        self.backtests = {}
+        market = None
+        for name, action_df in self.align(action_dfs, bt_class.market_cols).items():
+            if market is not None:
+                action_df = action_df[[c for c in self.engine_cols(bt_class) if c in action_df]]
+            try:
+                bt = bt_class(action_df, stock_index_df, trading_dates, market=market, **kwargs)
+            except ValueError as e:
+                raise ValueError('{}: {}'.format(name, e)) from e
+            # strategies print over each other, listen with subscribe instead
+            bt.mute()
+            market = bt.market
+            self.backtests[name] = bt
+        self.market = market
+
+    @staticmethod
+    def align(action_dfs, market_cols):
+        '''
+        Every action_df on the union of the ( id, date ) rows of all of them.
+        A row missing from a frame, e.g. the rows without position or call that
+        StyleRule keep_na=False leaves out, is added as action na, signal -1 with the
+        market columns of the first frame that has it, as keep_na=True would give it.
+        '''
+        keys = pd.concat([df[['id', 'date']] for df in action_dfs.values()]).drop_duplicates()
+        if all(len(df) == len(keys) for df in action_dfs.values()):
+            return action_dfs
+
+        rows = pd.concat([df[['id', 'date'] + [c for c in market_cols if c in df]] for df in action_dfs.values()])
+        rows = rows.drop_duplicates(['id', 'date'])
+        aligned = {}
+        for name, df in action_dfs.items():
+            missing = rows.merge(df[['id', 'date']], how='left', indicator=True)
+            missing = missing[missing['_merge'] == 'left_only'].drop(columns='_merge')
+            missing = missing[['id', 'date'] + [c for c in market_cols if c in df and c in missing]]
+            if len(missing):
+                missing = missing.assign(signal=-1, action='na')
+                df = pd.concat([df, missing], ignore_index=True)
+                df['action'] = df['action'].astype(action_dfs[name]['action'].dtype)
+            aligned[name] = df
+        return aligned
+
+    @staticmethod
+    def engine_cols(bt_class):
+        '''
+        Columns of action_df an engine reads itself, market lookups go to MarketData
+        '''
+        cols = ['id', 'date', 'signal', 'action'] + list(bt_class.buy_cols)
+        if hasattr(bt_class, 'cap_col'):
+            cols.append(bt_class.cap_col)
+        return list(dict.fromkeys(cols))
+
+    def __getitem__(self, name):
+        return self.backtests[name]
+
+    def __iter__(self):
+        return iter(self.backtests)
+
+    def __len__(self):
+        return len(self.backtests)
+
+    def subscribe(self, callback):
+        '''
+        callback(name, record) at the end of every strategy's trading day
+        '''
+        for name, bt in self.backtests.items():
+            bt.subscribe(lambda record, name=name: callback(name, record))
+
+    def backtest(self):
+        backtests = list(self.backtests.values())
+        for bt in backtests:
+            bt.begin()
+        for k, date in backtests[0].trading_days():
+            for bt in backtests:
+                bt.run_day(k, date)
+
+    def get_summary(self):
+        '''
+        name | date, value ... of every strategy
+        '''
+        return pd.concat({name: bt.get_summary() for name, bt in self.backtests.items()},
+                         names=['name']).reset_index(level=0).reset_index(drop=True)
+
+    def get_trades(self):
+        return pd.concat({name: bt.get_trades() for name, bt in self.backtests.items()},
+                         names=['name']).reset_index(level=0).reset_index(drop=True)
@@ -0,0 +1,209 @@
+'''
+Threshold search of rule parameters (LR_rule, OneFactor_rule, ESG_rule ...)
+
+Every candidate is screened with the vectorized NAV (BasicBackTestVector) in parallel
+worker processes, the best ones by objective are run on the full engine and the
+Pareto set of return vs drawdown of those is reported.
+
+    >>> opt = Optimiser(LR_rule, feature_df, stock_index_df, trading_dates)
+    >>> opt.run(dict(b_score=[0, 0.5, 1], s_score=[-1, -0.5, 0]), method='grid', top=5)
+    >>> opt.run(dict(b_score=(0, 2), s_score=(-2, 0)), method='evolve', population=20, generations=5)
+    >>> opt.screened, opt.confirmed, opt.front
+'''
+import inspect
+import time
+import traceback
+import numpy as np
+import pandas as pd
+from .Sweep import map_shared, param_grid, get_performance
+from ..BasicBacktest import BasicBackTestNoPrint, BasicBackTestVector
+
+
+def get_action_df(shared, params):
+    '''
+    Rule output of params as engine input ( id, date ... ), from shared['cache'] if given
+    '''
+    rule = shared['rule_class'](**{**shared['fixed'], **params})
+    df = shared['feature_df'].copy()
+    if shared['cache'] is not None:
+        df = shared['cache'].run(rule, df)
+    else:
+        df = rule.run(df)
+    return df.rename(columns=shared['rename'])
+
+
+def _evaluate(task, shared):
+    '''
+    task: (i, params, generation, full), full runs shared['bt_class'] else shared['screen_class']
+    '''
+    i, params, generation, full = task
+    start = time.time()
+    try:
+        action_df = get_action_df(shared, params)
+        if full:
+            bt = shared['bt_class'](action_df, shared['stock_index_df'], shared['trading_dates'],
+                                    generation=generation, **shared['bt_kwargs'])
+            if hasattr(bt, 'mute'):
+                bt.mute()
+        else:
+            # the bt_kwargs the screen engine has too (initial_capital, transaction_charge_pct ...)
+            accepted = inspect.signature(shared['screen_class']).parameters
+            kwargs = {k: v for k, v in shared['bt_kwargs'].items() if k in accepted}
+            bt = shared['screen_class'](action_df, shared['stock_index_df'], shared['trading_dates'], **kwargs)
+        bt.backtest()
+        metrics, error = get_performance(bt, shared['rf_df']), None
+    except Exception:
+        metrics, error = {}, traceback.format_exc()
+    return i, metrics, error, time.time() - start
+
+
+def pareto_front(df, ret_col='annualized_ret', dd_col='max_drawdown'):
+    '''
+    Rows not beaten on both return (higher) and drawdown (max_drawdown is negative, higher)
+    '''
+    ret, dd = df[ret_col].to_numpy(dtype=float), df[dd_col].to_numpy(dtype=float)
+    ok = ~(np.isnan(ret) | np.isnan(dd))
+    front = ok.copy()
+    for i in np.flatnonzero(ok):
+        beaten = ok & (ret >= ret[i]) & (dd >= dd[i]) & ((ret > ret[i]) | (dd > dd[i]))
+        front[i] = not beaten.any()
+    return df[front].sort_values(ret_col, ascending=False)
+
+
+class Optimiser:
+    '''
+    rule_class   : ApplyRule subclass, candidates are its constructor parameters
+    feature_df   : rule input, sent once to every worker
+    fixed        : constructor parameters kept as they are, e.g. dict(factor_col='roe')
+    bt_class     : full engine of the shortlist, bt_kwargs its constructor arguments
+    screen_class : fast engine of every candidate
+    objective    : metric of get_performance to rank on (higher is better)
+    cache        : SignalCache, rule outputs already generated are read back
+    rename       : rule output columns to engine columns
+
+    space: {param: list of values | (low, high) range}, ranges are sampled for random / evolve
+    '''
+    def __init__(self, rule_class, feature_df, stock_index_df, trading_dates, fixed=None,
+                 bt_class=BasicBackTestNoPrint, bt_kwargs=None, screen_class=BasicBackTestVector,
+                 objective='annualized_ret', cache=None, rename={'ID': 'id'}, rf_df=None,
+                 max_workers=None, executor='process', seed=0):
+        self.shared = dict(rule_class=rule_class, feature_df=feature_df, stock_index_df=stock_index_df,
+                           trading_dates=trading_dates, fixed=fixed or {}, bt_class=bt_class,
+                           bt_kwargs=bt_kwargs or {}, screen_class=screen_class, cache=cache,
+                           rename=rename, rf_df=rf_df)
+        self.objective = objective
+        self.max_workers = max_workers
+        self.executor = executor
+        self.rng = np.random.default_rng(seed)
+        self.results = {}   # params key: screen row, nothing is screened twice
+        self.screened = None
+        self.confirmed = None
+        self.front = None
+
+    @staticmethod
+    def get_key(params):
+        return tuple(sorted(params.items()))
+
+    def evaluate(self, candidates, full=False, generation=0):
+        '''
+        Run candidates (list of dict) in the pool, generation: one per candidate or for all
+        Returns DataFrame: params, metrics, generation, run_time, error
+        '''
+        if np.ndim(generation) == 0:
+            generation = [generation]*len(candidates)
+        tasks = [(i, params, g, full) for i, (params, g) in enumerate(zip(candidates, generation))]
+        results = map_shared(_evaluate, tasks, self.shared, self.max_workers, self.executor)
+        rows = []
+        for i, metrics, error, run_time in sorted(results, key=lambda x: x[0]):
+            rows.append({**candidates[i], **metrics, 'generation': generation[i],
+                         'run_time': run_time, 'error': error})
+        return pd.DataFrame(rows)
+
+    def screen(self, candidates, generation=0):
+        '''
+        Screen the candidates not screened yet, every screen row so far is kept in self.results
+        '''
+        new = list({self.get_key(p): p for p in candidates if self.get_key(p) not in self.results}.values())
+        if new:
+            for _, row in self.evaluate(new, generation=generation).iterrows():
+                self.results[self.get_key({k: row[k] for k in new[0]})] = row.to_dict()
+        return pd.DataFrame([self.results[self.get_key(p)] for p in candidates])
+
+    def get_score(self, df):
+        if self.objective not in df:
+            return pd.Series(-np.inf, index=df.index)
+        return df[self.objective].astype(float).fillna(-np.inf)
+
+    def sample(self, space, n):
+        candidates = []
+        for _ in range(n):
+            params = {}
+            for k, v in space.items():
+                if isinstance(v, tuple):
+                    params[k] = float(self.rng.uniform(*v))
+                else:
+                    params[k] = v[self.rng.integers(len(v))]
+            candidates.append(params)
+        return candidates
+
+    def grid(self, space):
+        return self.screen(param_grid(**space))
+
+    def random(self, space, n_iter=50):
+        return self.screen(self.sample(space, n_iter))
+
+    def evolve(self, space, population=20, generations=5, mutation=0.2):
+        '''
+        Keep the better half of every generation, refill it with crossovers of two
+        survivors, each parameter mutated with probability mutation
+        (ranges by a normal step of a tenth of the range, lists by a new pick)
+        '''
+        candidates = self.sample(space, population)
+        for g in range(generations):
+            scored = self.screen(candidates, generation=g)
+            order = np.argsort(-self.get_score(scored).to_numpy(), kind='stable')
+            parents = [candidates[i] for i in order[:max(population // 2, 1)]]
+            children = []
+            while len(parents) + len(children) < population:
+                a, b = self.rng.choice(len(parents), 2)
+                child = {k: (parents[a] if self.rng.uniform() < 0.5 else parents[b])[k] for k in space}
+                for k, v in space.items():
+                    if self.rng.uniform() < mutation:
+                        if isinstance(v, tuple):
+                            step = self.rng.normal(0, (v[1] - v[0]) / 10)
+                            child[k] = float(np.clip(child[k] + step, *v))
+                        else:
+                            child[k] = v[self.rng.integers(len(v))]
+                children.append(child)
+            candidates = parents + children
+        return pd.DataFrame(list(self.results.values()))
+
+    def confirm(self, screened, top=5):
+        '''
+        Full engine on the top screened candidates
+        '''
+        best = screened.assign(_score=self.get_score(screened)).sort_values('_score', ascending=False,
+                                                                            kind='mergesort')
+        params = [k for k in screened.columns if k in self.space]
+        best = best[best['error'].isna()].head(top)
+        candidates = [{k: row[k] for k in params} for _, row in best.iterrows()]
+        return self.evaluate(candidates, full=True, generation=best['generation'].tolist())
+
+    def run(self, space, method='grid', top=5, **kwargs):
+        '''
+        method : grid, random (n_iter) or evolve (population, generations, mutation)
+        Sets self.screened (every candidate, vectorized NAV), self.confirmed (top on the
+        full engine) and self.front (Pareto set of confirmed), returns self.front
+        '''
+        self.space = space
+        if method == 'grid':
+            self.screened = self.grid(space)
+        elif method == 'random':
+            self.screened = self.random(space, **kwargs)
+        elif method == 'evolve':
+            self.screened = self.evolve(space, **kwargs)
+        else:
+            raise ValueError('method must be grid, random or evolve')
+        self.confirmed = self.confirm(self.screened, top)
+        self.front = pareto_front(self.confirmed) if 'max_drawdown' in self.confirmed else self.confirmed.iloc[:0]
+        return self.front
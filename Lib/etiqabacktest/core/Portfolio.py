@@ -0,0 +1,286 @@
+import pandas as pd
+import numpy as np
+
+
+class OrderSet:
+    '''
+    Array counterpart of the hdf / bdf / sdf frames used by BackTesting.
+    Each row is an integer security code with the columns carried along.
+
+    codes    : int array, index into the engine's sorted ID list
+    columns  : array per column (date, px_last, unit, value, buy_value ...)
+    '''
+    def __init__(self, codes, **columns):
+        self.codes = np.asarray(codes, dtype=np.int64)
+        self.columns = {c: np.asarray(v) for c, v in columns.items()}
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def shape(self):
+        return (len(self.codes), len(self.columns))
+
+    @property
+    def empty(self):
+        return len(self.codes) == 0
+
+    def __getitem__(self, col):
+        return pd.Series(self.columns[col], copy=False)
+
+    def __setitem__(self, col, value):
+        self.columns[col] = np.broadcast_to(value, self.codes.shape).copy()
+
+    def get(self, col):
+        return self.columns[col]
+
+    def take(self, mask):
+        return OrderSet(self.codes[mask], **{c: v[mask] for c, v in self.columns.items()})
+
+    def append(self, other, cols):
+        return OrderSet(np.concatenate([self.codes, other.codes]),
+                        **{c: np.concatenate([self.columns[c], other.columns[c]]) for c in cols})
+
+
+class ArrayPortfolio:
+    '''
+    Live portfolio kept in NumPy arrays indexed by integer security code
+    instead of a DataFrame filled row by row.
+
+    ids   : sorted pd.Index of every security the engine can hold
+    codes : held securities in the order they entered the portfolio,
+            i.e. the row order of the equivalent pdf DataFrame
+    '''
+    columns = ['unit', 'date', 'value', 'px_last']
+
+    def __init__(self, ids):
+        n = len(ids)
+        self.ids = ids
+        self.codes = np.array([], dtype=np.int64)
+        self.held = np.zeros(n, dtype=bool)
+        self._unit = np.zeros(n)
+        self._date = np.full(n, np.datetime64('NaT'), dtype='datetime64[ns]')
+        self._value = np.zeros(n)
+        self._px_last = np.full(n, np.nan)
+
+    @classmethod
+    def from_frame(cls, ids, pdf):
+        '''
+        pdf : portfolio DataFrame ( ID | unit, date, value, px_last ), IDs must be in ids
+        '''
+        portfolio = cls(ids)
+        portfolio.add(ids.get_indexer(pdf.index),
+                      pdf['unit'].to_numpy(dtype=float),
+                      pd.to_datetime(pdf['date']).to_numpy(dtype='datetime64[ns]'),
+                      pdf['px_last'].to_numpy(dtype=float),
+                      pdf['value'].to_numpy(dtype=float))
+        return portfolio
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def shape(self):
+        return (len(self.codes), len(self.columns))
+
+    @property
+    def index(self):
+        return self.ids[self.codes]
+
+    @property
+    def unit(self):
+        return self._unit[self.codes]
+
+    @property
+    def px_last(self):
+        return self._px_last[self.codes]
+
+    @property
+    def value(self):
+        '''Series so that `.sum()` skips NaN exactly like the pdf column'''
+        return self['value']
+
+    def __getitem__(self, col):
+        return pd.Series(getattr(self, '_' + col)[self.codes], copy=False)
+
+    def to_orders(self, mask=None):
+        codes = self.codes if mask is None else self.codes[mask]
+        return OrderSet(codes,
+                        unit=self._unit[codes],
+                        date=self._date[codes],
+                        value=self._value[codes],
+                        px_last=self._px_last[codes])
+
+    def add(self, codes, unit, date, px_last, value):
+        '''
+        Write rows like `pdf.loc[ID] = [...]`: new codes are appended in order,
+        existing ones keep their position and a repeated code keeps the last row.
+        '''
+        new = codes[~self.held[codes]]
+        if len(new):
+            _, first = np.unique(new, return_index=True)
+            self.codes = np.concatenate([self.codes, new[np.sort(first)]])
+            self.held[new] = True
+        self._unit[codes] = unit
+        self._date[codes] = date
+        self._px_last[codes] = px_last
+        self._value[codes] = value
+
+    def remove(self, codes):
+        self.held[codes] = False
+        self.codes = self.codes[self.held[self.codes]]
+
+    def mark_to_market(self, present, px_last):
+        '''
+        present : bool array over all codes, security traded today
+        px_last : float array over all codes, today's price
+        Holdings missing today are dropped, as get_px_last does, and returned as orders.
+        '''
+        dropped = self.to_orders(~present[self.codes])
+        self.remove(dropped.codes)
+        codes = self.codes
+        self._px_last[codes] = px_last[codes]
+        self._value[codes] = self._unit[codes] * self._px_last[codes]
+        return dropped
+
+    def to_frame(self):
+        codes = self.codes
+        return pd.DataFrame({'unit': self._unit[codes],
+                             'date': self._date[codes],
+                             'value': self._value[codes],
+                             'px_last': self._px_last[codes]},
+                            index=pd.Index(self.ids[codes], dtype=object))
+
+
+class OrderBook:
+    '''
+    Pending orders the liquidity cap left unfilled (leftovers), in arrival order.
+    An ID may have more than one entry.
+
+        ID | side | date | px_last | leftovers | days | invest_value_allocated | value_cap | ...
+
+    side 'buy'  : leftovers is the value still to buy, days its time to live (ldf_days)
+    side 'sell' : unit is the units still to sell, with the date, value, px_last of the holding
+
+    Every operation returns a new book, so the book of a past day never changes.
+    '''
+    def __init__(self, ids=(), side='buy', **columns):
+        self.ids = np.asarray(ids, dtype=object).reshape(-1)
+        self.side = np.broadcast_to(np.asarray(side, dtype=object), self.ids.shape).copy()
+        self.columns = {c: np.asarray(v) for c, v in columns.items()}
+        self._positions = None
+
+    @classmethod
+    def from_frame(cls, df, side='buy'):
+        return cls(df.index.to_numpy(dtype=object), side,
+                   **{c: df[c].to_numpy() for c in df.columns})
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def shape(self):
+        return (len(self.ids), len(self.columns))
+
+    @property
+    def empty(self):
+        return len(self.ids) == 0
+
+    @property
+    def index(self):
+        return pd.Index(self.ids, dtype=object)
+
+    def get(self, col):
+        if col not in self.columns:
+            return np.full(len(self.ids), np.nan)
+        return self.columns[col]
+
+    def __getitem__(self, col):
+        return pd.Series(self.get(col), index=self.index, name=col)
+
+    def __setitem__(self, col, value):
+        self.columns[col] = np.broadcast_to(value, self.ids.shape).copy()
+
+    def positions(self):
+        '''
+        {ID: entry positions}, built once per book
+        '''
+        if self._positions is None:
+            self._positions = {}
+            for i, ID in enumerate(self.ids):
+                self._positions.setdefault(ID, []).append(i)
+        return self._positions
+
+    def contains(self, ids):
+        positions = self.positions()
+        return np.array([ID in positions for ID in ids], dtype=bool)
+
+    def take(self, mask):
+        book = OrderBook(self.ids[mask], **{c: v[mask] for c, v in self.columns.items()})
+        book.side = self.side[mask]
+        return book
+
+    def append(self, other):
+        if len(other) == 0:
+            return self
+        if len(self) == 0:
+            return other
+        cols = list(self.columns) + [c for c in other.columns if c not in self.columns]
+        book = OrderBook(np.concatenate([self.ids, other.ids]),
+                         **{c: np.concatenate([self.get(c), other.get(c)]) for c in cols})
+        book.side = np.concatenate([self.side, other.side])
+        return book
+
+    def side_orders(self, side):
+        return self.take(self.side == side)
+
+    def cancel(self, ids, side=None):
+        '''
+        Drop every entry of ids (of one side only if given), a dict lookup per ID
+        '''
+        keep = np.ones(len(self.ids), dtype=bool)
+        positions = self.positions()
+        for ID in ids:
+            for i in positions.get(ID, ()):
+                if side is None or self.side[i] == side:
+                    keep[i] = False
+        return self if keep.all() else self.take(keep)
+
+    def expire(self):
+        '''
+        Drop buy entries whose time to live ran out
+        '''
+        keep = (self.side != 'buy') | (self.get('days') > 0)
+        return self if keep.all() else self.take(keep)
+
+    def reprice(self, market, day, cols):
+        '''
+        Today's cols (px_last, cap column ...) from MarketData,
+        entries of IDs not traded today are dropped
+        '''
+        mask, values = market.lookup(day, self.ids, cols)
+        book = self.take(mask)
+        for c in cols:
+            book[c] = values[c]
+        return book
+
+    def fill(self, ttl):
+        '''
+        Fill every entry against the day's cap at once
+            buy_value = min(invest_value_allocated, value_cap)
+        Sets buy_value on this batch and returns the entries the cap cut short,
+        with the rest as leftovers and one day less to live (new entries get ttl days).
+        '''
+        allocated, cap = self.get('invest_value_allocated'), self.get('value_cap')
+        self['buy_value'] = np.where(cap < allocated, cap, allocated)
+
+        left = self.take(allocated > cap)
+        days = left.get('days')
+        left['days'] = np.where(np.isnan(days), ttl+1, days) - 1
+        left['leftovers'] = left.get('invest_value_allocated') - left.get('value_cap')
+        return left
+
+    def to_frame(self, cols=None):
+        if cols is None:
+            return pd.DataFrame({'side': self.side, **self.columns}, index=self.index)
+        return pd.DataFrame({c: self.get(c) for c in cols}, index=self.index)
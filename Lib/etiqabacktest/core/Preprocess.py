@@ -1,4 +1,7 @@
+import numpy as np
 import pandas as pd
+from etiqacommon.interval import get_spans
+from etiqacommon.interval import pivot_start_end_by_ID  # re-export, it used to be defined here
 
 id_col = 'ID'
 date_col = 'DATE'
@@ -23,6 +26,8 @@ def process_signal_df(df_calls, price_w_dvd):
     df_calls = stock_with_signals(df_calls)
     df_calls = df_calls.drop(['px_last','cash_divs'], 1, errors='ignore')\
                         .merge(price_w_dvd[[id_col,date_col,'px_last','cash_divs']], on=[id_col,date_col],how='left')
+    # dense again (price_w_dvd keeps cash_divs sparse), it is filled in place below
+    df_calls['cash_divs'] = np.asarray(df_calls['cash_divs'], dtype=float)
     df_calls['px_last'] = df_calls.groupby(id_col)['px_last'].ffill()
     df_calls = price_dvd_adjusted(df_calls)
     
@@ -47,28 +52,68 @@ def stock_with_signals(df_calls):
     df_calls = df_calls[df_calls[id_col].isin(stock_with_calls)].copy()
     return df_calls
 
+def label_periods(df_calls):
+    '''
+    Holding period of every row, counted per ID in row order: a new period starts
+    on a buy, on the row after a sell and on the first row of every ID but the first
+    
+    |   ID  | action | period |
+    |-------|--------|--------|
+    |stock 1|   na   |    0   |
+    |stock 1|   buy  |    1   |
+    |stock 1|  hold  |    1   |
+    |stock 1|  sell  |    1   |
+    |stock 1|   na   |    2   |
+    |stock 2|   buy  |    4   |
+    
+    Returns
+    -------
+    period: ndarray
+        int label of every row, the rows of a period are consecutive rows of one ID
+    order: ndarray
+        positions of the rows sorted by ID (stable), periods are increasing along it
+    '''
+    key = pd.factorize(df_calls[id_col])[0]
+    order = np.argsort(key, kind='stable')
+    key = key[order]
+    is_buy = (df_calls['action'] == 'buy').to_numpy()[order]
+    is_sell = (df_calls['action'] == 'sell').to_numpy()[order]
+    # a buy right after a sell counts twice, as the labels have always been numbered
+    new = is_buy.astype(np.int64) + np.r_[False, is_sell[:-1] | (key[1:] != key[:-1])] if len(key) else is_buy
+    period = np.empty(len(key), dtype=np.int64)
+    period[order] = np.cumsum(new, dtype=np.int64)
+    return period, order
+
 def price_dvd_adjusted(df_calls):
     '''
     Calculate new adjusted price (px_last + cash_divs) when the stock is in buy/hold position
     
+    Periods are labelled by label_periods, px_adjusted is px_last plus the cash_divs paid
+    so far in the period and tot_cash_divs_by_period the period total, on its last row
+    
     Parameters
     ----------
     df_calls: DataFrame
-        stock dataframe with buy sell hold signals and cash_divs column
+        stock dataframe with buy sell hold signals and cash_divs column, sorted by date within ID
     
     Returns
     -------
     df_calls: DataFrame
-        stock dataframe with px_adjusted column added 
+        stock dataframe with period, px_adjusted and tot_cash_divs_by_period columns added 
     '''
-    df_calls['period'] = (df_calls['action'].map(lambda x: 1 if x == "buy" else 0) + \
-                          df_calls['action'].map(lambda x: 1 if x == "sell" else 0).shift().fillna(0)).cumsum()
+    period, order = label_periods(df_calls)
+    df_calls = df_calls.drop('tot_cash_divs_by_period', 1, errors='ignore')
+    df_calls['period'] = period
     fill0 = df_calls['action']!= 'na'
     df_calls.loc[fill0, 'cash_divs'] = df_calls.loc[fill0, 'cash_divs'].fillna(0)
-    df_calls['px_adjusted'] = df_calls.groupby('period')['cash_divs'].cumsum() + df_calls['px_last']
-    cash_divs_by_period = df_calls.groupby('period').agg({'DATE':'last', 'cash_divs':'sum'}).reset_index()\
-                                  .rename(columns={'cash_divs':'tot_cash_divs_by_period'})
-    df_calls = df_calls.drop('tot_cash_divs_by_period',1,errors='ignore').merge(cash_divs_by_period, on=['period','DATE'], how='left')
+    df_calls['px_adjusted'] = df_calls.groupby('period', sort=False)['cash_divs'].cumsum() + df_calls['px_last']
+    
+    divs = df_calls['cash_divs'].to_numpy(dtype=float)
+    total = np.bincount(period, weights=np.where(np.isnan(divs), 0, divs))
+    last = order[np.r_[period[order][1:] != period[order][:-1], True]] if len(period) else order
+    tot = np.full(len(period), np.nan)
+    tot[last] = total[period[last]]
+    df_calls['tot_cash_divs_by_period'] = tot
     return df_calls
 
 def calculate_twrr(df_calls_return, ret_col = 'return'):
@@ -83,41 +128,23 @@ def calculate_twrr(df_calls_return, ret_col = 'return'):
     |stock 1|  1.01  |
     |stock 1|  1.20  |
     '''
-
-    df_calls_return['return+1'] = df_calls_return.apply(lambda x: x[ret_col]+1 if x['action'] not in ['buy','na'] else 1 , 1)
-    df_calls_return['twrr'] = df_calls_return.groupby('ID')['return+1'].cumprod()
+    # no return on the buy day and out of position
+    out = df_calls_return['action'].isin(['buy','na']).to_numpy()
+    df_calls_return['return+1'] = np.where(out, 1, df_calls_return[ret_col] + 1)
+    df_calls_return['twrr'] = df_calls_return.groupby(id_col)['return+1'].cumprod()
     return df_calls_return
     
-def pivot_start_end_by_ID(df, 
-                            col='state', 
-                            date_col='DATE',
-                            start_col = 'start',
-                            end_col = 'end'):
-    '''
-    |   ID  | date | state |      |   ID  | start |  end |
-    |-------|------|-------|      |-------|-------|------|  
-    |stock 1|  a   | stay  |      |stock 1|   b   |   e  |
-    |stock 1|  b   | start | ---> |stock 2|   f   |   m  |
-    |stock 1| ..   |  ...  |
-    |stock 1|  e   | end   |
-    
-    '''
-    df = df[(df[col]==end_col) | (df[col] == start_col)][[col,'ID',date_col]].copy()
-    df['index'] = df.groupby(id_col)[date_col].apply(lambda x: (x.rank()-1)//2)
-    df = pd.pivot_table(df, values= date_col,columns=col,index=['index',id_col], aggfunc='first')[[start_col,end_col]].reset_index()
-    return df.drop('index',1).sort_values(id_col)
-
 def calculate_total_ret(df_calls, date_col = 'DATE', price_col = 'px_last'):
     '''
-    Price return
+    Price return, a position still held is valued at the last price of the ID
     
         [Out]
     |   ID  |total_return|
     |-------|------------|
     |stock 1|    2.345   |
     '''
-    df_calls_hori = pivot_start_end_by_ID(df_calls, col='action', start_col='buy', end_col='sell')
-    df_calls_hori = df_calls_hori.fillna(df_calls[date_col].max())
+    df_calls_hori = get_spans(df_calls, 'action', id_col, date_col, start='buy', end='sell', open_end='last')\
+                        .rename(columns={'start':'buy', 'end':'sell'})[[id_col, 'buy', 'sell']]
     
     df_calls_hori = df_calls_hori\
         .merge(df_calls[[id_col,date_col,price_col]].rename(columns={price_col:'sell_price',date_col:'sell'}), on=[id_col,'sell'], how='left')\
@@ -0,0 +1,159 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import product
+import multiprocessing
+import time
+import traceback
+import pandas as pd
+from .Performance import drawdown, annualize_rets, annualize_vol, backtest_performance_metrics_monthly
+
+init_params = ['initial_capital', 'cash_reserve_ratio', 'transaction_charge_pct', 'stock_cap_ratio', 'generation']
+
+### Read-only inputs of the sweep, set once per worker process ###
+_shared = {}
+
+
+def param_grid(**kwargs):
+    '''
+    >>> param_grid(cash_reserve_ratio=[0, 0.05], cap_amt=[0.03, 0.1])
+    [{'cash_reserve_ratio': 0, 'cap_amt': 0.03}, {'cash_reserve_ratio': 0, 'cap_amt': 0.1}, ...]
+    '''
+    keys = list(kwargs)
+    return [dict(zip(keys, values)) for values in product(*[kwargs[k] for k in keys])]
+
+
+def get_performance(bt, rf_df=None, periods_per_year=252):
+    '''
+    Metrics of a finished backtest.
+    rf_df: DataFrame ( date | opr ), monthly metrics from backtest_performance_metrics_monthly if given
+    '''
+    rdf = bt.get_summary()[['date', 'value']]
+    rdf['date'] = pd.to_datetime(rdf['date'])
+    if rf_df is not None:
+        return backtest_performance_metrics_monthly(rdf, rf_df).iloc[0].to_dict()
+
+    ret = rdf['value'].pct_change().dropna()
+    return dict(max_drawdown = drawdown(ret)['Drawdown'].min()*100,
+                annualized_ret = annualize_rets(ret, periods_per_year)*100,
+                annualized_vol = annualize_vol(ret, periods_per_year)*100,
+                total_return = (rdf['value'].iloc[-1] / rdf['value'].iloc[0] -1)*100)
+
+
+def run_backtest(bt_class, action_df, stock_index_df, trading_dates, params, rf_df=None):
+    '''
+    One backtest run with params split into constructor arguments
+    (cash_reserve_ratio, stock_cap_ratio ...) and class settings (cap_amt, ldf_days ...)
+    '''
+    bt = bt_class(action_df, stock_index_df, trading_dates,
+                  **{k: v for k, v in params.items() if k in init_params})
+    for k, v in params.items():
+        if k not in init_params:
+            if not hasattr(bt, k):
+                raise AttributeError('{} has no setting {}'.format(bt_class.__name__, k))
+            setattr(bt, k, v)
+
+    if hasattr(bt, 'mute'):
+        bt.mute()
+    bt.backtest()
+    return get_performance(bt, rf_df)
+
+
+def _init_worker(shared):
+    if shared is not None:
+        _shared.update(shared)
+
+
+def _call(func, task, shared=None):
+    return func(task, _shared if shared is None else shared)
+
+
+def map_shared(func, tasks, shared, max_workers=None, executor='process'):
+    '''
+    [func(task, shared) for task in tasks] across a process or thread pool,
+    shared (read-only inputs) is sent once per worker process, not once per task.
+    func must be a module level function for the process pool.
+    '''
+    tasks = list(tasks)
+    if max_workers == 1:
+        return [func(task, shared) for task in tasks]
+    elif executor == 'thread':
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(_call, [func]*len(tasks), tasks, [shared]*len(tasks)))
+    elif executor == 'process':
+        # forked workers inherit _shared, otherwise it is pickled once per worker, not per task
+        fork = multiprocessing.get_start_method() == 'fork'
+        _shared.update(shared)
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                     initargs=(None if fork else shared,)) as pool:
+                return list(pool.map(_call, [func]*len(tasks), tasks))
+        finally:
+            _shared.clear()
+    else:
+        raise ValueError('executor must be process or thread')
+
+
+def _run_task(task, shared):
+    i, params = task
+    start = time.time()
+    try:
+        metrics, error = run_backtest(shared['bt_class'], shared['action_df'], shared['stock_index_df'],
+                                      shared['trading_dates'], params, shared['rf_df']), None
+    except Exception:
+        metrics, error = {}, traceback.format_exc()
+    return i, metrics, error, time.time() - start
+
+
+def run_sweep(bt_class, action_df, stock_index_df, trading_dates, params, rf_df=None, max_workers=None,
+              executor='process'):
+    '''
+    Run one backtest per parameter set across a process or thread pool
+
+    Parameters
+    ----------
+    bt_class: BackTesting subclass, e.g. StyleBackTestNoPrint
+    action_df, stock_index_df, trading_dates: shared by every run
+    params: list of dict, or dict of lists expanded with param_grid
+    rf_df: optional DataFrame ( date | opr ) for monthly metrics
+    max_workers: pool size, 1 runs in this process
+    executor: 'process', or 'thread' to run in this process (inputs are not copied)
+
+    Returns
+    -------
+    DataFrame: one row per parameter set, parameter columns, metric columns,
+               run_time and error (traceback of a failed run, else None)
+
+    Examples
+    --------
+    >>> res = run_sweep(StyleBackTestNoPrint, action_df, stock_index_df, trading_dates,
+    ...                 dict(cash_reserve_ratio=[0, 0.05], cap_amt=[0.03, 0.1], ldf_days=[3, 9]))
+    '''
+    if isinstance(params, dict):
+        params = param_grid(**params)
+    shared = dict(bt_class=bt_class, action_df=action_df, stock_index_df=stock_index_df,
+                  trading_dates=trading_dates, rf_df=rf_df)
+
+    results = map_shared(_run_task, enumerate(params), shared, max_workers, executor)
+
+    rows = []
+    for i, metrics, error, run_time in sorted(results, key=lambda x: x[0]):
+        rows.append({**params[i], **metrics, 'run_time': run_time, 'error': error})
+    return pd.DataFrame(rows)
+
+
+def run_threads(backtests, max_workers=None):
+    '''
+    Run already built backtests side by side in a thread pool of this process.
+    Every instance keeps its own state, they are muted so their output does not mix.
+
+    >>> bts = [StyleBackTestNoPrint(action_df, stock_index_df, trading_dates, cash_reserve_ratio=r)
+    ...        for r in [0, 0.05, 0.1]]
+    >>> run_threads(bts)
+    >>> [bt.get_summary() for bt in bts]
+    '''
+    for bt in backtests:
+        if hasattr(bt, 'mute'):
+            bt.mute()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # list() re-raises the first failed run
+        list(pool.map(lambda bt: bt.backtest(), backtests))
+    return backtests
@@ -4,6 +4,7 @@ import plotly.graph_objects as go
 import plotly.express as px
 from ipywidgets import VBox, HBox, Layout, HTML
 import pandas as pd
+from etiqacommon.interval import get_spans
 
 id_col = 'ID'
 date_col = 'DATE'
@@ -69,9 +70,13 @@ def plot_annual_return(rdf,quant_label='JIN', index_label="KLCI"):
     return adf, fig
 
 def highlight_px_graph(df, title='', fig=None):
+    '''
+    Price of one stock with its buy / sell calls and holding periods,
+    df without an ID column is taken as a single series
+    '''
     df[date_col] = df[date_col].map(lambda x: x.date().isoformat())
-    df_hori = df.query('action != "na"').groupby('period').agg({date_col:['first','last']}).reset_index()
-    df_hori.columns = [j if j else i for i,j in df_hori.columns]
+    group = id_col if id_col in df else None
+    df_hori = get_spans(df, 'action', group, date_col, start='buy', end='sell', open_end='last')
     
     if not fig:
         fig = go.Figure()
@@ -96,7 +101,7 @@ def highlight_px_graph(df, title='', fig=None):
                     fillcolor='lightskyblue',
                     opacity=0.5,
                     layer="below",
-                ) for start, end in df_hori[['first','last']].values]
+                ) for start, end in df_hori[['start','end']].values]
 
     fig.update_layout(title=title, shapes=shapes, xaxis_showgrid = False, template='plotly_dark')
     return fig
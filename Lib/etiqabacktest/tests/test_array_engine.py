@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+from etiqabacktest.core.Benchmark import make_data
+from etiqabacktest.BasicBacktest import BasicBackTest, BasicBackTestArray
+from etiqabacktest.StyleBacktest import StyleBackTest, StyleBackTestArray
+
+
+@pytest.fixture(scope='module')
+def data():
+    return make_data(50, 120, missing=0.02, seed=3)
+
+
+def run(cls, data):
+    bt = cls(*data, cash_reserve_ratio=0.02)
+    bt.mute()
+    bt.backtest()
+    return bt
+
+
+@pytest.mark.parametrize('frame_cls, array_cls', [(BasicBackTest, BasicBackTestArray),
+                                                  (StyleBackTest, StyleBackTestArray)])
+def test_array_engine_matches_frame_engine(data, frame_cls, array_cls):
+    expected, result = run(frame_cls, data), run(array_cls, data)
+
+    pd.testing.assert_frame_equal(result.get_summary(), expected.get_summary(), check_exact=False, rtol=1e-12)
+    pd.testing.assert_frame_equal(result.get_trades(), expected.get_trades(), check_exact=False, rtol=1e-12)
+
+    assert list(result.data) == list(expected.data)
+    for date in expected.data:
+        pd.testing.assert_frame_equal(result.data[date]['portfolio'].sort_index(),
+                                      expected.data[date]['portfolio'].sort_index(),
+                                      check_exact=False, rtol=1e-12, check_index_type=False)
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+from etiqabacktest.core.Benchmark import make_data
+from etiqabacktest.core.Cache import SignalCache
+from etiqabacktest.core.Feature import ApplyRule
+from etiqabacktest.LRRule import OneFactor_rule
+
+
+class WeightedRule(ApplyRule):
+    '''
+    Rule with a frame parameter
+    '''
+    def __init__(self, weights, b_score=0):
+        self.weights = weights
+        self.b_score = b_score
+
+    @ApplyRule.get_action
+    def run(self, df):
+        score = df['ID'].map(self.weights['weight']) * df['score']
+        df['buy_signal'] = self.to_signal(score > self.b_score, 1)
+        df['sell_signal'] = self.to_signal(score <= self.b_score, -1)
+        return self.get_signal(df)
+
+
+@pytest.fixture(scope='module')
+def feature_df():
+    action_df, _, _ = make_data(20, 40, seed=7)
+    df = action_df[['id', 'date', 'px_last']].rename(columns={'id': 'ID'})
+    df['score'] = df.groupby('ID')['px_last'].pct_change(3).fillna(0)*100
+    return df
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'pickle'])
+def test_hit_same_as_run(tmp_path, feature_df, fmt):
+    cache = SignalCache(str(tmp_path), fmt=fmt)
+    rule = OneFactor_rule('score', b_score=1, s_score=-1)
+    expected = rule.run(feature_df.copy())
+
+    first = cache.run(rule, feature_df.copy())
+    second = cache.run(OneFactor_rule('score', b_score=1, s_score=-1), feature_df.copy())
+    assert (cache.hits, cache.misses) == (1, 1)
+    pd.testing.assert_frame_equal(first, expected)
+    pd.testing.assert_frame_equal(second, expected)
+
+
+def test_parameter_or_data_change_misses(tmp_path, feature_df):
+    cache = SignalCache(str(tmp_path))
+    cache.run(OneFactor_rule('score', b_score=1, s_score=-1), feature_df.copy())
+
+    changed = feature_df.copy()
+    changed.loc[5, 'score'] += 1e-9
+    cache.run(OneFactor_rule('score', b_score=1.5, s_score=-1), feature_df.copy())
+    cache.run(OneFactor_rule('score', b_score=1, s_score=-1), changed)
+    cache.run(OneFactor_rule('score', b_score=1, s_score=-1), feature_df.iloc[::-1].copy())
+    assert (cache.hits, cache.misses) == (0, 4)
+
+    # columns the rule does not read do not count when columns is given
+    columns = ['ID', 'date', 'score']
+    cache.run(OneFactor_rule('score', b_score=1, s_score=-1), feature_df.copy(), columns=columns)
+    cache.run(OneFactor_rule('score', b_score=1, s_score=-1), feature_df.assign(px_last=0), columns=columns)
+    assert (cache.hits, cache.misses) == (1, 5)
+
+
+def test_frame_parameter_keyed_by_values(tmp_path, feature_df):
+    cache = SignalCache(str(tmp_path))
+    # over 60 rows the repr is truncated, the same for both weights
+    names = list(feature_df['ID'].unique()) + ['X{:02d}'.format(i) for i in range(60)]
+    weights = pd.DataFrame({'weight': np.ones(len(names))}, index=names)
+    changed = weights.copy()
+    changed.iloc[10, 0] = -1
+
+    expected = WeightedRule(changed).run(feature_df.copy())
+    cache.run(WeightedRule(weights), feature_df.copy())
+    result = cache.run(WeightedRule(changed), feature_df.copy())
+    again = cache.run(WeightedRule(changed.copy()), feature_df.copy())
+    assert (cache.hits, cache.misses) == (1, 2)
+    pd.testing.assert_frame_equal(result, expected)
+    pd.testing.assert_frame_equal(again, expected)
+
+
+def test_unstable_repr_refused(tmp_path, feature_df):
+    cache = SignalCache(str(tmp_path))
+    rule = OneFactor_rule('score')
+    rule.transform = lambda x: x
+    with pytest.raises(TypeError, match='no stable repr'):
+        cache.run(rule, feature_df.copy())
+    assert cache.misses == 0
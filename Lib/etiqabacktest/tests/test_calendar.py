@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+from etiqabacktest.core.Benchmark import make_data
+from etiqabacktest.StyleBacktest import StyleBackTest, StyleBackTestCalendar
+
+
+def run(bt):
+    bt.mute()
+    bt.backtest()
+    return bt
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('cash_reserve_ratio', [0, 0.05])
+@pytest.mark.parametrize('monthly', [False, True])
+def test_calendar_same_as_daily_loop(seed, cash_reserve_ratio, monthly):
+    action_df, stock_index_df, trading_dates = make_data(40, 120, holding_days=30, missing=0.01, seed=seed)
+    rebalance_dates = pd.bdate_range(trading_dates[0], trading_dates[-1], freq='BMS') if monthly else None
+    daily_df = action_df if rebalance_dates is None else \
+        StyleBackTestCalendar.sample_actions(action_df, rebalance_dates)
+
+    expected = run(StyleBackTest(daily_df, stock_index_df, trading_dates, cash_reserve_ratio=cash_reserve_ratio))
+    bt = StyleBackTestCalendar(action_df, stock_index_df, trading_dates, rebalance_dates=rebalance_dates,
+                               cash_reserve_ratio=cash_reserve_ratio)
+    days = []
+    run_day = bt.run_day
+    bt.run_day = lambda k, date: days.append(k) or run_day(k, date)
+    run(bt)
+
+    pd.testing.assert_frame_equal(bt.get_summary(), expected.get_summary(), check_exact=False, rtol=1e-12)
+    pd.testing.assert_frame_equal(bt.get_trades(), expected.get_trades(), check_exact=False, rtol=1e-12)
+    for date in expected.data:
+        pd.testing.assert_frame_equal(bt.data[date]['portfolio'], expected.data[date]['portfolio'],
+                                      check_exact=False, rtol=1e-12)
+    if monthly and cash_reserve_ratio:
+        # quiet days between the rebalance dates are fast-forwarded
+        assert len(days) < len(trading_dates) / 2
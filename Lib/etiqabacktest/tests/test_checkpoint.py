@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+from etiqabacktest.core.Benchmark import make_data, ResetBackTest
+from etiqabacktest.BasicBacktest import BasicBackTest, BasicBackTestArray
+from etiqabacktest.StyleBacktest import StyleBackTest, StyleBackTestNoPrint, StyleBackTestLeftover
+
+
+@pytest.fixture(scope='module')
+def data():
+    # over a new year for the yearly reset
+    return make_data(40, 90, missing=0.02, seed=5, start='2020-11-02')
+
+
+def run(bt):
+    bt.mute()
+    bt.backtest()
+    return bt
+
+
+@pytest.mark.parametrize('cls, timestamps', [(BasicBackTest, False), (StyleBackTest, False),
+                                             (BasicBackTestArray, False), (ResetBackTest, False),
+                                             (StyleBackTestNoPrint, True), (StyleBackTestLeftover, True)])
+@pytest.mark.parametrize('cut', [30, 85])
+def test_resume_same_as_full_run(data, tmp_path, cls, timestamps, cut):
+    action_df, stock_index_df, trading_dates = data
+    if timestamps:
+        trading_dates = [pd.Timestamp(d) for d in trading_dates]
+    full = run(cls(action_df, stock_index_df, trading_dates))
+
+    # a run up to the cut, then the later rows and dates only
+    last = pd.Timestamp(trading_dates[cut-1])
+    bt = cls(action_df[action_df['date'] <= last], stock_index_df, trading_dates[:cut])
+    bt.checkpoint_path = str(tmp_path / 'bt.ckpt')
+    run(bt)
+    resumed = run(cls.resume(bt.checkpoint_path, action_df[action_df['date'] > last],
+                             stock_index_df, trading_dates[cut:]))
+
+    pd.testing.assert_frame_equal(resumed.get_summary(), full.get_summary())
+    pd.testing.assert_frame_equal(resumed.get_trades(), full.get_trades())
@@ -0,0 +1,86 @@
+import threading
+import pandas as pd
+from etiqabacktest.core.Data import ChunkedDownloader
+
+
+class FakeSource:
+    '''
+    In-process stand-in for bql: business day prices published up to self.published
+    '''
+    def __init__(self, published):
+        self.published = pd.Timestamp(published)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, ids, start, end):
+        with self.lock:
+            self.calls.append((tuple(ids), start, end))
+        dates = pd.bdate_range(start, min(pd.Timestamp(end), self.published))
+        return pd.DataFrame([(i, d, float(d.day), 100.0) for i in ids for d in dates],
+                            columns=['ID', 'DATE', 'px_last', 'volume'])
+
+
+def get_expected(ids, start, end):
+    return FakeSource(end)(ids, start, end).sort_values(['ID', 'DATE']).reset_index(drop=True)
+
+
+def test_cached_range_not_fetched_again(tmp_path):
+    source = FakeSource('2021-12-31')
+    dl = ChunkedDownloader(source, ['px_last', 'volume'], str(tmp_path), batch_size=2, as_of='2022-01-10')
+    ids = ['A', 'B', 'C']
+    first = dl.download(ids, '2021-03-01', '2021-06-30')
+    pd.testing.assert_frame_equal(first, get_expected(ids, '2021-03-01', '2021-06-30'), check_dtype=False)
+
+    source.calls.clear()
+    again = dl.download(ids, '2021-03-01', '2021-06-30')
+    assert source.calls == []
+    pd.testing.assert_frame_equal(again, first)
+
+
+def test_tail_without_data_fetched_again(tmp_path):
+    # data published up to 2021-06-15, the request runs to the end of June
+    source = FakeSource('2021-06-15')
+    ids = ['A', 'B']
+    dl = ChunkedDownloader(source, ['px_last', 'volume'], str(tmp_path), as_of='2021-06-16')
+    dl.download(ids, '2021-06-01', '2021-06-30')
+
+    # later: the rest of June is published, the range is extended
+    source.published = pd.Timestamp('2021-07-15')
+    source.calls.clear()
+    dl = ChunkedDownloader(source, ['px_last', 'volume'], str(tmp_path), as_of='2021-07-16')
+    df = dl.download(ids, '2021-06-01', '2021-07-15')
+
+    assert source.calls == [(('A', 'B'), '2021-06-16', '2021-07-15')]
+    pd.testing.assert_frame_equal(df, get_expected(ids, '2021-06-01', '2021-07-15'), check_dtype=False)
+
+
+def test_future_days_not_recorded(tmp_path):
+    source = FakeSource('2021-06-30')
+    dl = ChunkedDownloader(source, ['px_last'], str(tmp_path), as_of='2021-06-10')
+    dl.download(['A'], '2021-06-01', '2021-06-30')
+    ranges = pd.read_parquet(dl.get_file('px_last', 2021, '.ranges'))
+    assert ranges['end'].max() == pd.Timestamp('2021-06-09')
+
+
+class FakeDividends(FakeSource):
+    '''
+    Sparse field: a dividend on a few days of A only, B never pays
+    '''
+    paid = pd.to_datetime(['2018-05-15', '2019-08-20', '2020-06-01'])
+
+    def __call__(self, ids, start, end):
+        df = super().__call__(ids, start, end)
+        df = df[(df['ID'] == 'A') & df['DATE'].isin(self.paid)]
+        return df.rename(columns={'px_last': 'cash_divs'})[['ID', 'DATE', 'cash_divs']]
+
+
+def test_sparse_field_not_fetched_again(tmp_path):
+    source = FakeDividends('2021-12-31')
+    dl = ChunkedDownloader(source, ['cash_divs'], str(tmp_path), as_of='2022-01-10')
+    first = dl.download(['A', 'B'], '2018-01-01', '2021-12-31')
+    assert first['DATE'].tolist() == list(FakeDividends.paid)
+
+    source.calls.clear()
+    again = dl.download(['A', 'B'], '2018-01-01', '2021-12-31')
+    assert source.calls == []
+    pd.testing.assert_frame_equal(again, first)
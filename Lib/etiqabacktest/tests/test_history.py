@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+from etiqabacktest.core.Benchmark import make_data
+from etiqabacktest.core.History import BacktestHistory
+from etiqabacktest.StyleBacktest import StyleBackTest
+
+
+@pytest.fixture(scope='module')
+def backtest():
+    bt = StyleBackTest(*make_data(30, 40, missing=0.02, seed=8))
+    bt.mute()
+    bt.backtest()
+    return bt
+
+
+def test_portfolio_columns_as_pdf(backtest):
+    # the columns of _create_empty_pdf, whatever order the day's lookups left the pdf in
+    columns = backtest._create_empty_pdf().columns.tolist()
+    portfolio = backtest.data[backtest.last_date]['portfolio']
+    assert portfolio.columns.tolist() == columns == ['unit', 'date', 'px_last', 'value']
+    pd.testing.assert_frame_equal(portfolio, backtest.pdf[columns], check_dtype=False)
+
+
+@pytest.mark.parametrize('fmt', [None, 'npy', 'parquet'])
+def test_portfolio_read_back(tmp_path, fmt):
+    pdfs = {'2021-01-04': pd.DataFrame({'unit': [100.0, 200.0], 'date': pd.to_datetime(['2021-01-04']*2),
+                                        'px_last': [1.5, 2.25], 'value': [150.0, 450.0]},
+                                       index=pd.Index(['A', 'B'], dtype=object)),
+            '2021-01-05': pd.DataFrame({'unit': [300.0], 'date': pd.to_datetime(['2021-01-05']),
+                                        'px_last': [0.5], 'value': [150.0]},
+                                       index=pd.Index(['C'], dtype=object))}
+    history = BacktestHistory()
+    for date, pdf in pdfs.items():
+        history.append(date, pdf, 1000.0, 1000.0 + pdf['value'].sum(), 0.0)
+    if fmt is not None:
+        history.spill(str(tmp_path), fmt)
+
+    for date, pdf in pdfs.items():
+        pd.testing.assert_frame_equal(history[date]['portfolio'], pdf)
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+from etiqabacktest.core.Data import MembershipIndex
+
+
+@pytest.fixture(scope='module')
+def univ_df():
+    rng = np.random.default_rng(0)
+    pool = np.array(['S%03d' % i for i in range(40)], dtype=object)
+    snapshots = pd.date_range('2019-01-01', periods=8, freq='QS')
+    return pd.concat([pd.DataFrame({'ID': rng.choice(pool, 25, replace=False), 'DATE': d}) for d in snapshots],
+                     ignore_index=True)
+
+
+def expected_members(univ_df, date):
+    # members of the last snapshot on or before date
+    before = univ_df[univ_df['DATE'] <= pd.Timestamp(date)]
+    if before.empty:
+        return []
+    return sorted(before.loc[before['DATE'] == before['DATE'].max(), 'ID'])
+
+
+def test_members_on_a_date(univ_df):
+    members = MembershipIndex(univ_df)
+    for date in ['2018-12-31', '2019-01-01', '2019-05-17', '2020-09-30', '2021-03-01']:
+        result = members.members(date)
+        assert isinstance(result, pd.Index)
+        assert result.tolist() == expected_members(univ_df, date)
+
+
+def test_members_of_many_dates(univ_df):
+    members = MembershipIndex(univ_df)
+    dates = pd.to_datetime(['2020-09-30', '2018-06-01', '2019-01-01', '2020-09-30'])
+    result = members.members(dates)
+    assert result.columns.tolist() == ['DATE', 'ID']
+    assert result['DATE'].drop_duplicates().tolist() == [dates[0], dates[2]]
+    for date in dates:
+        assert result.loc[result['DATE'] == date, 'ID'].tolist() == \
+            expected_members(univ_df, date) * int((dates == date).sum())
+
+    # same answer as is_member on the panel
+    panel = members.to_panel(dates)
+    panel = panel[panel['index'] == 'In']
+    pd.testing.assert_frame_equal(result.drop_duplicates().sort_values(['ID', 'DATE']).reset_index(drop=True),
+                                  panel[['DATE', 'ID']].sort_values(['ID', 'DATE']).reset_index(drop=True))
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+from etiqabacktest.core.Benchmark import make_data
+from etiqabacktest.core.Feature import ApplyRule
+from etiqabacktest.core.Multi import MultiBackTest
+from etiqabacktest.BasicBacktest import BasicBackTest
+from etiqabacktest.StyleBacktest import StyleBackTest
+
+
+@pytest.fixture(scope='module')
+def data():
+    return make_data(40, 80, missing=0.02, seed=4)
+
+
+def lagged(action_df, days):
+    '''
+    Another strategy on the same rows: the signal of every id days later
+    '''
+    df = action_df.sort_values(['id', 'date'], kind='mergesort')
+    signal = df.groupby('id')['signal'].shift(days).fillna(-1)
+    diff = signal.groupby(df['id']).diff().fillna(2)
+    code = ApplyRule.get_action_code(signal, diff)
+    return df.assign(signal=signal, action=np.array(ApplyRule.actions, dtype=object)[code]).sort_index()
+
+
+def run(cls, action_df, stock_index_df, trading_dates):
+    bt = cls(action_df, stock_index_df, trading_dates)
+    bt.mute()
+    bt.backtest()
+    return bt
+
+
+@pytest.mark.parametrize('cls', [BasicBackTest, StyleBackTest])
+def test_frames_without_na_rows_aligned(data, cls):
+    action_df, stock_index_df, trading_dates = data
+    later = lagged(action_df, 3)
+    # as StyleRule keep_na=False: no rows without position or call, the rows
+    # out of both strategies are not in either frame
+    frames = {'daily': action_df[action_df['action'] != 'na'],
+              'later': later[later['action'] != 'na'].reset_index(drop=True)}
+    mbt = MultiBackTest(cls, frames, stock_index_df, trading_dates)
+    mbt.backtest()
+
+    for name, full in [('daily', action_df), ('later', later)]:
+        bt = run(cls, full, stock_index_df, trading_dates)
+        # na rows come last within a day, so sums may round differently
+        pd.testing.assert_frame_equal(mbt[name].get_summary(), bt.get_summary(), check_exact=False, rtol=1e-12)
+        pd.testing.assert_frame_equal(mbt[name].get_trades(), bt.get_trades(), check_exact=False, rtol=1e-12)
+
+
+def test_different_prices_named(data):
+    action_df, stock_index_df, trading_dates = data
+    frames = {'a': action_df, 'b': action_df.assign(px_last=action_df['px_last']*1.01)}
+    with pytest.raises(ValueError, match='^b: action_df rows or prices differ'):
+        MultiBackTest(StyleBackTest, frames, stock_index_df, trading_dates)
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+from etiqabacktest.core.Benchmark import make_data
+from etiqabacktest.core.Optimise import Optimiser, pareto_front
+from etiqabacktest.LRRule import OneFactor_rule
+
+nan = np.nan
+
+
+class CountingOptimiser(Optimiser):
+    '''
+    Optimiser keeping the candidates of every evaluate call
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = []
+
+    def evaluate(self, candidates, full=False, generation=0):
+        self.calls.append((full, list(candidates)))
+        return super().evaluate(candidates, full, generation)
+
+
+@pytest.fixture(scope='module')
+def inputs():
+    action_df, stock_index_df, trading_dates = make_data(30, 60, seed=6)
+    feature_df = action_df[['id', 'date', 'px_last', 'volume', 'avg_5_value']].rename(columns={'id': 'ID'})
+    feature_df['score'] = feature_df.groupby('ID')['px_last'].pct_change(5).fillna(0)*100
+    return feature_df, stock_index_df, trading_dates
+
+
+def test_grid_screens_every_candidate_once(inputs):
+    opt = CountingOptimiser(OneFactor_rule, *inputs, fixed=dict(factor_col='score'), max_workers=1)
+    space = dict(b_score=[0, 2, 4], s_score=[-2, 0])
+    front = opt.run(space, method='grid', top=3)
+    opt.grid(space)
+    opt.screen([dict(b_score=2, s_score=0), dict(b_score=1, s_score=0), dict(b_score=1, s_score=0)])
+
+    screens = [c for full, c in opt.calls if not full]
+    keys = [opt.get_key(p) for c in screens for p in c]
+    assert len(keys) == len(set(keys)) == 7
+    assert len(opt.screened) == 6 and opt.screened['error'].isna().all()
+
+    # the shortlist on the full engine, its front a subset of it
+    confirmed = [c for full, c in opt.calls if full]
+    assert len(confirmed) == 1 and len(confirmed[0]) == 3 == len(opt.confirmed)
+    assert set(front.index) <= set(opt.confirmed.index)
+
+
+def test_confirm_top_by_objective_without_errors(inputs):
+    opt = CountingOptimiser(OneFactor_rule, *inputs, fixed=dict(factor_col='score'), max_workers=1)
+    opt.space = dict(b_score=[0, 1, 2, 3, 4, 5], s_score=[0])
+    screened = pd.DataFrame({'b_score': [0, 1, 2, 3, 4, 5],
+                             's_score': [0]*6,
+                             'annualized_ret': [5.0, 9.0, nan, 12.0, 7.0, 9.0],
+                             'generation': [0, 0, 1, 1, 2, 2],
+                             'error': [None, None, None, 'Traceback ...', None, None]})
+    confirmed = opt.confirm(screened, top=3)
+
+    # 3 (errored) is skipped, NaN ranks last, ties keep the screen order
+    assert opt.calls == [(True, [dict(b_score=1, s_score=0), dict(b_score=5, s_score=0),
+                                 dict(b_score=4, s_score=0)])]
+    assert confirmed['b_score'].tolist() == [1, 5, 4]
+    assert confirmed['generation'].tolist() == [0, 2, 2]
+    assert confirmed['error'].isna().all()
+
+
+def test_pareto_front_ties_and_nan():
+    df = pd.DataFrame({'annualized_ret': [10, 10, 8, 8, 12, nan, 12, 8, 7],
+                       'max_drawdown':   [-5, -5, -3, -6, nan, -1, -8, -3, -3]},
+                      index=list('abcdefghi'))
+    front = pareto_front(df)
+    # ties (a, b) and (c, h) are all kept, d is beaten by a, i by c, e and f have NaN
+    assert sorted(front.index) == ['a', 'b', 'c', 'g', 'h']
+    assert front['annualized_ret'].is_monotonic_decreasing
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+from etiqabacktest.core import Preprocess
+
+
+### Row-wise implementation the vectorized Preprocess replaced, single ID frames ###
+
+def baseline_price_dvd_adjusted(df_calls):
+    df_calls['period'] = (df_calls['action'].map(lambda x: 1 if x == "buy" else 0) + \
+                          df_calls['action'].map(lambda x: 1 if x == "sell" else 0).shift().fillna(0)).cumsum()
+    fill0 = df_calls['action']!= 'na'
+    df_calls.loc[fill0, 'cash_divs'] = df_calls.loc[fill0, 'cash_divs'].fillna(0)
+    df_calls['px_adjusted'] = df_calls.groupby('period')['cash_divs'].cumsum() + df_calls['px_last']
+    cash_divs_by_period = df_calls.groupby('period').agg({'DATE':'last', 'cash_divs':'sum'}).reset_index()\
+                                  .rename(columns={'cash_divs':'tot_cash_divs_by_period'})
+    return df_calls.merge(cash_divs_by_period, on=['period','DATE'], how='left')
+
+
+def baseline_calculate_twrr(df_calls_return, ret_col = 'return'):
+    df_calls_return['return+1'] = df_calls_return.apply(lambda x: x[ret_col]+1 if x['action'] not in ['buy','na'] else 1 , 1)
+    df_calls_return['twrr'] = df_calls_return.groupby('ID')['return+1'].cumprod()
+    return df_calls_return
+
+
+@pytest.fixture
+def df_calls():
+    '''
+    A: dividends in the first holding, a gap out of position (with a dividend) before the second
+    B: a buy on the day after the sell
+    '''
+    nan = np.nan
+    a = pd.DataFrame({'action': ['na', 'buy', 'hold', 'hold', 'sell', 'na', 'na', 'buy', 'hold', 'hold'],
+                      'cash_divs': [nan, nan, 0.5, nan, 0.25, 0.3, nan, nan, 0.2, nan]})
+    b = pd.DataFrame({'action': ['buy', 'hold', 'sell', 'buy', 'hold', 'sell'],
+                      'cash_divs': [nan, 0.1, nan, nan, 0.4, nan]})
+    df = pd.concat([a.assign(ID='A', DATE=pd.bdate_range('2021-01-04', periods=len(a))),
+                    b.assign(ID='B', DATE=pd.bdate_range('2021-01-04', periods=len(b)))], ignore_index=True)
+    rng = np.random.default_rng(0)
+    df['px_last'] = rng.uniform(1, 5, len(df))
+    df['return'] = rng.normal(0, 0.02, len(df))
+    return df[['ID', 'DATE', 'action', 'px_last', 'cash_divs', 'return']]
+
+
+def test_label_periods(df_calls):
+    period, order = Preprocess.label_periods(df_calls)
+    np.testing.assert_array_equal(period, [0, 1, 1, 1, 1, 2, 2, 3, 3, 3, 5, 5, 5, 7, 7, 7])
+    np.testing.assert_array_equal(order, np.arange(len(df_calls)))
+
+
+@pytest.mark.parametrize('ID', ['A', 'B'])
+def test_price_dvd_adjusted_same_as_baseline(df_calls, ID):
+    df = df_calls[df_calls['ID'] == ID].reset_index(drop=True)
+    expected = baseline_price_dvd_adjusted(df.copy())
+    result = Preprocess.price_dvd_adjusted(df.copy())
+    np.testing.assert_array_equal(result['period'], expected['period'])
+    for col in ['cash_divs', 'px_adjusted', 'tot_cash_divs_by_period']:
+        pd.testing.assert_series_equal(result[col], expected[col], check_exact=False, rtol=1e-12)
+
+
+def test_price_dvd_adjusted_per_ID(df_calls):
+    # every ID of a multi ID frame as the baseline on that ID alone
+    result = Preprocess.price_dvd_adjusted(df_calls.copy())
+    for ID, df in df_calls.groupby('ID'):
+        expected = baseline_price_dvd_adjusted(df.reset_index(drop=True))
+        got = result[result['ID'] == ID].reset_index(drop=True)
+        for col in ['px_adjusted', 'tot_cash_divs_by_period']:
+            pd.testing.assert_series_equal(got[col], expected[col], check_exact=False, rtol=1e-12)
+
+
+def test_calculate_twrr_same_as_baseline(df_calls):
+    expected = baseline_calculate_twrr(df_calls.copy())
+    result = Preprocess.calculate_twrr(df_calls.copy())
+    pd.testing.assert_series_equal(result['return+1'], expected['return+1'])
+    pd.testing.assert_series_equal(result['twrr'], expected['twrr'])
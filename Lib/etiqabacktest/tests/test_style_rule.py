@@ -0,0 +1,25 @@
+import pandas as pd
+import pytest
+from etiqabacktest.StyleRule import StylePanel, MultiStyleRule
+
+
+@pytest.fixture
+def style_df():
+    months = ['2021-01', '2021-02', '2021-03']
+    return pd.DataFrame({'ID': ['A']*3 + ['B']*3,
+                         'year_month': months*2,
+                         'style_count': [3, 3, 1, 0, 4, 4]})
+
+
+def test_panel_one_row_per_cell(style_df):
+    panel = StylePanel(style_df)
+    assert panel.row.tolist() == [[0, 1, 2], [3, 4, 5]]
+
+    df = MultiStyleRule(no_of_styles=3).run(style_df)
+    assert df['action'].astype(str).tolist() == ['buy', 'hold', 'sell', 'na', 'buy', 'hold']
+
+
+def test_panel_rejects_duplicated_rows(style_df):
+    df = pd.concat([style_df, style_df.iloc[[4]]], ignore_index=True)
+    with pytest.raises(ValueError, match=r"1 duplicated \(ID, year_month\) rows.*'B'"):
+        StylePanel(df)
@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+from etiqabacktest.core.Benchmark import make_data, ResetBackTest
+from etiqabacktest.core.Sweep import run_sweep, run_threads, param_grid
+from etiqabacktest.BasicBacktest import BasicBackTestNoPrint
+from etiqabacktest.StyleBacktest import StyleBackTestLeftover
+
+
+class BrokenBackTest(BasicBackTestNoPrint):
+    def begin(self):
+        raise ValueError('broken run')
+
+
+@pytest.fixture(scope='module')
+def data():
+    return make_data(30, 60, seed=2)
+
+
+def test_thread_sweep_same_as_serial(data):
+    # stock_cap_ratio is a constructor argument, trade_min_limit is not a setting: that run fails
+    params = param_grid(cash_reserve_ratio=[0, 0.05], stock_cap_ratio=[0.1, 0.2])
+    params.insert(2, dict(cash_reserve_ratio=0, stock_cap_ratio=0.1, trade_min_limit=5000))
+
+    serial = run_sweep(BasicBackTestNoPrint, *data, params, max_workers=1)
+    threaded = run_sweep(BasicBackTestNoPrint, *data, params, max_workers=3, executor='thread')
+
+    pd.testing.assert_frame_equal(serial.drop(columns='run_time'), threaded.drop(columns='run_time'))
+    assert serial['error'].notna().tolist() == [False, False, True, False, False]
+    assert 'has no setting trade_min_limit' in serial.loc[2, 'error']
+
+
+def test_run_threads_same_as_serial(data):
+    action_df, stock_index_df, trading_dates = data
+    timestamps = [pd.Timestamp(d) for d in trading_dates]
+    runs = [(BasicBackTestNoPrint, trading_dates, dict(cash_reserve_ratio=0)),
+            (BasicBackTestNoPrint, trading_dates, dict(cash_reserve_ratio=0.1, stock_cap_ratio=0.2)),
+            (StyleBackTestLeftover, timestamps, dict(cash_reserve_ratio=0.05)),
+            (StyleBackTestLeftover, timestamps, dict(stock_cap_ratio=0.05, transaction_charge_pct=0.001)),
+            (ResetBackTest, trading_dates, dict(cash_reserve_ratio=0.02, initial_capital=10**6))]
+    build = lambda: [cls(action_df, stock_index_df, dates, **kwargs) for cls, dates, kwargs in runs]
+    serial = build()
+    for bt in serial:
+        bt.mute()
+        bt.backtest()
+    threaded = run_threads(build(), max_workers=3)
+
+    for a, b in zip(serial, threaded):
+        pd.testing.assert_frame_equal(a.get_summary(), b.get_summary())
+        pd.testing.assert_frame_equal(a.get_trades(), b.get_trades())
+    # the settings did change the runs
+    assert len({bt.get_summary()['value'].iloc[-1] for bt in serial}) == len(runs)
+
+
+def test_run_threads_raises_failed_run(data):
+    bts = [BasicBackTestNoPrint(*data), BrokenBackTest(*data), BasicBackTestNoPrint(*data)]
+    with pytest.raises(ValueError, match='broken run'):
+        run_threads(bts, max_workers=3)
+    # the other runs still finish
+    assert len(bts[0].get_summary()) == len(bts[2].get_summary()) == len(data[2])
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+from etiqabacktest.core.Benchmark import make_data
+from etiqabacktest.BasicBacktest import BasicBackTestNoPrint, BasicBackTestArray
+from etiqabacktest.StyleBacktest import StyleBackTest, StyleBackTestNoPrint
+
+
+@pytest.fixture(scope='module')
+def data():
+    return make_data(40, 80, missing=0.02, seed=1)
+
+
+def run(cls, data, timestamps=False):
+    action_df, stock_index_df, trading_dates = data
+    if timestamps:
+        trading_dates = [pd.Timestamp(d) for d in trading_dates]
+    bt = cls(action_df, stock_index_df, trading_dates)
+    bt.mute()
+    bt.backtest()
+    return bt
+
+
+@pytest.mark.parametrize('cls, timestamps', [(BasicBackTestNoPrint, False), (BasicBackTestArray, False),
+                                             (StyleBackTest, False), (StyleBackTestNoPrint, True)])
+def test_ledger_adds_up_to_positions(data, cls, timestamps):
+    bt = run(cls, data, timestamps)
+    trades = bt.get_trades()
+    pdf = bt.pdf.to_frame() if hasattr(bt.pdf, 'to_frame') else bt.pdf
+    held = trades.groupby('ID')['unit'].sum()
+    held = held[held != 0]
+    pd.testing.assert_series_equal(held.sort_index(), pdf['unit'].sort_index(), check_names=False)
+
+
+def test_rebalance_books_sell_and_buy_at_fill_price(data):
+    bt = run(StyleBackTest, data)
+    trades = bt.get_trades().dropna(subset=['px_last'])
+    both = trades.groupby(['date', 'ID'])['unit'].agg(lambda u: (u > 0).any() and (u < 0).any())
+    assert both.any()
+
+    # every fill is at the price of its day
+    action_df = data[0].set_index(['date', 'id'])['px_last']
+    px = action_df.reindex(pd.MultiIndex.from_arrays([pd.to_datetime(trades['date']), trades['ID']]))
+    np.testing.assert_array_equal(trades['px_last'].to_numpy(), px.to_numpy())
+
+
+@pytest.mark.parametrize('cls', [StyleBackTest, BasicBackTestArray])
+def test_charged_cost_is_ledger_fees(data, cls):
+    bt = run(cls, data)
+    trades = bt.get_trades()
+    fees = trades.groupby('date')['trans_cost'].sum()
+    charged = pd.Series({d: bt.get_trans_cost(d) for d in fees.index})
+    np.testing.assert_allclose(charged.to_numpy(), fees.to_numpy(), rtol=1e-12)
+
+    # fees on the net traded value of an ID: a sell and a re-buy share it
+    value = (trades['unit']*trades['px_last']).fillna(0)
+    net = value.groupby([trades['date'], trades['ID']]).sum().abs().groupby(level=0).sum()
+    np.testing.assert_allclose(fees.to_numpy(), net.to_numpy()*bt.trans_p, rtol=1e-9)
+
+    # a position dropped without a price is booked and costs nothing
+    dropped = trades[trades['px_last'].isna()]
+    assert len(dropped) and (dropped['unit'] < 0).all() and (dropped['trans_cost'] == 0).all()
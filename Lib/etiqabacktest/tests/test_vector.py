@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from etiqabacktest.core.Benchmark import make_data
+from etiqabacktest.BasicBacktest import BasicBackTestNoPrint, BasicBackTestVector
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_vector_tracks_basic_backtest(seed):
+    '''
+    BasicBackTestVector is a screen: no cash or rebalance bookkeeping, so it is
+    only held to a bound on the final NAV and on the tracking error of daily returns
+    '''
+    data = make_data(60, 160, seed=seed)
+    bt = BasicBackTestNoPrint(*data)
+    bt.mute()
+    bt.backtest()
+    vector = BasicBackTestVector(*data)
+    vector.backtest()
+
+    full = bt.get_summary()['value'].to_numpy()
+    fast = vector.get_summary()['value'].to_numpy()
+    assert len(full) == len(fast)
+    assert abs(fast[-1] / full[-1] - 1) < 0.05
+
+    full_ret, fast_ret = np.diff(full) / full[:-1], np.diff(fast) / fast[:-1]
+    tracking_error = np.std(full_ret - fast_ret) * np.sqrt(252)
+    assert tracking_error < 0.03
+    assert np.corrcoef(full_ret, fast_ret)[0, 1] > 0.97
@@ -0,0 +1,3 @@
+'''
+numpy / pandas helpers shared by etiqalib and etiqabacktest, depending on neither
+'''
@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+
+id_col = 'ID'
+
+def get_runs(flag, key):
+    '''
+    Run-length encoding of the True rows of flag, rows sorted by group key
+
+    Parameters
+    ----------
+    flag: ndarray
+        bool of every row
+    key: ndarray
+        group code of every row, equal codes are consecutive
+
+    Returns
+    -------
+    first, last: ndarray
+        row of the first and the last row of every run, in row order
+    is_open: ndarray
+        the run is still on at the last row of its group
+    '''
+    n = len(flag)
+    if not n:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0, dtype=bool)
+    new_group = np.r_[True, key[1:] != key[:-1]]
+    last_row = np.r_[new_group[1:], True]
+    begin = flag & (new_group | ~np.r_[False, flag[:-1]])
+    finish = flag & (last_row | ~np.r_[flag[1:], False])
+    last = np.flatnonzero(finish)
+    return np.flatnonzero(begin), last, last_row[last]
+
+def get_spans(df, col, group=None, date_col='DATE', start=None, end=None, open_end='last'):
+    '''
+    (group, start, end) spans of a state, one per run of consecutive rows in the state
+
+    |   ID  | date | bear |      |   ID  | start |  end | open |
+    |-------|------|------|      |-------|-------|------|------|
+    |stock 1|  a   | False|      |stock 1|   b   |   e  | False|
+    |stock 1|  b   | True | ---> |stock 2|   f   |   m  | True |
+    |stock 1| ..   | ...  |
+    |stock 1|  e   | False|
+
+    Parameters
+    ----------
+    df: DataFrame
+        rows sorted by date within group
+    col: str
+        boolean column, in the state where True (bear ...)
+        or state column with start and end values (action buy / sell, state start / end),
+        in the state from a start row until the next end row of the group
+    group: str or list, optional
+        ID column(s), the whole df is one group if None
+    start, end: optional
+        start and end values of a state column
+    open_end: 'last' or None
+        end of a span still on at the last row of its group, the date of that row or NaN
+
+    Returns
+    -------
+    spans: DataFrame
+        group, start (date of the first row in the state), end (date of the row the
+        state ends on), open (still on at the last row), sorted by group and start
+    '''
+    if group is None:
+        key = np.zeros(len(df), dtype=np.int64)
+    else:
+        key = df.groupby(group, sort=True).ngroup().to_numpy()
+    order = np.argsort(key, kind='stable')
+    key = key[order]
+
+    if start is None:
+        flag = df[col].eq(True).to_numpy(dtype=bool, na_value=False)[order]
+    else:
+        # 1 start, 0 end, forward filled within the group
+        mark = np.where(df[col].eq(start).to_numpy(dtype=bool, na_value=False), 1,
+                        np.where(df[col].eq(end).to_numpy(dtype=bool, na_value=False), 0, -1))[order]
+        new_group = np.r_[True, key[1:] != key[:-1]] if len(key) else np.zeros(0, dtype=bool)
+        last = np.maximum.accumulate(np.where((mark >= 0) | new_group, np.arange(len(mark)), 0))
+        flag = mark[last] == 1
+    flag &= key >= 0
+    first, last, is_open = get_runs(flag, key)
+
+    dates = df[date_col].iloc[order]
+    after = np.minimum(last + 1, len(order) - 1)
+    spans = pd.DataFrame({'start': dates.iloc[first].to_numpy(),
+                          'end': dates.iloc[np.where(is_open, last, after)].to_numpy(),
+                          'open': is_open})
+    if open_end is None:
+        spans['end'] = spans['end'].mask(spans['open'])
+    elif open_end != 'last':
+        raise ValueError('open_end must be last or None')
+    if group is not None:
+        groups = df[[group] if isinstance(group, str) else group].iloc[order[first]].reset_index(drop=True)
+        spans = pd.concat([groups, spans], axis=1)
+    return spans
+
+def pivot_start_end(df,
+                    col='state',
+                    date_col='DATE',
+                    start_col = 'start',
+                    end_col = 'end'):
+    '''
+    | date | state |      | start |  end |
+    |------|-------|      |-------|------|
+    |  a   | stay  |      |   b   |   e  |
+    |  b   | start | --->
+    | ..   |  ...  |
+    |  e   | end   |
+
+    end is NaN for a start without end
+    '''
+    spans = get_spans(df, col, None, date_col, start_col, end_col, open_end=None)
+    return spans.rename(columns={'start': start_col, 'end': end_col})[[start_col, end_col]]
+
+def pivot_start_end_by_ID(df,
+                            col='state',
+                            date_col='DATE',
+                            start_col = 'start',
+                            end_col = 'end'):
+    '''
+    |   ID  | date | state |      |   ID  | start |  end |
+    |-------|------|-------|      |-------|-------|------|
+    |stock 1|  a   | stay  |      |stock 1|   b   |   e  |
+    |stock 1|  b   | start | ---> |stock 2|   f   |   m  |
+    |stock 1| ..   |  ...  |
+    |stock 1|  e   | end   |
+
+    end is NaN for a start without end
+    '''
+    spans = get_spans(df, col, id_col, date_col, start_col, end_col, open_end=None)
+    return spans.rename(columns={'start': start_col, 'end': end_col})[[id_col, start_col, end_col]]
@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import pandas as pd
 import numpy as np
@@ -12,14 +13,17 @@ def get_data(bq, security, fields):
     df = bql.combined_df(response)
     return df
 
-def download_incremental(bq, ticker, func, start_date, end_date, steps=5, **kwargs):
+def download_incremental(bq, ticker, func, start_date, end_date, steps=5, max_workers=1, **kwargs):
+    '''
+    func(bq, ticker, start, end, **kwargs) of every chunk of steps years, max_workers chunks at a time
+    '''
     start_year = int(start_date.split('-')[0])
     end_year = int(end_date.split('-')[0])
     
     steps = min(end_year-start_year, steps)
     if start_year != end_year:
         years = list(range(start_year, end_year+1, steps))  
-        df_list = []
+        chunks = []
         for y in range(len(years)-1):
             if years[y+1] != years[-1]:
                 end = '{}-12-31'.format(years[y+1]-1)
@@ -30,9 +34,10 @@ def download_incremental(bq, ticker, func, start_date, end_date, steps=5, **kwar
                 start=start_date
             else:
                 start = '{}-01-01'.format(years[y])
-            df = func(bq, ticker, start, end, **kwargs)
-            df_list.append(df)
+            chunks.append((start, end))
 
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            df_list = list(pool.map(lambda x: func(bq, ticker, x[0], x[1], **kwargs), chunks))
         return pd.concat(df_list)
     else:
         return func(bq, ticker, start_date, end_date, **kwargs)
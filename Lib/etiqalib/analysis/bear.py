@@ -152,7 +152,8 @@ def pipeline_detect_bear(df, percentile=15, pre_win=600):
     dj, dj_bear, dj_bear_refined = pipeline_detect_bear(dj)
     '''
     df = Pipeline(df.sort_values('DATE'), [(bear_market_1, dict(percentile=percentile)), get_start_end]).run()
-    df_bear = Pipeline(df, [pivot_start_end, grouping_short_intervals]).run()
+    # a bear market still on at the last date ends there
+    df_bear = Pipeline(df, [(get_spans, dict(col='bear')), grouping_short_intervals]).run()
     df_bear_refined = Pipeline(df, [(get_agg_datespan_full, dict(df_span=enveloping_period(df_bear, pre_win_length=pre_win), 
                                                                  func=get_max_min_dt_price_1period)),
                                     (grouping_short_intervals, dict(col ='peak_dt',col_shift ='low_dt'))]).run()
@@ -1,59 +1,30 @@
 from matplotlib import pyplot as plt
 import matplotlib.dates as mdates
 from datetime import timedelta
+import numpy as np
 import pandas as pd
+from etiqacommon.interval import get_spans
+from etiqacommon.interval import pivot_start_end, pivot_start_end_by_ID  # re-export, they used to be defined here
 
 def get_start_end(df, col='bear'):
     '''
-    Compare previous *state* with current *state* (Boolean Boolean)
-    (True, True) or (False, False) -> no change in state
-    (False, True) & (True, False) -> start & end of an inversion
-    '''
+    Mark the rows where the boolean col changes from the row before
     
-    df['col_lag'] = df[col].shift()
-    df['state'] = df\
-            .apply(lambda x: 'start' if x[col] == True and x['col_lag'] == False else \
-                         ('end' if x[col] == False and x['col_lag'] == True  else 'stay'), 1) 
-    return df.drop('col_lag',1)
-
-def pivot_start_end(df, 
-                    col='state', 
-                    date_col='DATE',
-                    start_col = 'start',
-                    end_col = 'end'):
-    '''
-    | date | state |      | start |  end |
-    |------|-------|      |-------|------|  
-    |  a   | stay  |      |   b   |   e  |
-    |  b   | start | ---> 
-    | ..   |  ...  |
-    |  e   | end   |
+    | date | bear  | state |
+    |------|-------|-------|
+    |  a   | False | stay  |
+    |  b   | True  | start |  False -> True
+    |  c   | True  | stay  |
+    |  d   | False | end   |  True -> False
     
+    The first row and the rows next to a NaN are stay, see pivot_start_end for the
+    ( start, end ) table and etiqacommon.interval.get_spans for spans straight from col
     '''
-    df = df[(df[col]==end_col) | (df[col] == start_col)][[col,date_col]].copy().reset_index(drop=True)
-    df['index'] = df.index//2
-    df = pd.pivot_table(df, values=date_col,columns=col,index='index', aggfunc='first')[[start_col,end_col]]
+    lag = df[col].shift()
+    df['state'] = np.select([(df[col] == True) & (lag == False), (df[col] == False) & (lag == True)],
+                            ['start', 'end'], 'stay')
     return df
 
-def pivot_start_end_by_ID(df, 
-                            col='state', 
-                            date_col='DATE',
-                            start_col = 'start',
-                            end_col = 'end'):
-    '''
-    |   ID  | date | state |      |   ID  | start |  end |
-    |-------|------|-------|      |-------|-------|------|  
-    |stock 1|  a   | stay  |      |stock 1|   b   |   e  |
-    |stock 1|  b   | start | ---> |stock 2|   f   |   m  |
-    |stock 1| ..   |  ...  |
-    |stock 1|  e   | end   |
-    
-    '''
-    df = df[(df[col]==end_col) | (df[col] == start_col)][[col,'ID',date_col]].copy()
-    df['index'] = df.groupby('ID')[date_col].apply(lambda x: (x.rank()-1)//2)
-    df = pd.pivot_table(df, values= date_col,columns=col,index=['index','ID'], aggfunc='first')[[start_col,end_col]].reset_index()
-    return df.drop('index',1).sort_values('ID')
-
 def grouping_short_intervals(df, 
                              col ='start', 
                              col_shift='end', 
@@ -23,9 +23,19 @@ def get_gradient(df, price_col='px_last'):
     df['price_degree60'] = df[price_col].pct_change(60).map(lambda x: _y_to_degree(x, 60))
     return df
 
+def _group_rolling_mean(df, col, rolling, group='ID'):
+    """
+    df.groupby(group)[col].rolling(rolling).mean() in the row order of df, from the
+    per-ID cumulative sum, no index realignment. col without NaN
+    """
+    g = df.groupby(group, sort=False)
+    csum = g[col].cumsum()
+    prev = csum.groupby(df[group], sort=False).shift(rolling).fillna(0)
+    return np.where(g.cumcount() >= rolling-1, (csum - prev)/rolling, np.nan)
+
 def add_avat(df, volume_col='volume',rolling=20):
     df['volume'] = df['volume'].fillna(0)
-    df['ma_volume_%d'%rolling] = df.groupby(['ID'])['volume'].rolling(rolling).mean().reset_index().set_index('level_1').drop('ID', axis=1)
+    df['ma_volume_%d'%rolling] = _group_rolling_mean(df, 'volume', rolling)
     df['avat'] = df['volume']/df['ma_volume_%d'%rolling]    
     return df
     